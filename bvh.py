@@ -0,0 +1,264 @@
+# Bounding volume hierarchy over the shapes of a level that do not move
+
+# A node with at most this many shapes is always a leaf
+LEAF_SIZE = 2
+
+# The cost of visiting a node, relative to testing one shape
+TRAVERSAL_COST = 1.0
+
+class BVH:
+    ''' A tree of axis-aligned boxes over shapes that never move, such
+        as the surfaces of a level. Each node holds the box around all
+        the shapes below it, so a query only descends into the nodes its
+        volume touches, and costs about the logarithm of the number of
+        shapes instead of one test per shape.
+
+        The tree is built once, top down. Each node is split where the
+        surface area heuristic expects the cheapest queries: along the
+        axis and at the place that minimises the areas of the two
+        halves times the number of shapes in them. Where that is no
+        cheaper than not splitting, a large node is split at the median
+        instead, and shapes whose boxes all have the same centre are
+        kept in one leaf, as no split can tell them apart.
+
+        The shapes must have get_bounds() (see shapes.py), returning the
+        lowest and highest corners of their boxes.
+
+        The queries return the shapes whose own boxes are hit, which is
+        a superset of the shapes that are; the caller tests those.
+    '''
+
+    def __init__(self, shapes):
+        self._shapes = list(shapes)
+        self._boxes = [shape.get_bounds() for shape in self._shapes]
+
+        # The nodes in flat lists, in depth first order: the corners of
+        # their boxes, the index of the second child (the first child is
+        # the next node), or -1 for a leaf, and the shape indices of
+        # the leaves
+        self._lower = []
+        self._upper = []
+        self._second = []
+        self._leaves = []
+        if self._shapes:
+            self._build(range(len(self._shapes)))
+
+    def __len__(self):
+        return len(self._shapes)
+
+    def get_depth(self):
+        ''' Returns the number of nodes on the longest path from the root
+            to a leaf. '''
+        if not self._lower:
+            return 0
+        depth = 0
+        stack = [(0, 1)]
+        while stack:
+            node, level = stack.pop()
+            depth = max(depth, level)
+            if self._second[node] != -1:
+                stack.append((node + 1, level + 1))
+                stack.append((self._second[node], level + 1))
+        return depth
+
+    def _build(self, indices):
+        ''' Adds the nodes over the shapes with the given indices, in
+            depth first order. A stack of the nodes still to add is kept
+            instead of recursing, so that deep trees can be built. '''
+        boxes = self._boxes
+
+        # The shapes of each node to add, and the node whose second
+        # child it is (None for first children, which come right after
+        # their parents)
+        stack = [(indices, None)]
+        while stack:
+            indices, parent = stack.pop()
+            lower, upper = _enclose([boxes[i] for i in indices])
+            node = len(self._lower)
+            self._lower.append(lower)
+            self._upper.append(upper)
+            self._second.append(-1)
+            self._leaves.append(None)
+            if parent is not None:
+                self._second[parent] = node
+
+            split = None
+            if len(indices) > LEAF_SIZE:
+                split = self._best_split(indices, _area(lower, upper))
+            if split is None:
+                self._leaves[node] = sorted(indices)
+                continue
+
+            # The first child is popped, and its subtree added, first
+            first, second = split
+            stack.append((second, node))
+            stack.append((first, None))
+
+    def _best_split(self, indices, area):
+        ''' Returns the two halves of indices that the surface area
+            heuristic prefers, the halves on each side of the median if
+            it finds no split cheaper than none, or None if the shapes
+            are best kept in one leaf. '''
+        boxes = self._boxes
+        count = len(indices)
+        best = None
+        widest = None
+        for k in range(3):
+            # Sorted along the axis by the centres of the boxes
+            ordered = sorted(indices, key = lambda i: boxes[i][0][k] + boxes[i][1][k])
+            spread = (boxes[ordered[-1]][0][k] + boxes[ordered[-1]][1][k]) - \
+                     (boxes[ordered[0]][0][k] + boxes[ordered[0]][1][k])
+            if spread <= 0.0:
+                # All centres are the same along this axis, so every
+                # split costs the same and separates nothing
+                continue
+            if widest is None or spread > widest[0]:
+                widest = (spread, ordered)
+
+            # The areas of the boxes around the first j shapes, and
+            # around the last count - j
+            leftAreas = _sweep_areas([boxes[i] for i in ordered])
+            rightAreas = _sweep_areas([boxes[i] for i in reversed(ordered)])
+            for j in range(1, count):
+                cost = leftAreas[j - 1] * j + rightAreas[count - j - 1] * (count - j)
+                if best is None or cost < best[0]:
+                    best = (cost, ordered, j)
+
+        if best is None:
+            # The boxes all have the same centre
+            return None
+
+        cost, ordered, j = best
+        if area > 0.0:
+            cost = TRAVERSAL_COST + cost / area
+        else:
+            cost = TRAVERSAL_COST + count
+        if cost >= count:
+            if count <= 2 * LEAF_SIZE:
+                return None
+            ordered = widest[1]
+            j = count // 2
+        return ordered[:j], ordered[j:]
+
+    def query_box(self, lower, upper):
+        ''' Returns the shapes whose boxes overlap the box with corners
+            lower and upper, in the order they were given. '''
+        found = []
+        for i in self._candidates(lambda low, up: _boxes_overlap(low, up, lower, upper)):
+            if _boxes_overlap(self._boxes[i][0], self._boxes[i][1], lower, upper):
+                found.append(i)
+        found.sort()
+        return [self._shapes[i] for i in found]
+
+    def query_sphere(self, centre, radius):
+        ''' Returns the shapes whose boxes overlap the sphere, in the
+            order they were given. '''
+        found = []
+        for i in self._candidates(lambda low, up: _sphere_overlaps(low, up, centre, radius)):
+            if _sphere_overlaps(self._boxes[i][0], self._boxes[i][1], centre, radius):
+                found.append(i)
+        found.sort()
+        return [self._shapes[i] for i in found]
+
+    def query_ray(self, origin, direction, maxDistance = float('inf')):
+        ''' Returns the shapes whose boxes the ray from origin along
+            direction enters within maxDistance (measured in lengths of
+            direction), in the order the ray enters them. '''
+        inverse = [1.0 / d if d != 0.0 else float('inf') for d in direction]
+        found = []
+        for i in self._candidates(lambda low, up: _ray_entry(low, up, origin, direction,
+                                                             inverse, maxDistance) is not None):
+            entry = _ray_entry(self._boxes[i][0], self._boxes[i][1], origin,
+                               direction, inverse, maxDistance)
+            if entry is not None:
+                found.append((entry, i))
+        found.sort()
+        return [self._shapes[i] for entry, i in found]
+
+    def _candidates(self, touches):
+        ''' Yields the indices of the shapes in the leaves whose boxes,
+            and those of all nodes above them, touches(lower, upper)
+            accepts. '''
+        if not self._lower:
+            return
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if not touches(self._lower[node], self._upper[node]):
+                continue
+            second = self._second[node]
+            if second == -1:
+                for i in self._leaves[node]:
+                    yield i
+            else:
+                stack.append(second)
+                stack.append(node + 1)
+
+def _enclose(boxes):
+    ''' Returns the corners of the box around the given boxes '''
+    lower = [min(box[0][k] for box in boxes) for k in range(3)]
+    upper = [max(box[1][k] for box in boxes) for k in range(3)]
+    return lower, upper
+
+def _area(lower, upper):
+    dx = upper[0] - lower[0]
+    dy = upper[1] - lower[1]
+    dz = upper[2] - lower[2]
+    return 2.0 * (dx*dy + dy*dz + dz*dx)
+
+def _sweep_areas(boxes):
+    ''' Returns the areas of the boxes around the first 1, 2, ... of the
+        given boxes '''
+    lower = list(boxes[0][0])
+    upper = list(boxes[0][1])
+    areas = []
+    for low, up in boxes:
+        for k in range(3):
+            if low[k] < lower[k]:
+                lower[k] = low[k]
+            if up[k] > upper[k]:
+                upper[k] = up[k]
+        areas.append(_area(lower, upper))
+    return areas
+
+def _boxes_overlap(lower1, upper1, lower2, upper2):
+    for k in range(3):
+        if lower1[k] > upper2[k] or lower2[k] > upper1[k]:
+            return False
+    return True
+
+def _sphere_overlaps(lower, upper, centre, radius):
+    ''' Whether the sphere reaches the box: the squared distance from
+        its centre to the closest point of the box is at most radius
+        squared '''
+    distance = 0.0
+    for k in range(3):
+        if centre[k] < lower[k]:
+            distance += (lower[k] - centre[k])**2
+        elif centre[k] > upper[k]:
+            distance += (centre[k] - upper[k])**2
+    return distance <= radius * radius
+
+def _ray_entry(lower, upper, origin, direction, inverse, maxDistance):
+    ''' Returns where (in lengths of direction) the ray enters the box,
+        0 if it starts inside, or None if it misses the box before
+        maxDistance. This is the slab test: the ray is cut to the part
+        between the two planes of the box along each axis. '''
+    near = 0.0
+    far = maxDistance
+    for k in range(3):
+        if direction[k] == 0.0:
+            if origin[k] < lower[k] or origin[k] > upper[k]:
+                return None
+            continue
+        t1 = (lower[k] - origin[k]) * inverse[k]
+        t2 = (upper[k] - origin[k]) * inverse[k]
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > near:
+            near = t1
+        if t2 < far:
+            far = t2
+        if near > far:
+            return None
+    return near
@@ -1,9 +1,8 @@
 from pygame.locals import *
 from vector import Vector
 ### World physics constants ###
-# TODO: Make SLOW_DOWN relative to frame rate?
-# NOTE: Really great idea!
-# Then movements would become independent of frame rate.
+# NOTE: SLOW_DOWN now applies per fixed physics step (PHYSICS_DT),
+# so movements no longer depend on the frame rate.
 SLOW_DOWN = 1000.0
 GRAVITY = 10.0
 GRAV_ACC = Vector([ 0.0, - GRAVITY / SLOW_DOWN, 0.0])
@@ -39,6 +38,11 @@ DEFAULT_JUMP_KEY = K_SPACE
 
 #### Graphic settings constants ####
 WINDOW_FPS = 60
+# Physics is stepped at a fixed rate, independent of the rendering
+PHYSICS_FPS = 60
+PHYSICS_DT = 1.0 / PHYSICS_FPS
+# Most physics steps taken in one frame before dropping time
+MAX_PHYSICS_STEPS = 5
 WINDOW_WIDTH = 640
 WINDOW_HEIGHT = 480
 HAVE_FULLSCREEN = True
@@ -0,0 +1,218 @@
+# Convex hulls of point sets, and support points found by walking
+# along their edges
+
+import numpy
+
+# Points closer to a face than this, relative to the size of the point
+# set, count as lying in it
+EPSILON = 1e-9
+
+# Hulls with fewer vertices than this are searched point by point;
+# walking the edges only pays off on larger ones
+CLIMB_MIN = 32
+
+class Hull:
+    ''' The convex hull of a set of points, kept as the points that are
+        its vertices and, for each vertex, the vertices it shares an
+        edge with.
+
+        support answers a support query by hill climbing: it starts in
+        a vertex and moves to the neighbour furthest in the direction
+        until no neighbour is further. On a convex hull that vertex is
+        the furthest of all. The vertex a query ended in is kept for
+        each octant of the direction and the next query in the same
+        octant starts there, so following a slowly turning direction
+        (as GJK and the contacts of consecutive steps do) takes a step
+        or two. Each shape should have a hull of its own for that.
+    '''
+
+    def __init__(self, points):
+        ''' Takes the points as an (N, 3) array or a list of three
+            numbers each. They must not all lie in a plane. '''
+        points = numpy.asarray(points, dtype = numpy.float64).reshape(-1, 3)
+        faces = hull_faces(points)
+
+        # The hull is kept in positions of its own, only for its vertices
+        indices = sorted(set(i for face in faces for i in face))
+        position = dict((index, k) for k, index in enumerate(indices))
+        neighbours = [set() for index in indices]
+        for face in faces:
+            a, b, c = [position[i] for i in face]
+            neighbours[a].update((b, c))
+            neighbours[b].update((a, c))
+            neighbours[c].update((a, b))
+
+        self._indices = indices
+        self._points = [tuple(point) for point in points[indices].tolist()]
+        self._neighbours = [tuple(n) for n in neighbours]
+        self._faces = faces
+        self._starts = [0] * 8
+
+    def get_indices(self):
+        ''' Returns the indices of the points that are vertices of the
+            hull, in increasing order '''
+        return self._indices
+
+    def get_faces(self):
+        ''' Returns the triangles of the hull as triples of point indices,
+            counterclockwise seen from the outside '''
+        return self._faces
+
+    def get_neighbours(self, index):
+        ''' Returns the indices of the points that share an edge of the
+            hull with the point at index '''
+        position = self._indices.index(index)
+        return [self._indices[k] for k in self._neighbours[position]]
+
+    def support(self, direction):
+        ''' Returns the index of the point furthest in direction, given
+            as three numbers (the first one found if several are equally
+            far) '''
+        x, y, z = direction
+        points = self._points
+        if len(points) < CLIMB_MIN:
+            best = None
+            for k, (px, py, pz) in enumerate(points):
+                distance = px*x + py*y + pz*z
+                if best is None or distance > best:
+                    best = distance
+                    current = k
+            return self._indices[current]
+
+        octant = (x > 0) + 2*(y > 0) + 4*(z > 0)
+        current = self._starts[octant]
+        px, py, pz = points[current]
+        best = px*x + py*y + pz*z
+        neighbours = self._neighbours
+        while True:
+            step = current
+            for k in neighbours[current]:
+                px, py, pz = points[k]
+                distance = px*x + py*y + pz*z
+                if distance > best:
+                    best = distance
+                    step = k
+            if step == current:
+                break
+            current = step
+
+        self._starts[octant] = current
+        return self._indices[current]
+
+def hull_faces(points):
+    ''' Returns the triangles of the convex hull of the (N, 3) array
+        points, as triples of indices into it, counterclockwise seen from
+        the outside. Only the corners of the hull are used: points inside
+        it, or in its faces or edges, are left out.
+
+        The hull is built by quickhull: starting from a tetrahedron, the
+        point furthest outside one of the faces removes the faces it can
+        see and is joined to the edges around them (the horizon), until
+        no point is left outside. Each point outside the hull is kept
+        with one face it is in front of, and only the points of removed
+        faces are tested again. '''
+    count = len(points)
+    assert count >= 4, 'A hull needs at least four points'
+    tolerance = EPSILON * max(points.max(axis = 0) - points.min(axis = 0))
+
+    # A tetrahedron of corners far apart: the lowest point (by x, then y,
+    # then z), the point furthest from it, the point furthest from the
+    # line through those and the point furthest from the plane through
+    # all three. Each is picked by _extreme, so that it is a corner.
+    a = numpy.lexsort(points.T[::-1])[0]
+    offsets = points - points[a]
+    distances = numpy.einsum('ij,ij->i', offsets, offsets)
+    b = _extreme(distances, distances, tolerance * tolerance)
+    ab = points[b] - points[a]
+    across = numpy.cross(offsets, ab)
+    c = _extreme(numpy.einsum('ij,ij->i', across, across), distances,
+                 tolerance * tolerance * numpy.dot(ab, ab))
+    normal = numpy.cross(ab, points[c] - points[a])
+    length = numpy.sqrt(numpy.dot(normal, normal))
+    heights = numpy.abs(numpy.dot(offsets, normal))
+    d = _extreme(heights, distances, tolerance * length)
+    assert heights[d] > tolerance * length, \
+           'The points must not all lie in a plane'
+
+    # Faces are kept as (a, b, c) triples, with their unit normals and
+    # distances from the origin in arrays that grow as needed; a face
+    # that is removed is only marked dead
+    faces = []
+    normals = numpy.zeros((16, 3))
+    distances = numpy.zeros(16)
+    alive = numpy.zeros(16, dtype = bool)
+    centre = points[[a, b, c, d]].mean(axis = 0)
+
+    def add_face(i, j, k):
+        n = numpy.cross(points[j] - points[i], points[k] - points[i])
+        length = numpy.sqrt(numpy.dot(n, n))
+        if length > 0.0:
+            n = n / length
+        if numpy.dot(n, centre - points[i]) > 0.0:
+            # Facing inwards, turn it around
+            j, k = k, j
+            n = -n
+        slot = len(faces)
+        if slot == len(alive):
+            normals.resize((2 * slot, 3), refcheck = False)
+            distances.resize(2 * slot, refcheck = False)
+            alive.resize(2 * slot, refcheck = False)
+        faces.append((i, j, k))
+        normals[slot] = n
+        distances[slot] = numpy.dot(n, points[i])
+        alive[slot] = True
+        return slot
+
+    def assign(candidates, slots):
+        ''' Returns the candidates outside any of the faces in slots,
+            and for each the face it is furthest in front of '''
+        slots = numpy.asarray(slots)
+        heights = numpy.dot(points[candidates], normals[slots].T) - distances[slots]
+        best = heights.argmax(axis = 1)
+        outside = heights[numpy.arange(len(candidates)), best] > tolerance
+        return candidates[outside], slots[best[outside]]
+
+    slots = [add_face(i, j, k) for i, j, k in ((a, b, c), (a, b, d), (a, c, d), (b, c, d))]
+    rest = numpy.setdiff1d(numpy.arange(count), [a, b, c, d])
+    outside, owners = assign(rest, slots)
+    fromCentre = points - centre
+    fromCentre = numpy.einsum('ij,ij->i', fromCentre, fromCentre)
+
+    while len(outside):
+        # The point furthest in front of a face is a corner of the hull;
+        # of several about as far, the one furthest from the centre is
+        f = owners[0]
+        p = outside[_extreme(numpy.dot(points[outside], normals[f]),
+                             fromCentre[outside], tolerance)]
+
+        live = numpy.flatnonzero(alive[:len(faces)])
+        heights = numpy.dot(normals[live], points[p]) - distances[live]
+        visible = live[heights > tolerance]
+
+        # The edges of the visible faces that no other visible face
+        # shares make up the horizon
+        edges = set()
+        for v in visible:
+            i, j, k = faces[v]
+            edges.update(((i, j), (j, k), (k, i)))
+        alive[visible] = False
+        added = [add_face(i, j, p) for i, j in edges if (j, i) not in edges]
+
+        # The points of the removed faces go to the new ones, or are
+        # now inside
+        others = outside != p
+        orphans = ~alive[owners] & others
+        kept = alive[owners] & others
+        newOutside, newOwners = assign(outside[orphans], added)
+        outside = numpy.concatenate((outside[kept], newOutside))
+        owners = numpy.concatenate((owners[kept], newOwners))
+
+    return [faces[f] for f in numpy.flatnonzero(alive[:len(faces)])]
+
+def _extreme(values, distances, tolerance):
+    ''' Returns the index of the largest of values; of those within
+        tolerance of it, the one with the largest distances. Picking the
+        largest of a convex function, and then of a strictly convex one
+        among ties, gives a corner of the hull of the points. '''
+    ties = numpy.flatnonzero(values >= values.max() - tolerance)
+    return int(ties[distances[ties].argmax()])
@@ -8,6 +8,7 @@ from player import Player
 from control import Camera
 from vector import Vector
 import shapes
+import bvh
 
 def init_window():
     ''' Initiate pygame, initiate OpenGL, create a window, setup OpenGL'''
@@ -144,6 +145,10 @@ def init_main():
     surfaceList.extend([cubefront, cubeback, cubetop, cuberight, cubeleft])
     surfaceList.extend([cube2front, cube2back, cube2top, cube2right, cube2left])
 
+    # The surfaces never move, so they are put in a bounding volume
+    # hierarchy once; each step then only checks the ones near a shape
+    level = bvh.BVH(surfaceList)
+
     for surface in surfaceList:
         print "Center", surface.get_center()
         print "Normal", surface.get_normal().get_value()
@@ -169,4 +174,4 @@ def init_main():
     #cube2.set_zPos(-2)
     #cube3.set_zPos(2)
     
-    return playableShapes, players, cubelist, surfaceList, clock, camera
+    return playableShapes, players, cubelist, surfaceList, level, clock, camera
@@ -2,24 +2,41 @@ import traceback
 import sys
 from init import *
 from control import *
+from timestep import FixedTimestep
 
 def main():
     ''' Main routine of the game.'''
 
     # Initiate OpenGL, the window, the player and all other entities
-    playableShapes, players, cubeList, surfaceList, clock, camera = init_main()
+    playableShapes, players, cubeList, surfaceList, level, clock, camera = init_main()
 
     player = players[0]
+
+    # The shapes move a fixed distance per step, so step them at a
+    # fixed rate no matter how fast the frames are drawn
+    state = {'directions': [0.0, 0.0, 0.0]}
+    def step(dt):
+        for shape in playableShapes:
+            # The pose before the step, to draw the frames until the
+            # next step in between
+            shape.save_pose()
+            # Only the surfaces within reach of the shape can be hit
+            nearSurfaces = level.query_sphere(*shape.get_reach())
+            shape.step(nearSurfaces, cubeList, state['directions'])
+    stepper = FixedTimestep(step, PHYSICS_DT, MAX_PHYSICS_STEPS)
     
     run = True
     while run:
 
         glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
         glLoadIdentity()
-        
-        xPos = player.get_shape().get_xPos()
-        yPos = player.get_shape().get_yPos()
-        zPos = player.get_shape().get_zPos()
+
+        # Step the objects first, so that the camera and the shapes are
+        # drawn at the same point between the last two steps
+        stepper.update(clock.get_time() / 1000.0)
+        alpha = stepper.get_alpha()
+
+        xPos, yPos, zPos = player.get_shape().get_interpolated_center(alpha)
         
         forwardVector = camera.update(xPos, yPos, zPos)
         glLightfv(GL_LIGHT0, GL_POSITION, LIGHT0_POSITION)
@@ -28,11 +45,9 @@ def main():
         #          0.0, 1.5, 0.0,
         #          0.0, 1.0, 0.0)
 
-        run, directions = check_user_action(players, cubeList, forwardVector, surfaceList)
-        # update the object, translate
-        # and then draw it
+        run, state['directions'] = check_user_action(players, cubeList, forwardVector, surfaceList)
         for shape in playableShapes:
-            shape.update(surfaceList, cubeList, directions)
+            shape.draw(alpha)
         #for cube in cubeList:      
         #    cube.update(surfaceList)
         for surface in surfaceList:
@@ -40,6 +40,26 @@ def matrix_mult(a, b):
             out[4*i + k] = a[k]*b[4*i] + a[k+4]*b[4*i+1] + a[k+8]*b[4*i+2] + a[k+12]*b[4*i+3]
     return out
             
+def blend(a, b, alpha):
+    ''' Returns the rotation the fraction alpha of the way from the
+        rotation matrix a to the rotation matrix b, both in OpenGL
+        standard. The entries are interpolated linearly and the axes
+        made orthonormal again, which is close enough for the small
+        rotations of one physics step. '''
+    m = [a[i] + (b[i] - a[i]) * alpha for i in range(16)]
+    x = m[0:3]
+    y = m[4:7]
+
+    length = sqrt(x[0]*x[0] + x[1]*x[1] + x[2]*x[2])
+    x = [x[0] / length, x[1] / length, x[2] / length]
+    along = x[0]*y[0] + x[1]*y[1] + x[2]*y[2]
+    y = [y[0] - x[0]*along, y[1] - x[1]*along, y[2] - x[2]*along]
+    length = sqrt(y[0]*y[0] + y[1]*y[1] + y[2]*y[2])
+    y = [y[0] / length, y[1] / length, y[2] / length]
+    z = [x[1]*y[2] - x[2]*y[1], x[2]*y[0] - x[0]*y[2], x[0]*y[1] - x[1]*y[0]]
+
+    return x + [0.0] + y + [0.0] + z + [0.0] + [0.0, 0.0, 0.0, 1.0]
+
 def identity():
     ''' Returns an identity matrix in OpenGL standard. '''
     return [1.0, 0.0, 0.0, 0.0,
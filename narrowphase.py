@@ -0,0 +1,160 @@
+# Narrow phase collision tests, with closed form tests for the pairs
+# that have one and GJK or MPR for all other convex pairs
+
+from vector import *
+from GJK import GJK, MPR
+import support
+
+EPSILON = 1e-9
+
+# The engines for the pairs without a closed form test
+GJK_ENGINE = 'gjk'      # GJK with EPA, the least penetration
+MPR_ENGINE = 'mpr'      # MPR, fewer support points
+
+def collide(shape1, shape2, cache = None, engine = GJK_ENGINE):
+    ''' Calculates whether shape1 has collided with shape2. The test is
+        chosen from the kinds of the two shapes (their support functions);
+        pairs with a closed form test in PAIRS use it, all other pairs
+        use the engine named in ENGINES for the pair, or else the given
+        engine: GJK_ENGINE (GJK with the optional PairCache cache) or
+        MPR_ENGINE.
+
+        Output:
+            *   The same as for GJK: True if the shapes have collided
+                (False if not, None if it could not be told), and a tuple
+                of the collision point, the penetration normal (pointing
+                from shape1 towards shape2) and the penetration depth.
+    '''
+    test = PAIRS.get((shape1.sup_func, shape2.sup_func))
+    if test is not None:
+        return test(shape1, shape2)
+
+    test = PAIRS.get((shape2.sup_func, shape1.sup_func))
+    if test is not None:
+        collided, (point, normal, depth) = test(shape2, shape1)
+        if collided:
+            normal = -normal
+        return collided, (point, normal, depth)
+
+    engine = ENGINES.get((shape1.sup_func, shape2.sup_func),
+                         ENGINES.get((shape2.sup_func, shape1.sup_func), engine))
+    if engine == MPR_ENGINE:
+        return MPR(shape1, shape2)
+    return GJK(shape1, shape2, cache)
+
+def sphere_sphere(sphere1, sphere2):
+    ''' Collision test of two spheres '''
+    centre1 = sphere1.get_pos()
+    offset = sphere2.get_pos() - centre1
+    reach = sphere1.get_radius() + sphere2.get_radius()
+
+    distance = offset.norm()
+    if distance >= reach:
+        return False, (None, None, None)
+
+    if distance > EPSILON:
+        normal = offset * (1.0 / distance)
+    else:
+        # Same centre, any direction will do
+        normal = Vec3(0.0, 1.0, 0.0)
+    return _contact(centre1, sphere1.get_radius(), normal, reach - distance)
+
+def sphere_quad(sphere, quad):
+    ''' Collision test of a sphere and a flat convex polygon '''
+    centre = sphere.get_pos()
+    radius = sphere.get_radius()
+    points = quad.get_points()
+    corners = [points.get(i) for i in range(len(points))]
+
+    closest, planeNormal = closest_on_polygon(centre, corners)
+    offset = closest - centre
+    distance = offset.norm()
+    if distance >= radius:
+        return False, (None, None, None)
+
+    if distance > EPSILON:
+        normal = offset * (1.0 / distance)
+    else:
+        # The centre is in the polygon, push it out to the side it is
+        # on, whichever way the corners wind (to the front, the side
+        # the winding faces, if it is on neither)
+        if (centre - corners[0]).dot(planeNormal) >= 0:
+            normal = -planeNormal
+        else:
+            normal = planeNormal
+    return _contact(centre, radius, normal, radius - distance)
+
+def sphere_box(sphere, box):
+    ''' Collision test of a sphere and an axis-aligned box '''
+    centre = sphere.get_pos()
+    radius = sphere.get_radius()
+    corners = box.get_points().get_array()
+    low = corners.min(axis = 0).tolist()
+    high = corners.max(axis = 0).tolist()
+
+    c = centre.value
+    closest = Vec3(*[min(max(c[i], low[i]), high[i]) for i in range(3)])
+    offset = closest - centre
+    distance = offset.norm()
+
+    if distance > EPSILON:
+        if distance >= radius:
+            return False, (None, None, None)
+        return _contact(centre, radius, offset * (1.0 / distance),
+                        radius - distance)
+
+    # The centre is inside the box, push it out through the closest face
+    best = None
+    for i in range(3):
+        for faceDistance, sign in ((c[i] - low[i], 1.0), (high[i] - c[i], -1.0)):
+            if best is None or faceDistance < best[0]:
+                best = (faceDistance, i, sign)
+    faceDistance, i, sign = best
+    axis = [0.0, 0.0, 0.0]
+    axis[i] = sign
+    normal = Vec3(*axis)
+    return _contact(centre, radius, normal, radius + faceDistance)
+
+def _contact(centre, radius, normal, depth):
+    ''' Returns the collision information of a sphere with the given
+        centre and radius that penetrates a shape by depth along normal.
+        The collision point is midway between the deepest point of the
+        sphere and the deepest point of the other shape. '''
+    point = centre + normal * (radius - 0.5 * depth)
+    return True, (point, normal, depth)
+
+def closest_on_polygon(point, corners):
+    ''' Returns the point on the flat convex polygon with the given
+        corners (in order) that is closest to point, and the normal of
+        the polygon. '''
+    a = corners[0]
+    planeNormal = (corners[1] - a).cross(corners[2] - a).normalize()
+    projected = point - planeNormal * (point - a).dot(planeNormal)
+
+    # Inside if the projection is on the same side of all edges
+    count = len(corners)
+    sides = [(corners[(i + 1) % count] - corners[i]).cross(projected - corners[i])
+             .dot(planeNormal) for i in range(count)]
+    if min(sides) >= 0 or max(sides) <= 0:
+        return projected, planeNormal
+
+    # Otherwise the closest point is on one of the edges
+    best = None
+    for i in range(count):
+        start = corners[i]
+        edge = corners[(i + 1) % count] - start
+        t = (point - start).dot(edge) / edge.dot(edge)
+        candidate = start + edge * min(max(t, 0.0), 1.0)
+        distance = (candidate - point).dot(candidate - point)
+        if best is None or distance < best[0]:
+            best = (distance, candidate)
+    return best[1], planeNormal
+
+# The closed form tests, keyed on the support functions of the shapes
+PAIRS = {(support.sphere, support.sphere): sphere_sphere,
+         (support.sphere, support.quad): sphere_quad,
+         (support.sphere, support.box): sphere_box}
+
+# Engines to use for particular pairs, keyed on the kinds (support functions) of
+# the shapes, whatever engine collide is asked for
+ENGINES = {}
@@ -1,24 +1,37 @@
+import math
+import numpy
 from vector import *
-from GJK import GJK
+from GJK import PairCache
+import broadphase
+import narrowphase
+import integrator
 
-GRAVITY = Vector([0.0, -10.0, 0.0])
-dt = 0.0015
+GRAVITY = Vec3(0.0, -10.0, 0.0)
+dt = 0.01   # Default timestep, in seconds
 
-def collision_response(shape1, shape2, collisionInfo):
+# Where the last GJK query of each pair ended, to start the next from
+pairCache = PairCache()
+
+# The bounding boxes of the shapes and the pairs of them that overlap;
+# the objects and the scene are passive, as only the player is tested
+# against them
+broadPhase = broadphase.SweepAndPrune()
+
+# Contacts deeper than PENETRATION_SLOP (in m) are pushed apart by
+# CORRECTION of the rest of their depth per step, see separate
+PENETRATION_SLOP = 0.005
+CORRECTION = 0.2
+
+def collision_response(shape1, shape2, collisionInfo, dt = dt):
 
     collisionPoint, penetrationNormal, penetrationDepth = collisionInfo
 
 
-    mass1 = shape1.get_mass()
-    mass2 = shape2.get_mass()
-    if mass1 > 1000:
-        invMass1 = 0
-    else:
-        invMass1 = 1 / mass1
-    if mass2 > 1000:
-        invMass2 = 0
-    else:
-        invMass2 = 1 / mass2
+    invMass1 = shape1.get_inv_mass()
+    invMass2 = shape2.get_inv_mass()
+    if invMass1 + invMass2 == 0.0:
+        # Both objects are immobile
+        return
 
     relativeVel = shape1.get_velocity() - shape2.get_velocity()
 
@@ -32,34 +45,62 @@ def collision_response(shape1, shape2, collisionInfo):
 
     impulse = -(1+e)*v_ab.dot(n)/((invMass1+invMass2)*n.dot(n))
 
-    
+    shape1.add_velocity(n, impulse*invMass1)
+    shape2.add_velocity(n, -impulse*invMass2)
 
-    # Hack to prevent sinking
-    impulse -= penetrationDepth*1.5
+def separate(shape1, shape2, collisionInfo):
+    ''' Pushes two colliding shapes apart along the penetration normal,
+        by CORRECTION of their penetration depth beyond PENETRATION_SLOP,
+        each in proportion to its inverse mass. Only the positions (and
+        points) are moved, not the velocities, so stopping the shapes
+        from sinking into each other adds no energy. '''
+    collisionPoint, penetrationNormal, penetrationDepth = collisionInfo
 
-    shape1.add_velocity(n*impulse*invMass1)
-    shape2.add_velocity(n*impulse*invMass2*(-1.0))
+    invMass1 = shape1.get_inv_mass()
+    invMass2 = shape2.get_inv_mass()
 
+    excess = penetrationDepth - PENETRATION_SLOP
+    if excess <= 0.0 or invMass1 + invMass2 == 0.0:
+        return
 
-def update_physics(game):
-    ''' Updates all physics in the game; takes all the objects in
-        the game, calculates collisions etc and moves them to their
-        new locations.'''
-    # TODO: make it have an input called dt, which gives it the
-    # timestep it should simulate
+    # The normal points from shape1 towards shape2
+    push = penetrationNormal * (CORRECTION * excess / (invMass1 + invMass2))
+    for shape, scale in ((shape1, -invMass1), (shape2, invMass2)):
+        if scale != 0.0:
+            shape.set_pos(shape.get_pos() + push * scale)
+            shape.update_points(push, scale)
 
-    player, objectList, sceneList = game.get_objects()
 
+def moving_indices(game):
+    ''' Returns the store shared by the moving bodies of the game
+        (the player and the objects) and their indices in it. '''
+    player, objectList, sceneList = game.get_objects()
+    store = player.get_store()
+    indices = [player.get_index()]
     for item in objectList:
+        assert item.get_store() is store, 'All shapes must share a store'
+        indices.append(item.get_index())
+    return store, indices
 
-        collided, collisionInfo = GJK(player, item)
+def update_physics(game, dt = dt, scheme = integrator.SEMI_IMPLICIT_EULER,
+                   engine = narrowphase.GJK_ENGINE):
+    ''' Updates all physics in the game; takes all the objects in
+        the game, calculates collisions etc and moves them to their
+        new locations, simulating the timestep dt (in seconds) with
+        the given integration scheme (see integrator.py) and narrow
+        phase engine (see narrowphase.py).
+        Returns the deepest penetration depth found (0 if nothing
+        collided).'''
 
-        if collided:
-            collision_response(player, item, collisionInfo)
+    player, objectList, sceneList = game.get_objects()
+    deepest = 0.0
+    pairCache.new_frame()
 
-    for item in sceneList:
+    # Only the pairs whose boxes overlap go to the narrow phase; the
+    # pairs that stop overlapping age out of the pair cache
+    for shape1, shape2 in broadPhase.update([player], objectList + sceneList, dt):
 
-        collided, collisionInfo = GJK(player, item)
+        collided, collisionInfo = narrowphase.collide(shape1, shape2, pairCache, engine)
 
         if collided:
 ##            point, normal, depth = collisionInfo
@@ -68,15 +109,92 @@ def update_physics(game):
 ##            print '\tCollision normal:', normal.value
 ##            print '\tCollision depth:', depth
 ##            print ''
-            collision_response(player, item, collisionInfo)
-
-
-    # TODO: switch to semi-implicit Euler integration
-
-    player.add_velocity(GRAVITY*dt)
-    player.update_pos(player.get_velocity())
-
-    for item in objectList:
-        item.add_velocity(GRAVITY*dt)
-        item.update_pos(item.get_velocity())
-        item.update_points(item.get_velocity())
+            deepest = max(deepest, collisionInfo[2])
+            collision_response(shape1, shape2, collisionInfo, dt)
+            separate(shape1, shape2, collisionInfo)
+
+
+    # Gravity and movement for all moving bodies at once
+    store, indices = moving_indices(game)
+    before = store.positions[indices]
+    integrator.integrate(store, GRAVITY.value, dt, indices, scheme)
+
+    # The points of the objects follow their positions
+    movements = (store.positions[indices] - before).tolist()
+    for item, movement in zip(objectList, movements[1:]):
+        item.update_points(as_vec3(movement))
+    return deepest
+
+
+class Substepper:
+    ''' Splits a physics step into more substeps when the bodies move
+        fast, and merges them back when they slow down. A resting scene
+        costs a single update_physics call per step.
+
+        Before each step, the number of substeps is chosen from the
+        motion predicted for it: no moving body may move further than
+        maxDisplacement, nor than half the shortest side of its bounding
+        box, per substep, at its current speed plus what gravity adds
+        during the step. Fast bodies are then stopped by the contacts
+        they reach before passing through them. More substeps are taken
+        at once; fewer only after calmSteps calm steps in a row, halving
+        each time. The push out of contacts (see separate) moves
+        positions only, so it adds no more energy in short substeps.
+    '''
+
+    def __init__(self, maxDisplacement = 0.1, maxSubsteps = 8, calmSteps = 10):
+        assert maxDisplacement > 0, 'maxDisplacement must be positive'
+        assert maxSubsteps >= 1, 'At least one substep must be allowed'
+        self._maxDisplacement = maxDisplacement
+        self._maxSubsteps = maxSubsteps
+        self._calmSteps = calmSteps
+        self._substeps = 1
+        self._calm = 0
+
+    def get_substeps(self):
+        ''' Returns the number of substeps of the last step. '''
+        return self._substeps
+
+    def step(self, game, dt = dt, scheme = integrator.SEMI_IMPLICIT_EULER,
+             engine = narrowphase.GJK_ENGINE):
+        ''' Picks the substep count for the motion predicted over dt
+            and advances the game by dt in that many substeps. Returns
+            the number of substeps taken. '''
+        needed = self.predict(game, dt)
+        substeps = self._substeps
+        if needed > substeps:
+            self._substeps = needed
+            self._calm = 0
+        elif needed * 2 <= substeps:
+            self._calm += 1
+            if self._calm >= self._calmSteps:
+                self._substeps = max(substeps // 2, needed)
+                self._calm = 0
+        else:
+            self._calm = 0
+
+        substeps = self._substeps
+        subDt = dt / substeps
+        for i in range(substeps):
+            update_physics(game, subDt, scheme, engine)
+        return substeps
+
+    def predict(self, game, dt):
+        ''' Returns the number of substeps (at most maxSubsteps) that
+            the motion of the moving bodies over dt needs. '''
+        player, objectList, sceneList = game.get_objects()
+        store, indices = moving_indices(game)
+        velocities = store.velocities[indices]
+        speeds = numpy.sqrt(numpy.einsum('ij,ij->i', velocities, velocities))
+        reaches = ((speeds + GRAVITY.norm() * dt) * dt).tolist()
+
+        needed = 1.0
+        for shape, reach in zip([player] + objectList, reaches):
+            lower, upper = shape.get_bounds()
+            limit = self._maxDisplacement
+            shortest = min(high - low for low, high in zip(lower, upper))
+            if shortest > 0.0:
+                # Flat bodies are only held to maxDisplacement
+                limit = min(limit, 0.5 * shortest)
+            needed = max(needed, reach / limit)
+        return min(int(math.ceil(needed)), self._maxSubsteps)
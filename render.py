@@ -7,8 +7,10 @@ import pygame
 from pygame.locals import *
 
 #def render(game, collisionInfo):
-def render(game):
-    ''' Draws the player and all other entities at their current position '''
+def render(game, interpolation = None):
+    ''' Draws the player and all other entities at their current position,
+        or at their interpolated position if interpolation (a
+        FixedTimestep) is given. '''
 
     player, objectList, sceneList = game.get_objects()
 
@@ -29,7 +31,7 @@ def render(game):
 
     glClear(GL_COLOR_BUFFER_BIT|GL_DEPTH_BUFFER_BIT)
 
-    pos = player.get_pos().value
+    pos = get_render_pos(player, interpolation)
 
     glLoadIdentity()
     #gluLookAt(pos[0], pos[1] + 4, pos[2] + 10,     # A point of reference is
@@ -49,7 +51,7 @@ def render(game):
     glPopMatrix()
 
     for item in objectList:
-        pos = item.get_pos().value
+        pos = get_render_pos(item, interpolation)
         glPushMatrix()
         glColor3fv(item.get_color())
         glTranslatef(pos[0], pos[1], pos[2])
@@ -70,3 +72,9 @@ def render(game):
     
     pygame.display.flip()
     pygame.time.wait(10)
+
+def get_render_pos(item, interpolation = None):
+    ''' Returns the position to draw item at, as a list '''
+    if interpolation is None:
+        return item.get_pos().value
+    return interpolation.get_pos(item)
@@ -0,0 +1,109 @@
+# Struct-of-arrays storage for rigid bodies
+
+import numpy
+
+class RigidBodyStore:
+    ''' Keeps the state of many rigid bodies in contiguous NumPy arrays,
+        one row per body. Shapes act as handles into the store (they
+        only remember their store and their row index), which lets
+        gravity, integration and damping run as whole-array operations.
+
+        The arrays are allocated with spare capacity and grow by
+        doubling, so they may be replaced when a body is added; always
+        go through the store's attributes instead of keeping references
+        to them. Only the first get_count() rows are in use.
+
+            * positions, velocities, angularVelocities: (N, 3)
+            * masses, invMasses: (N,)
+            * invInertias: (N, 3, 3)
+            * orientations: (N, 4), quaternions as [w, x, y, z]
+    '''
+
+    def __init__(self, capacity = 16):
+        self._count = 0
+        self._capacity = 0
+        self._allocate(max(capacity, 1))
+
+    def _allocate(self, capacity):
+        ''' Reallocates all arrays with room for capacity bodies,
+            keeping the bodies already stored. '''
+        count = self._count
+
+        def grow(old, shape):
+            new = numpy.zeros((capacity,) + shape)
+            if count:
+                new[:count] = old[:count]
+            return new
+
+        if self._capacity:
+            self.positions = grow(self.positions, (3,))
+            self.velocities = grow(self.velocities, (3,))
+            self.angularVelocities = grow(self.angularVelocities, (3,))
+            self.masses = grow(self.masses, ())
+            self.invMasses = grow(self.invMasses, ())
+            self.invInertias = grow(self.invInertias, (3, 3))
+            self.orientations = grow(self.orientations, (4,))
+        else:
+            self.positions = numpy.zeros((capacity, 3))
+            self.velocities = numpy.zeros((capacity, 3))
+            self.angularVelocities = numpy.zeros((capacity, 3))
+            self.masses = numpy.zeros(capacity)
+            self.invMasses = numpy.zeros(capacity)
+            self.invInertias = numpy.zeros((capacity, 3, 3))
+            self.orientations = numpy.zeros((capacity, 4))
+        self._capacity = capacity
+
+    def add_body(self, position = [0.0, 0.0, 0.0], mass = float('inf')):
+        ''' Adds a body at rest with identity orientation and no inverse
+            inertia (unable to rotate). Returns the index of its row. '''
+        if self._count == self._capacity:
+            self._allocate(2 * self._capacity)
+        index = self._count
+        self._count += 1
+
+        self.positions[index] = position
+        self.orientations[index] = [1.0, 0.0, 0.0, 0.0]
+        self.set_mass(index, mass)
+        return index
+
+    def get_count(self):
+        return self._count
+
+    def set_mass(self, index, mass):
+        ''' Sets the mass of a body and updates its inverse mass.
+            A mass of 0 or infinity makes the body immobile: its
+            inverse mass is 0. '''
+        self.masses[index] = mass
+        if 0 < mass < float('inf'):
+            self.invMasses[index] = 1.0 / mass
+        else:
+            self.invMasses[index] = 0.0
+
+    def rows(self, indices = None):
+        ''' Returns something that selects the given rows of an array,
+            or all bodies in use if indices is None. '''
+        if indices is None:
+            return slice(0, self._count)
+        return numpy.asarray(indices, dtype = int)
+
+    def accelerate(self, acceleration, dt, indices = None):
+        ''' Adds acceleration*dt to the velocities of the given bodies.
+            The indices must be unique. '''
+        rows = self.rows(indices)
+        self.velocities[rows] += numpy.asarray(acceleration) * dt
+
+    def integrate_positions(self, dt, indices = None):
+        ''' Moves the given bodies by their velocity times dt.
+            The indices must be unique. '''
+        rows = self.rows(indices)
+        self.positions[rows] += self.velocities[rows] * dt
+
+    def damp(self, linear, angular = 1.0, indices = None):
+        ''' Scales the linear and angular velocities of the given bodies
+            by the damping factors linear and angular. '''
+        rows = self.rows(indices)
+        self.velocities[rows] *= linear
+        self.angularVelocities[rows] *= angular
+
+# The store used by shapes that are not given one explicitly
+DEFAULT_STORE = RigidBodyStore()
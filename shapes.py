@@ -23,7 +23,9 @@ class Shape(object):
     and methods. All other shapes should inherit from this.
     Need to inherit from *object* in order to be fully usable by subclasses.
     Subclasses of Shape must define a method draw_shape with OpenGL
-    instructions on how to draw the particular shape in 3D space.'''
+    instructions on how to draw the particular shape in 3D space, and
+    a method compute_local_bounds that returns its bounds around its
+    center (see get_local_bounds).'''
     def __init__(self):
         ''' Constructor for the Shape object. Takes one optional
         color argument'''
@@ -34,12 +36,24 @@ class Shape(object):
         self._yPos = 0
         self._zPos = 0
 
+        # The center before the last physics step, see save_pose
+        self._previousCenter = None
+
+        # The bounds around the center, computed the first time they
+        # are needed, and the box in space last computed from them,
+        # along with the center it was computed for
+        self._localBounds = None
+        self._boundsCenter = None
+        self._bounds = None
+
         self._displayListIndex = self.create_and_get_GL_object()
 
-    def draw(self):
-        ''' Draws a generic shape in the 3D space.'''
+    def draw(self, alpha = 1.0):
+        ''' Draws a generic shape in the 3D space, at the fraction alpha
+        of the way from its pose before the last physics step to its
+        current pose (see save_pose).'''
         glPushMatrix()
-        self.translate_and_rotate()
+        self.translate_and_rotate(alpha)
         glCallList(self._displayListIndex)
         glPopMatrix()
 
@@ -52,9 +66,25 @@ class Shape(object):
         glEndList()
         return displayListIndex
 
-    def translate_and_rotate(self):
-        ''' Translates and rotates the shape to the current position '''
-        glTranslate(self._xPos, self._yPos, self._zPos)
+    def translate_and_rotate(self, alpha = 1.0):
+        ''' Translates and rotates the shape to the interpolated position '''
+        xPos, yPos, zPos = self.get_interpolated_center(alpha)
+        glTranslate(xPos, yPos, zPos)
+
+    def save_pose(self):
+        ''' Keeps the current pose before a physics step, so that the
+        frames drawn until the next step can be interpolated between it
+        and the pose after the step. '''
+        self._previousCenter = self.get_center()
+
+    def get_interpolated_center(self, alpha):
+        ''' Returns the center the fraction alpha of the way from the
+        one saved by save_pose to the current one. '''
+        center = self.get_center()
+        if self._previousCenter is None:
+            return center
+        previous = self._previousCenter
+        return [previous[k] + (center[k] - previous[k]) * alpha for k in range(3)]
 
     def update(self):
         ''' Updates the object coordinates and then
@@ -96,6 +126,39 @@ class Shape(object):
         self._yPos += movement[1]
         self._zPos += movement[2]
 
+    def get_local_bounds(self):
+        ''' Returns the lowest and highest corners of the axis-aligned
+        box around the shape, relative to its center, and the radius of
+        a sphere around the center that holds the shape. They are only
+        computed once. '''
+        if self._localBounds is None:
+            self._localBounds = self.compute_local_bounds()
+        return self._localBounds
+
+    def get_bounds(self):
+        ''' Returns the lowest and highest corners of the axis-aligned
+        box around the shape in space. The box is only computed again
+        when the center has moved since the last call. '''
+        center = self.get_center()
+        if center != self._boundsCenter:
+            lower, upper, radius = self.get_local_bounds()
+            self._bounds = ([center[0] + lower[0], center[1] + lower[1],
+                             center[2] + lower[2]],
+                            [center[0] + upper[0], center[1] + upper[1],
+                             center[2] + upper[2]])
+            self._boundsCenter = center
+        return self._bounds
+
+    def get_swept_bounds(self):
+        ''' Returns the box around the space the shape covers during the
+        next step. A shape that does not move covers its own box. '''
+        return self.get_bounds()
+
+    def get_bounding_sphere(self):
+        ''' Returns the center and the radius of a sphere that holds
+        the shape. '''
+        return self.get_center(), self.get_local_bounds()[2]
+
 class Surface(Shape):
     ''' Defines a surface '''
     def __init__(self, length = constants.SURFACE_SIZE,
@@ -163,6 +226,13 @@ class Surface(Shape):
                        [self._points[2], self._points[3]],
                        [self._points[3], self._points[0]]]        
 
+    def compute_local_bounds(self):
+        ''' The bounds of the corners of the surface '''
+        lower = [min(point[k] for point in self._initPoints) for k in range(3)]
+        upper = [max(point[k] for point in self._initPoints) for k in range(3)]
+        radius = max(Vector(point).norm() for point in self._initPoints)
+        return lower, upper, radius
+
     def get_points(self):
         return self._points
 
@@ -239,13 +309,20 @@ class MovingShape(Shape):
             currentFloor = normal
         return currentFloor, currentFloorDot
 
+    def step(self, surfaceList, directions = [0.0, 0.0, 0.0],
+             acceleration = constants.GRAV_ACC, currentFloor = Vector('e_y'),
+             currentFloorDot = 0.0):
+        ''' Checks for collision, then moves the shape one physics step. '''
+        acceleration, floor = self.collision_control(surfaceList, acceleration, currentFloor,
+                          currentFloorDot)
+        self.move(directions, acceleration, floor)
+
     def update(self, surfaceList, directions = [0.0, 0.0, 0.0],
                acceleration = constants.GRAV_ACC, currentFloor = Vector('e_y'),
                currentFloorDot = 0.0):
         ''' Checks for collision, then moves and draws the shape. '''
-        acceleration, floor = self.collision_control(surfaceList, acceleration, currentFloor,
-                          currentFloorDot)
-        self.move(directions, acceleration, floor)
+        self.step(surfaceList, directions, acceleration, currentFloor,
+                  currentFloorDot)
         super(MovingShape, self).update()
     
 
@@ -290,17 +367,38 @@ class MovingShape(Shape):
         normal, distance = self.collide(surface)
         if normal:
             #print "collided with", normal.get_value()
-            acceleration += normal * -normal.dot(constants.GRAV_ACC)
+            # Not in place, acceleration may be constants.GRAV_ACC
+            acceleration = acceleration + normal * -normal.dot(constants.GRAV_ACC)
             self._velocity += self._velocity * -surface.get_friction()
             if distance.norm() < self.get_border_distance():
                 self.move_center((normal * (self.get_border_distance()-distance.norm())).get_value())
             if self._velocity.dot(normal) < 0.0:
                 self.reset_jump()
-                acceleration += normal * -normal.dot(self._velocity)
+                acceleration = acceleration + normal * -normal.dot(self._velocity)
         
             return acceleration, normal
         return acceleration, Vector()
 
+    def get_reach(self):
+        ''' Returns the center and the radius of a sphere that holds all
+        the surfaces the shape can collide with in the next step (see
+        collide): its bounding sphere, grown by its speed. '''
+        center, radius = self.get_bounding_sphere()
+        return center, radius + self._velocity.norm()
+
+    def get_swept_bounds(self):
+        ''' Returns the box of get_bounds, stretched by the velocity,
+        which the shape moves by in the next step. '''
+        lower, upper = self.get_bounds()
+        lower = list(lower)
+        upper = list(upper)
+        for k, v in enumerate(self._velocity.get_value()):
+            if v < 0.0:
+                lower[k] += v
+            else:
+                upper[k] += v
+        return lower, upper
+
     # External getters and setters for
     # the instance variables.
 
@@ -325,6 +423,7 @@ class RotatingShape(MovingShape):
     def __init__(self):
         # Stores the rotation matrix of the shape, initiates it as identity
         self._rotationMatrix = matrix.identity()
+        self._previousRotation = None
 
         super(RotatingShape, self).__init__()
 
@@ -349,10 +448,21 @@ class RotatingShape(MovingShape):
         self._rotationMatrix = matrix.matrix_mult(rot_matrix, self._rotationMatrix)
 
 
-    def translate_and_rotate(self):
-        ''' Translates and rotates the shape to the current position '''
-        super(RotatingShape, self).translate_and_rotate()
-        glMultMatrixf(self._rotationMatrix)
+    def translate_and_rotate(self, alpha = 1.0):
+        ''' Translates and rotates the shape to the interpolated position '''
+        super(RotatingShape, self).translate_and_rotate(alpha)
+        glMultMatrixf(self.get_interpolated_rotation(alpha))
+
+    def save_pose(self):
+        super(RotatingShape, self).save_pose()
+        self._previousRotation = self._rotationMatrix
+
+    def get_interpolated_rotation(self, alpha):
+        ''' Returns the rotation matrix the fraction alpha of the way
+        from the one saved by save_pose to the current one. '''
+        if self._previousRotation is None:
+            return self._rotationMatrix
+        return matrix.blend(self._previousRotation, self._rotationMatrix, alpha)
 
 class Sphere(RotatingShape):
     ''' Defines a 3D sphere. Can move around (roll) in 3D space'''
@@ -430,6 +540,11 @@ class Sphere(RotatingShape):
 ####                self.push(cube, normal)
         return acceleration, currentFloor
 
+    def step(self, surfaceList, cubeList, directions = [0.0, 0.0, 0.0],
+             acceleration = constants.GRAV_ACC):
+        ''' Checks for collisions and updates the position. '''
+        super(Sphere, self).step(surfaceList, directions, acceleration)
+
     def update(self, surfaceList, cubeList, directions = [0.0, 0.0, 0.0],
                acceleration = constants.GRAV_ACC):
         ''' Checks for collisions, updates position, draws sphere. '''
@@ -451,6 +566,11 @@ class Sphere(RotatingShape):
         cube.move( -side.get_value())
         self._velocity += side * cube.get_speed()
 
+    def compute_local_bounds(self):
+        ''' The bounds of the sphere, whatever its rotation '''
+        r = self._radius
+        return [-r, -r, -r], [r, r, r], r
+
     def get_border_distance(self):
         return self._radius
 
@@ -567,6 +687,11 @@ class Cube(MovingShape):
 ##        self._yzEdge3 = Vector([self._xPos, self._yPos + self._side/2, self._zPos - self._side/2])
 ##        self._yzEdge4 = Vector([self._xPos, self._yPos - self._side/2, self._zPos - self._side/2])
 
+    def compute_local_bounds(self):
+        ''' The bounds of the cube, which does not rotate '''
+        h = self._side / 2.0
+        return [-h, -h, -h], [h, h, h], h * sqrt(3)
+
     def draw_shape(self):
         ''' The drawing routine for Cube. '''
         glColor4fv(self._color)
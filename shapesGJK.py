@@ -1,27 +1,35 @@
 # Shape class for the GJK test
 
 from vector import *
+import rigidbody
+import hull
 
 class Shape:
 
-    def __init__(self, points, position, support_func, color, mass = 1):
+    def __init__(self, points, position, support_func, color, mass = 1,
+                 store = None):
+
+        # Position, velocity, mass, orientation and inertia live in a
+        # RigidBodyStore; the shape only keeps its row index in it.
+        # The getters return Vec3 copies, so the GJK and physics code
+        # runs on the unrolled 3D operations.
+        if store is None:
+            store = rigidbody.DEFAULT_STORE
+        self._store = store
+        self._index = store.add_body(position.value, mass)
 
         # Linear motion
-        self._pos = position
-        self._velocity = Vector()
-        self._acceleration = Vector()
-        self._mass = mass
-        self._force = Vector()
+        self._acceleration = Vec3()
+        self._force = Vec3()
 
         # Angular motion
-        self._orientation = None
-        self._angVelocity = None
         self._angAcceleration = None
-        self._invInertia = None
         self._torque = None
 
 
-        self._points = points
+        self._points = VectorArray(points)
+        self._hull = None
+        self._localBounds = None
         self.sup_func = support_func
         self._radius = 1.0 # Just used to test support func for spheres
         self._color = color
@@ -29,42 +37,116 @@ class Shape:
     def support_func(self, direction):
         return self.sup_func(self, direction)
 
+    def get_store(self):
+        return self._store
+
+    def get_index(self):
+        return self._index
+
     def get_velocity(self):
-        return self._velocity
+        x, y, z = self._store.velocities[self._index].tolist()
+        return Vec3(x, y, z)
 
     def set_velocity(self, velocity):
-        self._velocity = velocity
+        self._store.velocities[self._index] = velocity.value
 
-    def add_velocity(self, velocity):
-        self._velocity += velocity
+    def add_velocity(self, velocity, scale = 1.0):
+        x, y, z = velocity.value
+        row = self._store.velocities[self._index]
+        row += (x * scale, y * scale, z * scale)
 
     def get_mass(self):
-        return self._mass
+        return float(self._store.masses[self._index])
+
+    def get_inv_mass(self):
+        ''' Returns the inverse mass, 0 for an immobile body '''
+        return float(self._store.invMasses[self._index])
+
+    def set_mass(self, mass):
+        self._store.set_mass(self._index, mass)
 
     def get_pos(self):
-        return self._pos
+        x, y, z = self._store.positions[self._index].tolist()
+        return Vec3(x, y, z)
 
     def get_points(self):
         return self._points
 
+    def get_hull(self):
+        ''' Returns the convex hull of the points, built the first time
+            it is asked for. Moving the points does not change which
+            ones are furthest in a direction, so it is kept until the
+            points are replaced. '''
+        if self._hull is None:
+            self._hull = hull.Hull(self._points.get_array())
+        return self._hull
+
     def get_radius(self):
         return self._radius
 
     def set_pos(self, pos):
-        self._pos = pos
+        self._store.positions[self._index] = pos.value
 
     def set_points(self, points):
-        self._points = points
-
-    def update_pos(self, movement):
-        self._pos += movement
-
-    def update_points(self, movement):
-        outPoints = [0]*len(self._points)
-        for i in range(len(self._points)):
-            out = self._points[i] + movement
-            outPoints[i] = out
-        self._points = outPoints
+        self._points = VectorArray(points)
+        self._hull = None
+        self._localBounds = None
+
+    def get_local_bounds(self):
+        ''' Returns the lowest and highest corners of the axis-aligned
+            box around the shape, relative to its position, as lists of
+            three numbers. They are found from the support points along
+            the axes the first time they are asked for, and kept until
+            the points are replaced, as the points follow the position
+            (see update_points). '''
+        if self._localBounds is None:
+            x, y, z = self._store.positions[self._index].tolist()
+            position = (x, y, z)
+            lower = []
+            upper = []
+            for k in range(3):
+                axis = [0.0, 0.0, 0.0]
+                axis[k] = 1.0
+                lower.append(self.support_func(-Vec3(*axis)).value[k] - position[k])
+                upper.append(self.support_func(Vec3(*axis)).value[k] - position[k])
+            self._localBounds = (lower, upper)
+        return self._localBounds
+
+    def get_bounds(self):
+        ''' Returns the lowest and highest corners of the axis-aligned
+            box around the shape in world space: the local box moved to
+            the current position. '''
+        lower, upper = self.get_local_bounds()
+        x, y, z = self._store.positions[self._index].tolist()
+        return ([x + lower[0], y + lower[1], z + lower[2]],
+                [x + upper[0], y + upper[1], z + upper[2]])
+
+    def get_swept_bounds(self, dt):
+        ''' Returns the box of get_bounds, stretched to also cover where
+            the shape moves during dt with its current velocity. '''
+        lower, upper = self.get_bounds()
+        for k, v in enumerate(self._store.velocities[self._index].tolist()):
+            if v < 0.0:
+                lower[k] += v * dt
+            else:
+                upper[k] += v * dt
+        return lower, upper
+
+    def get_bounding_sphere(self):
+        ''' Returns the centre, as a list of three numbers, and the radius
+            of the sphere around the box of get_bounds. '''
+        lower, upper = self.get_bounds()
+        centre = [(lower[k] + upper[k]) * 0.5 for k in range(3)]
+        radius = sqrt(sum((upper[k] - lower[k])**2 for k in range(3))) * 0.5
+        return centre, radius
+
+    def update_pos(self, movement, scale = 1.0):
+        x, y, z = movement.value
+        row = self._store.positions[self._index]
+        row += (x * scale, y * scale, z * scale)
+
+    def update_points(self, movement, scale = 1.0):
+        self._points.translate(movement, scale)
 
     def set_color(self, color):
         self._color = color
@@ -1,46 +1,111 @@
 # Simplex class
 
+import operator
+
+# Take the first 0 to 4 slots of a list as a tuple, highest slot first
+# or lowest slot first
+_NEWEST_FIRST = (lambda slots: (), lambda slots: (slots[0],),
+                 operator.itemgetter(1, 0), operator.itemgetter(2, 1, 0),
+                 operator.itemgetter(3, 2, 1, 0))
+_OLDEST_FIRST = (lambda slots: (), lambda slots: (slots[0],),
+                 operator.itemgetter(0, 1), operator.itemgetter(0, 1, 2),
+                 operator.itemgetter(0, 1, 2, 3))
+
 class Simplex:
+    ''' A simplex of at most four points in the Minkowski difference,
+        along with the corresponding (witness) points in the two shapes
+        and the search directions they were found in.
+
+        The points are kept in four preallocated slots, the first
+        get_size() of them in use. A point is added in the lowest free
+        slot, and a point that is removed is replaced by the one in the
+        highest slot, so nothing else moves. Points are referred to by
+        their position from the end, so get(1) is the point in the
+        highest slot: the point added last, right after add.
+    '''
+
+    CAPACITY = 4
 
     def __init__(self):
-        self._points = []
-
-    def add(self, item):
-##        # TODO: Should be something like this in order 
-##        # to not try add points that already are in the simplex. 
-##        # Must edit GJK to handle this scenario to to add this.
-##        if item in self._points:
-##            return False
-##        else:
-##            self._points.append(item)
-        self._points.append(item)
+        self._points = [None] * self.CAPACITY     # Minkowski difference points
+        self._points1 = [None] * self.CAPACITY    # Points in shape 1
+        self._points2 = [None] * self.CAPACITY    # Points in shape 2
+        self._directions = [None] * self.CAPACITY # Search directions
+        self._slots = (self._points, self._points1, self._points2,
+                       self._directions)
+        self._size = 0
+
+    def add(self, item, direction = None):
+        ''' Adds item, a tuple of a point in the Minkowski difference and
+            the corresponding points in the two shapes, found as the
+            support point in direction. Returns False (and adds nothing)
+            if the point already is in the simplex. '''
+        point = item[0]
+        size = self._size
+        points = self._points
+        for i in range(size):
+            if points[i] == point:
+                return False
+        assert size < self.CAPACITY, 'The simplex is full'
+
+        points[size], self._points1[size], self._points2[size] = item
+        self._directions[size] = direction
+        self._size = size + 1
+        return True
 
     def remove(self, index):
-##        # TODO: Should be something like this in order 
-##        # to not try to remove points that doesn't exist. 
-##        # Must edit GJK to handle this scenario to to add this.
-##        if item in self._points:        
-##            self._points.remove(item)
-##        else:
-##            return False
-        #self._points.remove(item)
-        del self._points[-index]
+        ''' Removes the point at position 'index' from the end. The point
+            in the highest slot is moved into the slot it leaves. '''
+        assert 1 <= index <= self._size, 'No point at that position'
+        last = self._size - 1
+        slot = last + 1 - index
+        for points in self._slots:
+            points[slot] = points[last]
+            points[last] = None
+        self._size = last
+
+    def keep(self, positions):
+        ''' Keeps only the points at the given positions from the end,
+            in the order of their slots, and drops the others. The kept
+            points are moved down in place. '''
+        size = self._size
+        count = 0
+        for slot in range(size):
+            if size - slot in positions:
+                if slot != count:
+                    for points in self._slots:
+                        points[count] = points[slot]
+                count += 1
+        for slot in range(count, size):
+            for points in self._slots:
+                points[slot] = None
+        self._size = count
 
     def get(self, index):
         ''' Returns the point in the simplex at position 'index' from the end '''
-        return self._points[-index][0]
+        return self._points[self._size - index]
 
     def get_all(self, index):
         ''' Returns the point in the simplex at position 'index' from the end,
             aswell as the corresponding points in the two shapes. '''
-        return self._points[-index]
+        slot = self._size - index
+        return self._points[slot], self._points1[slot], self._points2[slot]
+
+    def get_size(self):
+        return self._size
 
     def get_points(self):
-        return self._points
+        ''' Returns the (point, point1, point2) tuples, newest first '''
+        return [self.get_all(i) for i in range(1, self._size + 1)]
 
     def get_all_points(self, index):
-        out = []
-        for i in range(len(self._points)):
-            out.append(self._points[-i][index])
-        return out
-    
+        ''' Returns a tuple of the Minkowski difference points (index 0) or
+            the points in shape 1 or 2 (index 1 or 2), from position 1 on
+            (newest first) '''
+        return _NEWEST_FIRST[self._size](self._slots[index])
+
+    def get_all_directions(self):
+        ''' Returns a tuple of the search directions of the points, in
+            the order of their slots (oldest first), the order to add
+            them in again '''
+        return _OLDEST_FIRST[self._size](self._directions)
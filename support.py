@@ -1,4 +1,9 @@
 from vector import *
+import hull
+
+# Polyhedra with fewer points than this are searched in one vectorised
+# pass over their VectorArray, which is faster than walking their hull
+HULL_MIN = 256
 
 def support(shape1, shape2, direction):
     ''' Calculates a point in Minkowski space that is on the edge of
@@ -25,14 +30,27 @@ def support(shape1, shape2, direction):
     return outPoint, point1, point2
 
 def polyhedron(self, direction):
-    ''' Support function for convex polyhedra '''
-    pointList = []
-    shapePoints = self.get_points()
-    for point in shapePoints:
-        pointList.append(point.dot(direction))
-    outPoint = shapePoints[pointList.index(max(pointList))]
-    return outPoint
+    ''' Support function for convex polyhedra, whose points are
+        stored in a VectorArray. Large polyhedra are searched along the
+        edges of their hull (see hull.py), small ones all at once. '''
+    points = self.get_points()
+    if len(points) < HULL_MIN:
+        return points.support(direction)
+    return points.get(self.get_hull().support(direction.value))
 
 def sphere(self, direction):
     ''' Support function for spheres '''
     return self.get_pos() + direction.normalize()*self.get_radius()
+
+def quad(self, direction):
+    ''' Support function for flat convex polygons, such as the ground
+        plane, whose corners are stored in order in a VectorArray.
+        The same as polyhedron, but lets the narrow phase know the
+        shape is flat. '''
+    return self.get_points().support(direction)
+
+def box(self, direction):
+    ''' Support function for axis-aligned boxes, whose corners are
+        stored in a VectorArray. The same as polyhedron, but lets the
+        narrow phase know the shape is a box. '''
+    return self.get_points().support(direction)
@@ -71,7 +71,7 @@ for i in range(len(icoPoints)):
     icoOutVec[i] = Vector(out)
 
 #mainCube = Shape(cubeOutVec, pos, support.polyhedron)
-sphere = Shape(Vector(), pos, support.sphere, [0.2, 1.0, 0.8])
+sphere = Shape([Vector()], pos, support.sphere, [0.2, 1.0, 0.8])
 #icosahedron = Shape(icoOutVec, pos, support.polyhedron)
 #plane = Shape(planeOutVec, pos, support.polyhedron)
 
@@ -10,6 +10,7 @@ import support
 from draw import *
 from render import *
 from physics import *
+from timestep import FixedTimestep
 
 
 pygame.init()
@@ -40,7 +41,7 @@ PLANE_POINTS = [[-10.0, 0.0, -10.0], [10.0, 0.0, -10.0],
                 [10.0, 0.0, 10.0], [-10.0, 0.0, 10.0]]
 
 
-speed = 0.1
+speed = 10.0   # units per second
 xPos = 0.0
 yPos = 5.0
 zPos = 0.0
@@ -65,10 +66,10 @@ for i in range(len(planePoints)):
     planeOutVec[i] = Vector(out)
 
 sphere = Shape([Vector()], pos, support.sphere, [0.2, 1.0, 0.8])
-#cube = Shape(cubeOutVec, otherPos, support.polyhedron, GREEN)
+#cube = Shape(cubeOutVec, otherPos, support.box, GREEN)
 #cube.update_points(cube.get_pos())
 
-plane = Shape(planeOutVec, Vector(), support.polyhedron, [0.5, 0.0, 1.0], mass = 10000)
+plane = Shape(planeOutVec, Vector(), support.quad, [0.5, 0.0, 1.0], mass = float('inf'))
 
 
 #objectList = [cube]
@@ -83,6 +84,13 @@ game = Game(sphere, objectList, sceneList)
 run = True
 lastDirection = Vector()
 
+# Physics runs in fixed steps of dt, rendering as fast as it can;
+# each step is split into substeps when the scene moves fast
+clock = pygame.time.Clock()
+substepper = Substepper()
+stepper = FixedTimestep(lambda dt: substepper.step(game, dt), dt,
+                        store = sphere.get_store())
+
 
 while run:
 
@@ -111,7 +119,7 @@ while run:
         lastDirection = direction
 
 
-    update_physics(game)
-    render(game)
+    stepper.update(clock.tick() / 1000.0)
+    render(game, stepper)
 
 pygame.quit()
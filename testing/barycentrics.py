@@ -0,0 +1,204 @@
+# Closed form barycentric coordinates of the origin in a simplex
+
+import vectors
+
+# Simplices whose (relative) size in the last dimension falls below
+# this are treated as degenerate
+EPSILON = 1e-10
+
+def segment(a, b):
+    ''' Returns the barycentric coordinates (u, v) of the point closest
+        to the origin on the line through a and b, so that the point is
+        u*a + v*b, and whether the segment is degenerate (a == b). '''
+    assert isinstance(a, vectors.Vector), 'Input must be a vector'
+    assert isinstance(b, vectors.Vector), 'Input must be a vector'
+    ax, ay, az = a.value
+    bx, by, bz = b.value
+    abx = bx - ax; aby = by - ay; abz = bz - az
+
+    denom = abx*abx + aby*aby + abz*abz
+    if denom <= EPSILON * EPSILON:
+        return (1.0, 0.0), True
+
+    v = -(ax*abx + ay*aby + az*abz) / denom
+    return (1.0 - v, v), False
+
+def triangle(a, b, c):
+    ''' Returns the barycentric coordinates (u, v, w) of the projection
+        of the origin onto the plane of the triangle abc, and whether the
+        triangle is degenerate (its points on a line). '''
+    assert isinstance(a, vectors.Vector), 'Input must be a vector'
+    assert isinstance(b, vectors.Vector), 'Input must be a vector'
+    assert isinstance(c, vectors.Vector), 'Input must be a vector'
+    ax, ay, az = a.value
+    bx, by, bz = b.value
+    cx, cy, cz = c.value
+    abx = bx - ax; aby = by - ay; abz = bz - az
+    acx = cx - ax; acy = cy - ay; acz = cz - az
+
+    # n = ab x ac, |n|^2 is four times the squared area
+    nx = aby*acz - abz*acy
+    ny = abz*acx - abx*acz
+    nz = abx*acy - aby*acx
+    denom = nx*nx + ny*ny + nz*nz
+    scale = (abx*abx + aby*aby + abz*abz) * (acx*acx + acy*acy + acz*acz)
+    if denom <= EPSILON * EPSILON * scale or denom == 0.0:
+        return (1.0, 0.0, 0.0), True
+
+    # v = ((-a) x ac).n / n.n, w = (ab x (-a)).n / n.n
+    v = -((ay*acz - az*acy)*nx + (az*acx - ax*acz)*ny + (ax*acy - ay*acx)*nz) / denom
+    w = -((aby*az - abz*ay)*nx + (abz*ax - abx*az)*ny + (abx*ay - aby*ax)*nz) / denom
+    return (1.0 - v - w, v, w), False
+
+def tetrahedron(a, b, c, d):
+    ''' Returns the barycentric coordinates (u, v, w, x) of the origin
+        in the tetrahedron abcd, so that u*a + v*b + w*c + x*d is the
+        origin and the coordinates sum to one, and whether the
+        tetrahedron is degenerate (its points in a plane).
+
+        Uses Cramer's rule on a + v*ab + w*ac + x*ad = 0, that is, each
+        coordinate is a ratio of signed volumes. '''
+    assert isinstance(a, vectors.Vector), 'Input must be a vector'
+    assert isinstance(b, vectors.Vector), 'Input must be a vector'
+    assert isinstance(c, vectors.Vector), 'Input must be a vector'
+    assert isinstance(d, vectors.Vector), 'Input must be a vector'
+    ax, ay, az = a.value
+    bx, by, bz = b.value
+    cx, cy, cz = c.value
+    dx, dy, dz = d.value
+    abx = bx - ax; aby = by - ay; abz = bz - az
+    acx = cx - ax; acy = cy - ay; acz = cz - az
+    adx = dx - ax; ady = dy - ay; adz = dz - az
+
+    # ac x ad, ad x ab and ab x ac
+    cdx = acy*adz - acz*ady; cdy = acz*adx - acx*adz; cdz = acx*ady - acy*adx
+    dbx = ady*abz - adz*aby; dby = adz*abx - adx*abz; dbz = adx*aby - ady*abx
+    bcx = aby*acz - abz*acy; bcy = abz*acx - abx*acz; bcz = abx*acy - aby*acx
+
+    # Six times the signed volume of abcd
+    det = abx*cdx + aby*cdy + abz*cdz
+    scale = (abx*abx + aby*aby + abz*abz) * (acx*acx + acy*acy + acz*acz) * \
+            (adx*adx + ady*ady + adz*adz)
+    if det*det <= EPSILON * EPSILON * scale or det == 0.0:
+        return (1.0, 0.0, 0.0, 0.0), True
+
+    v = -(ax*cdx + ay*cdy + az*cdz) / det
+    w = -(ax*dbx + ay*dby + az*dbz) / det
+    x = -(ax*bcx + ay*bcy + az*bcz) / det
+    return (1.0 - v - w - x, v, w, x), False
+
+def signed_volumes(points):
+    ''' Returns the barycentric coordinates of the point closest to the
+        origin in the convex hull of the 1 to 4 given points, and the
+        indices of the points the coordinates belong to: the smallest
+        set of points whose hull still contains the closest point.
+
+        This is the signed volumes method. The origin is projected onto
+        the simplex, and the signs of the volumes (areas, lengths) of
+        the simplices with one point swapped for the projection tell on
+        which sides of the simplex it lies. Triangles and segments are
+        measured in the coordinate plane (axis) where they are largest,
+        so that nearly flat cases keep their precision. The closest
+        point is then searched for only on the sides that face the
+        origin. '''
+    assert isinstance(points, (list, tuple)), 'Input must be a list or tuple'
+    assert 1 <= len(points) <= 4, 'A simplex has 1 to 4 points'
+    return _SOLVERS[len(points)](points)
+
+def _same_sign(a, b):
+    return (a > 0 and b > 0) or (a < 0 and b < 0)
+
+def _closest_side(points, candidates):
+    ''' Returns the coordinates and indices of the closest point on the
+        sides of the simplex opposite to the points in candidates. '''
+    count = len(points)
+    best = None
+    for i in candidates:
+        subCoords, subIndices = _SOLVERS[count - 1](points[:i] + points[i+1:])
+        subIndices = tuple(j + (j >= i) for j in subIndices)
+        x, y, z = combine(points, subCoords, subIndices)
+        distance = x*x + y*y + z*z
+        if best is None or distance < best[0]:
+            best = (distance, subCoords, subIndices)
+    return best[1], best[2]
+
+def _point(points):
+    return (1.0,), (0,)
+
+def _segment(points):
+    a, b = points
+    ax, ay, az = a.value
+    bx, by, bz = b.value
+    abx = bx - ax; aby = by - ay; abz = bz - az
+
+    denom = abx*abx + aby*aby + abz*abz
+    # The projection of the origin is a + t*ab
+    t = -(ax*abx + ay*aby + az*abz)
+    if t > 0 and t < denom:
+        v = t / denom
+        return (1.0 - v, v), (0, 1)
+    if t > 0 and denom > 0:
+        return (1.0,), (1,)
+    return (1.0,), (0,)
+
+def _triangle(points):
+    a, b, c = points
+    ax, ay, az = a.value
+    bx, by, bz = b.value
+    cx, cy, cz = c.value
+    abx = bx - ax; aby = by - ay; abz = bz - az
+    acx = cx - ax; acy = cy - ay; acz = cz - az
+
+    # n = ab x ac, and the projection of the origin, p = n*(a.n)/(n.n)
+    nx = aby*acz - abz*acy
+    ny = abz*acx - abx*acz
+    nz = abx*acy - aby*acx
+    nn = nx*nx + ny*ny + nz*nz
+    if nn <= EPSILON * EPSILON * (abx*abx + aby*aby + abz*abz) * \
+             (acx*acx + acy*acy + acz*acz) or nn == 0.0:
+        # The points are on a line
+        return _closest_side(points, (0, 1, 2))
+    scale = (ax*nx + ay*ny + az*nz) / nn
+    px = nx*scale; py = ny*scale; pz = nz*scale
+
+    # Signed areas in the coordinate plane where the triangle is largest
+    if abs(nx) >= abs(ny) and abs(nx) >= abs(nz):
+        area = nx
+        u1, v1, u2, v2, u3, v3, pu, pv = ay, az, by, bz, cy, cz, py, pz
+    elif abs(ny) >= abs(nz):
+        area = ny
+        u1, v1, u2, v2, u3, v3, pu, pv = az, ax, bz, bx, cz, cx, pz, px
+    else:
+        area = nz
+        u1, v1, u2, v2, u3, v3, pu, pv = ax, ay, bx, by, cx, cy, px, py
+    areas = ((u2 - pu)*(v3 - pv) - (v2 - pv)*(u3 - pu),
+             (pu - u1)*(v3 - v1) - (pv - v1)*(u3 - u1),
+             (u2 - u1)*(pv - v1) - (v2 - v1)*(pu - u1))
+
+    outside = [i for i in range(3) if not _same_sign(area, areas[i])]
+    if not outside:
+        return tuple(x / area for x in areas), (0, 1, 2)
+    return _closest_side(points, outside)
+
+def _tetrahedron(points):
+    coords, degenerate = tetrahedron(*points)
+    if degenerate:
+        return _closest_side(points, (0, 1, 2, 3))
+    outside = [i for i in range(4) if coords[i] <= 0]
+    if not outside:
+        return coords, (0, 1, 2, 3)
+    return _closest_side(points, outside)
+
+def combine(points, coords, indices):
+    ''' Returns the components of the sum of coords[k]*points[indices[k]] '''
+    x = y = z = 0.0
+    for c, i in zip(coords, indices):
+        px, py, pz = points[i].value
+        x += c*px; y += c*py; z += c*pz
+    return x, y, z
+
+# The barycentric coordinates of simplices with 2, 3 and 4 points
+SIMPLICES = {2: segment, 3: triangle, 4: tetrahedron}
+
+# The closest point solvers for simplices with 1 to 4 points
+_SOLVERS = {1: _point, 2: _segment, 3: _triangle, 4: _tetrahedron}
@@ -0,0 +1,333 @@
+# Broad phases: find the pairs of shapes whose axis-aligned bounding
+# boxes overlap, for the narrow phase to test. Sweep and prune suits
+# most scenes, a spatial hash dense crowds of shapes of similar size.
+
+import math
+
+class SweepAndPrune:
+    ''' Keeps the bounding boxes of a set of shapes, and the pairs of
+        them that overlap, from one physics step to the next.
+
+        The boxes are the bounds the shapes keep of themselves (see
+        get_swept_bounds), and their ends along each axis are kept in a
+        sorted list. As the shapes only move a little per step, the lists
+        are nearly sorted already, and insertion sort puts them back in
+        order with few swaps. Only a swap can start or end an overlap: when the
+        lower end of one box passes the upper end of another, the boxes
+        are tested on all axes, and when an upper end passes a lower
+        end, the pair is dropped. A step thus costs about one box per
+        shape plus one test per swap, instead of one test per pair.
+
+        Passive shapes (such as the scene) are only paired with the
+        others, not among themselves. A shape may be passive in one
+        update and not in the next, which costs a test against every
+        other shape.
+    '''
+
+    def __init__(self):
+        # Per shape, its lower and upper ends along the three axes. An
+        # end is a list [value, shape, isUpper], shared with the list
+        # of the axis, so that it can be updated in place.
+        self._boxes = {}
+        self._passive = {}
+        self._axes = ([], [], [])
+        self._pairs = set()
+
+    def update(self, shapes, passive = [], dt = 0.0):
+        ''' Brings the broad phase up to date with the given shapes (and
+            passive shapes): new ones are added, ones that are gone are
+            removed, and the boxes of all are updated. The boxes are the
+            cached bounds of the shapes, swept over the coming timestep
+            dt, so that shapes that move are paired a little early
+            rather than too late.
+
+            Output:
+                *   The overlapping pairs, as (shape1, shape2) tuples,
+                    with shape1 before shape2 in shapes + passive, in
+                    that order.
+        '''
+        order = {}
+        activated = []
+        for shape in shapes:
+            order[shape] = len(order)
+            if self._passive.get(shape):
+                activated.append(shape)
+            self._passive[shape] = False
+        for shape in passive:
+            order[shape] = len(order)
+            self._passive[shape] = True
+
+        for shape in [shape for shape in self._boxes if shape not in order]:
+            self.remove(shape)
+
+        for shape in order:
+            lower, upper = shape.get_swept_bounds(dt)
+            ends = self._boxes.get(shape)
+            if ends is None:
+                ends = ([[lower[k], shape, False] for k in range(3)],
+                        [[upper[k], shape, True] for k in range(3)])
+                self._boxes[shape] = ends
+                for k in range(3):
+                    self._axes[k].append(ends[0][k])
+                    self._axes[k].append(ends[1][k])
+            else:
+                for k in range(3):
+                    ends[0][k][0] = lower[k]
+                    ends[1][k][0] = upper[k]
+
+        for endpoints in self._axes:
+            self._sort(endpoints)
+
+        # Overlaps among passive shapes are not kept track of, so a
+        # shape that stops being passive is tested against all others
+        for shape in activated:
+            for other in self._boxes:
+                if other is not shape and self._overlaps(shape, other):
+                    self._pairs.add(_key(shape, other))
+
+        pairs = []
+        for shape1, shape2 in self._pairs:
+            if self._passive[shape1] and self._passive[shape2]:
+                # Kept from when one of them was not passive, in case
+                # it stops being passive again
+                continue
+            if not self._overlaps(shape1, shape2):
+                # Ends with equal values are not swapped, so a pair
+                # that touched may have come apart without a swap
+                continue
+            if order[shape1] > order[shape2]:
+                shape1, shape2 = shape2, shape1
+            pairs.append((order[shape1], order[shape2], shape1, shape2))
+        pairs.sort()
+        return [(shape1, shape2) for i, j, shape1, shape2 in pairs]
+
+    def remove(self, shape):
+        ''' Removes shape and its pairs from the broad phase. '''
+        del self._boxes[shape]
+        del self._passive[shape]
+        for endpoints in self._axes:
+            endpoints[:] = [end for end in endpoints if end[1] is not shape]
+        self._pairs = set(pair for pair in self._pairs if shape not in pair)
+
+    def get_box(self, shape):
+        ''' Returns the lowest and highest corners of the box of shape, as
+            of the last update. '''
+        lower, upper = self._boxes[shape]
+        return [end[0] for end in lower], [end[0] for end in upper]
+
+    def _overlaps(self, shape1, shape2):
+        lower1, upper1 = self._boxes[shape1]
+        lower2, upper2 = self._boxes[shape2]
+        for k in range(3):
+            if lower1[k][0] > upper2[k][0] or lower2[k][0] > upper1[k][0]:
+                return False
+        return True
+
+    def _sort(self, endpoints):
+        ''' Insertion sorts the ends along one axis, starting and ending
+            overlaps as lower and upper ends pass each other. '''
+        for i in range(1, len(endpoints)):
+            end = endpoints[i]
+            value, shape, isUpper = end
+            j = i - 1
+            while j >= 0 and endpoints[j][0] > value:
+                other = endpoints[j]
+                if other[2] != isUpper and other[1] is not shape:
+                    pair = _key(shape, other[1])
+                    if isUpper:
+                        # The box of shape now ends before the other starts
+                        self._pairs.discard(pair)
+                    elif not (self._passive[shape] and self._passive[other[1]]) \
+                         and self._overlaps(shape, other[1]):
+                        self._pairs.add(pair)
+                endpoints[j + 1] = other
+                j -= 1
+            endpoints[j + 1] = end
+
+def _key(shape1, shape2):
+    ''' Returns the pair in the same order whichever shape comes first '''
+    if id(shape1) < id(shape2):
+        return (shape1, shape2)
+    return (shape2, shape1)
+
+class SpatialHash:
+    ''' A broad phase for crowds of shapes of about the same size: space
+        is split into cubic cells of side cellSize, kept in a dict keyed
+        by their integer coordinates, and each shape is hashed to the
+        cell of the centre of its box. A shape only moves to another cell
+        when its centre crosses into it.
+
+        When no shape is larger than a cell, two shapes can only overlap
+        if their cells are neighbours, so each shape is only tested
+        against the shapes in the 27 cells around its own. Shapes that
+        are larger (such as the ground) are kept aside and tested
+        against all others. Unlike sweep and prune, the cost does not
+        grow with how many shapes line up along an axis, so it holds up
+        in dense crowds.
+
+        If cellSize is not given, it is set at the first update to the
+        largest box among the shapes that are not passive. Shapes whose
+        swept boxes outgrow it later count as large until they slow
+        down.
+
+        Passive shapes (such as the scene) are only paired with the
+        others, not among themselves.
+    '''
+
+    def __init__(self, cellSize = None):
+        assert cellSize is None or cellSize > 0, 'The cell size must be positive'
+        self._cellSize = cellSize
+        self._cells = {}        # Cell coordinates -> the shapes in the cell
+        self._cellOf = {}       # Shape -> its cell, or None if it is too large
+        self._large = []        # The shapes larger than a cell
+        self._boxes = {}
+        self._passive = {}
+        self._candidates = 0
+        self._pairs = 0
+
+    def get_cell_size(self):
+        return self._cellSize
+
+    def get_statistics(self):
+        ''' Returns a dict with the number of occupied cells, the most
+            and the mean number of shapes in them, the number of shapes
+            too large for a cell, and the number of candidate pairs
+            tested and of overlapping pairs found in the last update. '''
+        occupancies = [len(shapes) for shapes in self._cells.itervalues()]
+        return {'cells': len(occupancies),
+                'maxOccupancy': max(occupancies) if occupancies else 0,
+                'meanOccupancy': float(sum(occupancies)) / len(occupancies)
+                                 if occupancies else 0.0,
+                'large': len(self._large),
+                'candidates': self._candidates,
+                'pairs': self._pairs}
+
+    def update(self, shapes, passive = [], dt = 0.0):
+        ''' Brings the broad phase up to date with the given shapes (and
+            passive shapes), the same as SweepAndPrune.update. Shapes
+            that changed cells are moved; the others stay put.
+
+            Output:
+                *   The overlapping pairs, as (shape1, shape2) tuples,
+                    with shape1 before shape2 in shapes + passive, in
+                    that order.
+        '''
+        order = {}
+        for shape in shapes:
+            order[shape] = len(order)
+            self._passive[shape] = False
+        for shape in passive:
+            order[shape] = len(order)
+            self._passive[shape] = True
+
+        for shape in [shape for shape in self._boxes if shape not in order]:
+            self.remove(shape)
+
+        for shape in order:
+            self._boxes[shape] = shape.get_swept_bounds(dt)
+
+        if self._cellSize is None:
+            sizes = [max(upper[k] - lower[k] for k in range(3))
+                     for lower, upper in (self._boxes[shape] for shape in shapes)]
+            if not sizes or max(sizes) <= 0.0:
+                # Nothing to size the cells by yet
+                return self._all_pairs(order)
+            self._cellSize = max(sizes)
+
+        for shape in order:
+            self._move(shape, self._cell(shape))
+
+        # Each pair is found from the shape first in order
+        found = set()
+        candidates = 0
+        for shape, cell in self._cellOf.iteritems():
+            if cell is None:
+                continue
+            x, y, z = cell
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for dz in (-1, 0, 1):
+                        for other in self._cells.get((x + dx, y + dy, z + dz), ()):
+                            if order[other] > order[shape] and \
+                               not (self._passive[shape] and self._passive[other]):
+                                candidates += 1
+                                if self._overlaps(shape, other):
+                                    found.add((shape, other))
+        for shape in self._large:
+            for other in order:
+                if other is not shape and \
+                   not (self._passive[shape] and self._passive[other]) and \
+                   (self._cellOf[other] is not None or order[other] > order[shape]):
+                    candidates += 1
+                    if self._overlaps(shape, other):
+                        if order[shape] > order[other]:
+                            found.add((other, shape))
+                        else:
+                            found.add((shape, other))
+
+        self._candidates = candidates
+        self._pairs = len(found)
+        return sorted(found, key = lambda pair: (order[pair[0]], order[pair[1]]))
+
+    def remove(self, shape):
+        ''' Removes shape from the broad phase. '''
+        self._take_out(shape)
+        self._cellOf.pop(shape, None)
+        del self._boxes[shape]
+        del self._passive[shape]
+
+    def _cell(self, shape):
+        ''' Returns the cell of the centre of the box of shape, or None if
+            the box is larger than a cell. '''
+        lower, upper = self._boxes[shape]
+        size = self._cellSize
+        if max(upper[k] - lower[k] for k in range(3)) > size:
+            return None
+        return tuple(int(math.floor((lower[k] + upper[k]) * 0.5 / size))
+                     for k in range(3))
+
+    def _move(self, shape, cell):
+        ''' Moves shape to cell (None for the large shapes) '''
+        if shape in self._cellOf:
+            if self._cellOf[shape] == cell:
+                return
+            self._take_out(shape)
+        if cell is None:
+            self._large.append(shape)
+        else:
+            self._cells.setdefault(cell, []).append(shape)
+        self._cellOf[shape] = cell
+
+    def _take_out(self, shape):
+        ''' Takes shape out of its cell, or out of the large shapes '''
+        if shape not in self._cellOf:
+            return
+        cell = self._cellOf[shape]
+        if cell is None:
+            self._large.remove(shape)
+        else:
+            shapes = self._cells[cell]
+            shapes.remove(shape)
+            if not shapes:
+                del self._cells[cell]
+
+    def _overlaps(self, shape1, shape2):
+        lower1, upper1 = self._boxes[shape1]
+        lower2, upper2 = self._boxes[shape2]
+        for k in range(3):
+            if lower1[k] > upper2[k] or lower2[k] > upper1[k]:
+                return False
+        return True
+
+    def _all_pairs(self, order):
+        ''' Tests every pair, for when there are no cells yet '''
+        ordered = sorted(order, key = order.get)
+        pairs = []
+        for i, shape in enumerate(ordered):
+            for other in ordered[i + 1:]:
+                if not (self._passive[shape] and self._passive[other]) and \
+                   self._overlaps(shape, other):
+                    pairs.append((shape, other))
+        self._candidates = len(ordered) * (len(ordered) - 1) // 2
+        self._pairs = len(pairs)
+        return pairs
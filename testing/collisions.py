@@ -1,11 +1,127 @@
 import vectors
 import simplices
 import supports
-import gauss
+import barycentrics
 import numbers
+import math
 import shapes
 
-def GJK(shape1, shape2):
+# If the point of a simplex closest to the origin is this close to it,
+# relative to the size of the simplex, the origin counts as in the simplex
+TOLERANCE = 1e-10
+
+# The number of GJK queries that have given up without an answer
+undeterminedCount = 0
+
+class PairCache:
+    ''' Remembers where the last GJK query of each pair of shapes ended,
+        so that the next query of the pair can start from there: the
+        separating direction if they were apart, or the search
+        directions of the final simplex (oldest first) if they collided. Since the shapes only move a
+        little per step, the old answer usually still holds.
+
+        Entries are keyed by the shapes themselves. Call new_frame()
+        once per physics step; pairs that have not been queried for
+        maxAge steps (e.g. because the broad phase no longer reports
+        them) are evicted then. evict() drops a pair directly.
+    '''
+
+    def __init__(self, maxAge = 1):
+        assert isinstance(maxAge, int), 'maxAge must be an integer'
+        self._entries = {}
+        self._frame = 0
+        self._maxAge = maxAge
+
+    def new_frame(self):
+        ''' Starts a new step and evicts the pairs that have not been
+            queried for maxAge steps. '''
+        self._frame += 1
+        oldest = self._frame - self._maxAge
+        for key in [key for key, entry in self._entries.iteritems()
+                    if entry[0] < oldest]:
+            del self._entries[key]
+
+    def get(self, shape1, shape2):
+        ''' Returns the directions to start the query of the pair from,
+            or None if the pair is not cached. '''
+        entry = self._entries.get((shape1, shape2))
+        if entry is None:
+            return None
+        return entry[1]
+
+    def store(self, shape1, shape2, directions):
+        self._entries[(shape1, shape2)] = (self._frame, directions)
+
+    def evict(self, shape1, shape2):
+        self._entries.pop((shape1, shape2), None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+def warm_start(shape1, shape2, directions):
+    ''' Rebuilds a simplex from support points in the cached directions.
+
+        Output:
+            *   A tuple (status, simplex, direction). status is False if
+                one of the directions still separates the shapes (it is
+                returned as direction), True if the rebuilt simplex
+                contains the origin, and None if the query must go on
+                searching from simplex.
+    '''
+    assert isinstance(shape1, shapes.Shape), 'Input must be a Shape object'
+    assert isinstance(shape2, shapes.Shape), 'Input must be a Shape object'
+    simplex = simplices.Simplex()
+    for direction in directions:
+        if direction.is_zero():
+            # A simplex point at the origin gives no direction
+            continue
+        simplex.add(supports.support(shape1, shape2, direction), direction)
+        if simplex.get(1).dot(direction) <= 0:
+            # Still a separating direction
+            return False, simplex, direction
+
+    if simplex.get_size() == 4:
+        # The rebuilt tetrahedron may already contain the origin
+        barCoord, degenerate = barycentrics.tetrahedron(*simplex.get_all_points(0))
+        if not degenerate and min(barCoord) >= 0:
+            return True, simplex, None
+
+    # Otherwise the search goes on from the rebuilt simplex
+    return None, simplex, None
+
+def collision_info(shape1, shape2, simplex):
+    ''' Returns the collision point, penetration normal and penetration
+        depth of two shapes, given a simplex that contains the origin.
+        The collision point is midway between the deepest points of the
+        two shapes. '''
+    assert isinstance(simplex, simplices.Simplex), 'Input must be a Simplex object'
+    assert simplex.get_size() == 4, \
+           'Terminated without full simplex'
+
+    result = EPA(shape1, shape2, simplex)
+    if result is not None:
+        penetrationNormal, penetrationDepth, point1, point2 = result
+        collisionPoint = (point1 + point2) * 0.5
+    else:
+        # The origin is on the surface of the simplex, so the shapes
+        # are just touching; fall back on the shape specific estimates
+        collisionPoint = pointOfCollision_2(simplex)
+        penetrationNormal, penetrationDepth = normal_and_depth(shape1, shape2, collisionPoint)
+
+    
+    assert isinstance(collisionPoint, vectors.Vector), \
+           'collisionPoint must be a vector'
+    assert isinstance(penetrationNormal, vectors.Vector), \
+           'penetrationNormal must be a vector'
+    assert isinstance(penetrationDepth, numbers.Number), \
+           'penetrationDepth must be a number'
+    assert penetrationDepth >= 0, 'penetrationDepth must be at least 0'
+    return collisionPoint, penetrationNormal, penetrationDepth
+
+def GJK(shape1, shape2, cache = None, maxIterations = 32):
     ''' Calculates whether shape1 has collided with shape2. It uses Minkowski
         Difference to find out if they have any point in common; if they do,
         they have collided.
@@ -15,214 +131,467 @@ def GJK(shape1, shape2):
                 a position, describing it's location, and a list of it's points,
                 represented as Vector objects, describing the whereabouts of
                 it's vertices.
+            *   cache is an optional PairCache; the query then starts from
+                where the last query of the same pair ended.
+            *   maxIterations is the largest number of support points
+                searched for.
         Output:
-            *   The output is a Boolean: True if the shapes have collided and
-                False otherwise. It also outputs an approximation of the
+            *   The output is True if the shapes have collided and False
+                otherwise. It also outputs an approximation of the
                 contact point, represented as a Vector object.
+            *   If the search stops without an answer (it runs out of
+                iterations, finds a support point it already has, or
+                gets no closer to the origin) the output is None, and
+                undeterminedCount is counted up. Callers that only test
+                the output for truth treat that as no collision.
     '''
     assert isinstance(shape1, shapes.Shape), 'Input must be a Shape object'
     assert isinstance(shape2, shapes.Shape), 'Input must be a Shape object'
+    assert cache is None or isinstance(cache, PairCache), \
+           'cache must be a PairCache object'
+
     # Create a Simplex object
     simplex = simplices.Simplex()
 
-    # Choose an initial search direction
-    direction = shape1.get_pos() - shape2.get_pos()
-    
-    # Get the first Minkowski Difference point
-    simplex.add(supports.support(shape1, shape2, direction))
-    
-    direction *= -1.0
-
-    originInSimplex = None
-    # Start looping
-    while True:
-        # Add a new point to the simplex
-        # TODO: Take care of if the simplex already contains the point.
-        simplex.add(supports.support(shape1, shape2, direction))
-
-        # Make sure that the last point we added passed the origin
-        if simplex.get(1).dot(direction) <= 0 and originInSimplex != '':
-            # If the point added last was not past the origin in
-            # the chosen direction then the Minkowski Difference cannot
-            # possibly contain the origin since the last point
-            # added is on the edge of the Minkowski Difference.
+    cached = None
+    if cache is not None:
+        cached = cache.get(shape1, shape2)
+    if cached is not None:
+        status, simplex, direction = warm_start(shape1, shape2, cached)
+        if status is False:
+            cache.store(shape1, shape2, [direction])
             return False, (None, None, None)
-        else:
-            # Otherwise we need to determine if the origin is in
-            # the current simplex
-            originInSimplex, direction = containsOrigin(simplex)
-            if originInSimplex:
-                # If it is then we know there is a collision
-                assert len(simplex.get_points()) == 4, \
-                       'Terminated without full simplex'
-                collisionPoint = pointOfCollision_2(simplex)            
-
-                penetrationNormal, penetrationDepth = normal_and_depth(shape1, shape2, collisionPoint)
+        elif status:
+            cache.store(shape1, shape2,
+                        list(simplex.get_all_directions()))
+            return True, collision_info(shape1, shape2, simplex)
 
-                
-                assert isinstance(collisionPoint, vectors.Vector), \
-                       'collisionPoint must be a vector'
-                assert isinstance(penetrationNormal, vectors.Vector), \
-                       'penetrationNormal must be a vector'
-                assert isinstance(penetrationDepth, numbers.Number), \
-                       'penetrationDepth must be a number'
-                assert penetrationDepth >= 0, 'penetrationDepth must be at least 0'
-                return True, (collisionPoint, penetrationNormal, penetrationDepth)
+    if not simplex.get_size():
+        # Choose an initial search direction
+        direction = shape1.get_pos() - shape2.get_pos()
+        if direction.is_zero():
+            direction = vectors.Vector([1.0, 0.0, 0.0])
 
+        # Get the first Minkowski Difference point
+        simplex.add(supports.support(shape1, shape2, direction), direction)
 
+    # Start looping
+    for iteration in range(maxIterations):
+        # Reduce the simplex to the points closest to the origin
+        closest = closest_in_simplex(simplex)
+        if closest is None:
+            # The origin is in the simplex, so the shapes have collided.
+            # EPA needs a tetrahedron around it.
+            if not complete_simplex(shape1, shape2, simplex):
+                # The Minkowski Difference is flat, they only touch
+                if cache is not None:
+                    cache.evict(shape1, shape2)
+                return False, (None, None, None)
+            if cache is not None:
+                cache.store(shape1, shape2,
+                            list(simplex.get_all_directions()))
+            return True, collision_info(shape1, shape2, simplex)
+
+        # Search on towards the origin
+        direction = -closest
+        vertex = supports.support(shape1, shape2, direction)
+        progress = vertex[0].dot(direction)
+        if progress <= 0:
+            # If the new point is not past the origin in the chosen
+            # direction then the Minkowski Difference cannot possibly
+            # contain the origin, since that point is on its edge.
+            if cache is not None:
+                cache.store(shape1, shape2, [direction])
+            return False, (None, None, None)
+        if progress*progress <= TOLERANCE * TOLERANCE * \
+                                direction.dot(direction) * vertex[0].dot(vertex[0]):
+            # The origin is on the edge of the Minkowski Difference,
+            # as far as we can tell
+            break
+        if not simplex.add(vertex, direction):
+            # The support point already is in the simplex, so it
+            # cannot get any closer to the origin
+            break
+
+    return undetermined(shape1, shape2, cache)
+
+def undetermined(shape1, shape2, cache = None):
+    ''' Counts a GJK query of the shapes that gave up, and returns its
+        output. '''
+    global undeterminedCount
+    undeterminedCount += 1
+    if cache is not None:
+        cache.evict(shape1, shape2)
+    return None, (None, None, None)
+
+def closest_in_simplex(simplex):
+    ''' Signed volumes sub-algorithm of GJK: finds the point of the
+        simplex closest to the origin, and drops the points that are not
+        needed to describe it.
 
+        Output:
+            *   The closest point, or None if the origin is in the simplex,
+                which is then kept whole.
+    '''
+    assert isinstance(simplex, simplices.Simplex), 'Input must be a Simplex object'
+    points = simplex.get_all_points(0)
+    coords, indices = barycentrics.signed_volumes(points)
+    x, y, z = barycentrics.combine(points, coords, indices)
+    scale = max(point.dot(point) for point in points)
+    if x*x + y*y + z*z <= TOLERANCE * TOLERANCE * scale:
+        return None
+    simplex.keep([i + 1 for i in indices])
+    return vectors.Vector([x, y, z])
+
+def complete_simplex(shape1, shape2, simplex):
+    ''' Grows a simplex that has the origin on it into a tetrahedron, by
+        adding support points in directions out of its line or plane.
+        Returns False if that is not possible, when the Minkowski
+        Difference is flat. '''
+    assert isinstance(simplex, simplices.Simplex), 'Input must be a Simplex object'
+    axes = (vectors.Vector([1.0, 0.0, 0.0]), vectors.Vector([0.0, 1.0, 0.0]), vectors.Vector([0.0, 0.0, 1.0]))
+    while simplex.get_size() < 4:
+        a = simplex.get(1)
+        if simplex.get_size() == 1:
+            candidates = axes
+        elif simplex.get_size() == 2:
+            ab = simplex.get(2) - a
+            candidates = [ab.cross(axis) for axis in axes]
+        else:
+            candidates = [(simplex.get(2) - a).cross(simplex.get(3) - a)]
+
+        for candidate in candidates:
+            if candidate.is_zero():
+                continue
+            if _grow(shape1, shape2, simplex, candidate) or \
+               _grow(shape1, shape2, simplex, -candidate):
+                break
+        else:
+            return False
+    return True
+
+def _grow(shape1, shape2, simplex, direction):
+    ''' Adds the support point in direction to the simplex, unless it
+        makes the simplex flat. Returns whether the point was added. '''
+    if not simplex.add(supports.support(shape1, shape2, direction), direction):
+        return False
+    coords, degenerate = barycentrics.SIMPLICES[simplex.get_size()](*simplex.get_all_points(0))
+    if degenerate:
+        simplex.remove(1)
+        return False
+    return True
+
+def gjk_distance(shape1, shape2, margin = None, tolerance = 1e-6,
+                 maxIterations = 32):
+    ''' Calculates the distance between two shapes that do not overlap,
+        and the closest points on them. It uses the same support points
+        as GJK, but keeps the simplex at the point of the Minkowski
+        Difference closest to the origin instead of trying to enclose it.
 
-def containsOrigin(simplex):
-    ''' Calculates wheter the simplex contains the origin or not.
+        Input:
+            *   shape1 and shape2 are Shape objects, as for GJK.
+            *   margin is optional; if it is given, the search stops as
+                soon as the distance is known to be larger than margin.
+            *   tolerance is the relative accuracy of the distance.
+        Output:
+            *   A tuple (distance, (point1, point2, normal)), where point1
+                and point2 are the closest points on shape1 and shape2 and
+                normal is the unit vector from point1 towards point2.
+                If the shapes overlap the distance is 0, and if it is
+                larger than margin a lower bound of it (also larger than
+                margin) is returned; in both cases without the points
+                and normal.
+    '''
+    assert isinstance(shape1, shapes.Shape), 'Input must be a Shape object'
+    assert isinstance(shape2, shapes.Shape), 'Input must be a Shape object'
+    assert margin is None or isinstance(margin, numbers.Number), \
+           'margin must be a number'
+
+    # Search towards shape2 first
+    direction = shape2.get_pos() - shape1.get_pos()
+    if direction.is_zero():
+        direction = vectors.Vector([1.0, 0.0, 0.0])
+
+    points = []     # Points in the Minkowski Difference
+    points1 = []    # Corresponding points in shape 1
+    points2 = []    # Corresponding points in shape 2
+    closest = None  # Closest point to the origin found so far
+    for i in range(maxIterations):
+        point, point1, point2 = supports.support(shape1, shape2, direction)
+
+        if closest is not None:
+            vv = closest.dot(closest)
+            vw = closest.dot(point)
+            if margin is not None and vw > 0 and vw*vw > margin*margin*vv:
+                # The distance is at least vw/|v|, more than the margin
+                return vw / math.sqrt(vv), (None, None, None)
+            if vv - vw <= tolerance * vv or point in points:
+                # The new point is no closer to the origin, done
+                break
+
+        points.append(point)
+        points1.append(point1)
+        points2.append(point2)
+
+        # Keep only the points needed to describe the closest point
+        coords, indices = barycentrics.signed_volumes(points)
+        points = [points[j] for j in indices]
+        points1 = [points1[j] for j in indices]
+        points2 = [points2[j] for j in indices]
+        closest = vectors.Vector(list(barycentrics.combine(points, coords, range(len(points)))))
+
+        if len(points) == 4 or closest.dot(closest) <= tolerance * tolerance:
+            # The origin is in the Minkowski Difference, they overlap
+            return 0.0, (None, None, None)
+
+        direction = -closest
+
+    indices = range(len(points))
+    point1 = vectors.Vector(list(barycentrics.combine(points1, coords, indices)))
+    point2 = vectors.Vector(list(barycentrics.combine(points2, coords, indices)))
+    distance = closest.norm()
+    normal = closest * (-1.0 / distance)
+    return distance, (point1, point2, normal)
+
+def EPA(shape1, shape2, simplex, tolerance = 0.0001, maxIterations = 32):
+    ''' Expanding Polytope Algorithm. Grows the tetrahedron that GJK found
+        around the origin into the Minkowski Difference, one support point
+        at a time, until the side of the polytope closest to the origin
+        is (within tolerance) on the edge of the Minkowski Difference.
 
         Input:
-            *   The simplex is a set of two to four points,
-                representing a line, triangle or tetrahedron.
+            *   simplex is a full Simplex that contains the origin.
+            *   After maxIterations expansions the closest side found so
+                far is used.
         Output:
-            *   The output is a tuple of a Boolean and a direction.
-                The Boolean represents whether or not the origin is
-                found in the simplex, and the direction indicates
-                in which direction to search for the origin in the
-                next iteration. 
+            *   A tuple (normal, depth, point1, point2), where normal is
+                the unit penetration normal (pointing from shape1 towards
+                shape2), depth the penetration depth, and point1 and
+                point2 the deepest points of each shape inside the other;
+                moving shape1 by -normal*depth separates the shapes.
+                None is returned if the simplex is flat.
     '''
+    assert isinstance(shape1, shapes.Shape), 'Input must be a Shape object'
+    assert isinstance(shape2, shapes.Shape), 'Input must be a Shape object'
     assert isinstance(simplex, simplices.Simplex), 'Input must be a Simplex object'
-    TOLERANCE = 0.00001     # If the origin is this close to a side
-                            # or line in the simplex, we call it a hit
-
-    # Get the last point added to the simplex
-    a = simplex.get(1)
-    
-    # Compute AO (same thing as -A)
-    ao = - a
-
-    if len(simplex.get_points()) == 4:
-        # It's the tetrahedon case
-
-        # Get b, c and d
-        b = simplex.get(2)
-        c = simplex.get(3)
-        d = simplex.get(4)
-
-        # Compute the edges.
-        # We only have to calculate some of them;
-        # some can be reused, some are not needed
-        ab = b - a
-        ac = c - a
-        ad = d - a
-
-        # Compute the normals
-        # Since we can't be sure the winding of the triangles (?),
-        # we do not yet know if these normals point "inwards" or "outwards"
-        abcNormal = ab.cross(ac)
-        abdNormal = ad.cross(ab)
-        acdNormal = ac.cross(ad)
-
-        # Make sure the normals are in the right direction
-        abcNormal *= -abcNormal.dot(ad)
-        abdNormal *= -abdNormal.dot(ac)
-        acdNormal *= -acdNormal.dot(ab)
-
-        # Check where the origin is
-        if abcNormal.dot(ao) > 0:
-            # The origin is in R1
-            # Remove point d
-            simplex.remove(4)
-            # Set new direction to abcNormal
-            direction = abcNormal
-        elif abdNormal.dot(ao) > 0:
-            # The origin is in R2
-            # Remove point c
-            simplex.remove(3)
-            # Set new direction to abdNormal
-            direction = abdNormal
-        elif acdNormal.dot(ao) > 0:
-            # The origin is in R3
-            # Remove point b
-            simplex.remove(2)
-            # Set new direction to acdNormal
-            direction = acdNormal
-        else:
-            # The origin is in R5, collision is confirmed
-            return True, None
-
-    elif len(simplex.get_points()) == 3:
-        # Then it's the triangle case
-        
-        # Get b and c
-        b = simplex.get(2)
-        c = simplex.get(3)
+    assert simplex.get_size() == 4, 'EPA needs a full simplex'
+
+    vertices = simplex.get_points()
+    points = [vertex[0] for vertex in vertices]
+    # The centre of the tetrahedron stays inside the polytope as it grows
+    inside = (points[0] + points[1] + points[2] + points[3]) * 0.25
+
+    faces = []
+    for i, j, k in ((0, 1, 2), (0, 3, 1), (0, 2, 3), (1, 3, 2)):
+        face = _epa_face(points, i, j, k, inside)
+        if face is None:
+            # Flat tetrahedron, the origin is on its surface
+            return None
+        faces.append(face)
+
+    for iteration in range(maxIterations):
+        nearest = min(range(len(faces)), key = lambda n: faces[n][4])
+        closest = faces[nearest]
+        normal = closest[3]
+        distance = closest[4]
+
+        vertex = supports.support(shape1, shape2, normal)
+        point = vertex[0]
+        if point.dot(normal) - distance < tolerance or point in points:
+            # The closest side is on the edge, done
+            break
+
+        # Remove the sides that the new point can see, spreading out
+        # from the closest one, and collect the edges of the hole they
+        # leave. Sides with the point in their plane are removed too, or
+        # the sides covering the hole could overlap them and the
+        # polytope would no longer be convex.
+        flat = 1e-9 * max(1.0, abs(point.dot(normal)))
+        owners = {}
+        for n, face in enumerate(faces):
+            owners[(face[0], face[1])] = owners[(face[1], face[2])] = \
+                owners[(face[2], face[0])] = n
+        removed = set([nearest])
+        stack = [nearest]
+        edges = []
+        while stack:
+            face = faces[stack.pop()]
+            for edge in ((face[0], face[1]), (face[1], face[2]),
+                         (face[2], face[0])):
+                n = owners.get((edge[1], edge[0]))
+                if n in removed:
+                    # Shared by two removed sides, not on the hole
+                    continue
+                if n is not None and faces[n][3].dot(point) - faces[n][4] > -flat:
+                    removed.add(n)
+                    stack.append(n)
+                else:
+                    edges.append(edge)
+        kept = [face for n, face in enumerate(faces) if n not in removed]
+
+        # Cover the hole with sides from its edges to the new point
+        index = len(points)
+        points.append(point)
+        vertices.append(vertex)
+        newFaces = [_epa_face(points, i, j, index, inside) for i, j in edges]
+        if not edges or None in newFaces:
+            # Numerically stuck, keep the closest side found
+            break
+        faces = kept + newFaces
+
+    # The projection of the origin on the closest side gives the contact
+    i, j, k = closest[:3]
+    coords, degenerate = barycentrics.triangle(points[i], points[j], points[k])
+    point1 = vectors.Vector(list(barycentrics.combine(
+        [vertices[i][1], vertices[j][1], vertices[k][1]], coords, (0, 1, 2))))
+    point2 = vectors.Vector(list(barycentrics.combine(
+        [vertices[i][2], vertices[j][2], vertices[k][2]], coords, (0, 1, 2))))
+    return normal, max(distance, 0.0), point1, point2
+
+def _epa_face(points, i, j, k, inside):
+    ''' Returns the side [i, j, k, normal, distance] of the polytope, with
+        the normal pointing away from the point inside, or None if the
+        side has no area. '''
+    a = points[i]
+    normal = (points[j] - a).cross(points[k] - a)
+    length = normal.norm()
+    if length < 1e-12:
+        return None
+    normal *= 1.0 / length
+    if normal.dot(a - inside) < 0:
+        # Wrong winding, turn the side around
+        normal = -normal
+        j, k = k, j
+    return [i, j, k, normal, normal.dot(a)]
+
+def MPR(shape1, shape2, tolerance = 0.0001, maxIterations = 32):
+    ''' Minkowski Portal Refinement (XenoCollide). Casts a ray from a
+        point inside the Minkowski Difference (the difference of the
+        centres) towards the origin, and finds the triangle (portal) of
+        support points that the ray passes through. The portal is then
+        refined towards the edge of the Minkowski Difference; the shapes
+        have collided if the origin is on the inner side of it.
+
+        It uses the same support points as GJK, but usually fewer of
+        them, and gives the normal where the ray leaves the Minkowski
+        Difference instead of the direction of least penetration. That
+        is close enough for collision responses.
 
-        # Compute the edges
-        ab = b - a
-        ac = c - a
+        Input:
+            *   shape1 and shape2 are Shape objects, as for GJK.
+            *   The portal is refined until it is within tolerance of the
+                edge, for at most maxIterations support points.
+        Output:
+            *   The same as for GJK: True if the shapes have collided
+                (False if not, None if it could not be determined), and
+                a tuple of the collision point, the penetration normal
+                (pointing from shape1 towards shape2) and the penetration
+                depth.
+    '''
+    assert isinstance(shape1, shapes.Shape), 'Input must be a Shape object'
+    assert isinstance(shape2, shapes.Shape), 'Input must be a Shape object'
 
-        # Get the normal to the surface in the direction of the origin
-        normal = ab.cross(ac)
-        normal *= normal.dot(ao)
-        
-        # If the origin lies in the same plane as abc, check if it lies
-        # on abc, if so, consider it a hit.
-        if normal.norm() < TOLERANCE:
-            # Calculate the normals of ab and ac.
-            abPerp = ac.triple_product_2(ab, ab)
-            acPerp = ab.triple_product_2(ac, ac)
-
-            # Check where the origin is
-            if abPerp.dot(ao) > 0:
-                # The origin is in R1
-                # Remove c
-                simplex.remove(3)
-                # Set new direction to abPerp
-                direction = abPerp
-            elif acPerp.dot(ao) > 0:
-                # The origin is in R2
-                # Remove b
-                simplex.remove(2)
-                # Set new direction to acPerp
-                direction = acPerp
-            else:
-                # The origin is in R3, collision confirmed
-                # The origin is in the simplex, return a normal to
-                # be able to build the full tetrahedron and an empty
-                # string to force it to continue
-                # TODO: Ugly solution, fix?
-                return '', ab.cross(ac)
-        # Otherwise, set the new direction to normal
+    # A point deep inside the Minkowski Difference
+    v0 = (shape1.get_pos() - shape2.get_pos(), None, None)
+    if v0[0].is_zero():
+        # Any direction will do, but the ray needs one
+        v0 = (vectors.Vector([0.00001, 0.0, 0.0]), None, None)
+
+    # Find a portal that the ray from v0 through the origin passes
+    direction = -v0[0]
+    v1 = supports.support(shape1, shape2, direction)
+    if v1[0].dot(direction) <= 0:
+        return False, (None, None, None)
+
+    direction = v1[0].cross(v0[0])
+    if direction.dot(direction) <= TOLERANCE * TOLERANCE * \
+                                   v1[0].dot(v1[0]) * v0[0].dot(v0[0]):
+        # The origin is on the line through v0 and v1
+        normal = (v1[0] - v0[0]).normalize()
+        return True, ((v1[1] + v1[2]) * 0.5, normal, max(v1[0].dot(normal), 0.0))
+
+    v2 = supports.support(shape1, shape2, direction)
+    if v2[0].dot(direction) <= 0:
+        return False, (None, None, None)
+
+    # Wind the portal so that its normal points away from v0
+    direction = (v1[0] - v0[0]).cross(v2[0] - v0[0])
+    if direction.dot(v0[0]) > 0:
+        v1, v2 = v2, v1
+        direction = -direction
+
+    iterations = 0
+    while True:
+        iterations += 1
+        if iterations > maxIterations:
+            return undetermined(shape1, shape2)
+        v3 = supports.support(shape1, shape2, direction)
+        if v3[0].dot(direction) <= 0:
+            return False, (None, None, None)
+        if v1[0].cross(v3[0]).dot(v0[0]) < 0:
+            # The origin is outside the side (v0, v1, v3), drop v2
+            v2 = v3
+            direction = (v1[0] - v0[0]).cross(v3[0] - v0[0])
+        elif v3[0].cross(v2[0]).dot(v0[0]) < 0:
+            # The origin is outside the side (v0, v3, v2), drop v1
+            v1 = v3
+            direction = (v3[0] - v0[0]).cross(v2[0] - v0[0])
         else:
-            direction = normal
-
-    else:
-        # Then it's the line segment case
-        b = simplex.get(2)
-
-        # Compute AB
-        ab = b - a
+            break
 
-        if ab.dot(ao) < 0:
-            simplex.remove(2)
-            direction = ao
+    # Refine the portal until it is on the edge of the Minkowski Difference
+    collided = False
+    while True:
+        edge1 = v2[0] - v1[0]
+        edge2 = v3[0] - v1[0]
+        normal = edge1.cross(edge2)
+        if normal.dot(normal) <= TOLERANCE * TOLERANCE * \
+                                 edge1.dot(edge1) * edge2.dot(edge2):
+            # The portal has no area, the origin is on it
+            return True, _mpr_contact(v1, v2, v3, v1[0] - v0[0], 0.0)
+        normal = normal.normalize()
+
+        # Past the portal, seen from v0, is the origin inside?
+        if normal.dot(v1[0]) >= 0:
+            collided = True
+
+        v4 = supports.support(shape1, shape2, normal)
+        if v4[0].dot(normal) <= 0:
+            # The origin is outside the support plane
+            return False, (None, None, None)
+        iterations += 1
+        if (v4[0] - v3[0]).dot(normal) <= tolerance or iterations > maxIterations:
+            # The portal is as close to the edge as it gets
+            if not collided:
+                if iterations > maxIterations:
+                    return undetermined(shape1, shape2)
+                return False, (None, None, None)
+            return True, _mpr_contact(v1, v2, v3, normal, normal.dot(v1[0]))
+
+        # Replace the point of the portal that is on the same side
+        # of the plane through v0, v4 and the origin as v4 is not
+        if v4[0].cross(v1[0]).dot(v0[0]) < 0:
+            if v4[0].cross(v2[0]).dot(v0[0]) < 0:
+                v1 = v4
+            else:
+                v3 = v4
         else:
-            # Get the perp to AB in the direction of the origin
-            abPerp = ab.triple_product_2(ao, ab)
-            # If the origin lies on the same line as ab,
-            # check if it lies on ab, if so, consider it a hit.
-            if abPerp.norm() < TOLERANCE:
-                # The origin is on the line, collision confirmed
-
-                # The origin is in the simplex, return a normal to
-                # be able to build the full tetrahedron and an empty
-                # string to force it to continue
-                # TODO: Ugly solution, fix?
-                if ab.dot(vectors.Vector([1.0, 0.0, 0.0])) - ab.norm() < TOLERANCE:
-                    return '', vectors.Vector([0.0, 1.0, 0.0])
-                else:
-                    return '', vectors.Vector([1.0, 0.0, 0.0])
-            
-            # Otherwise set the direction to abPerp
+            if v4[0].cross(v3[0]).dot(v0[0]) < 0:
+                v2 = v4
             else:
-                direction = abPerp
-    assert isinstance(direction, vectors.Vector), 'Direction must be a vector'
-    return False, direction
+                v1 = v4
+
+def _mpr_contact(v1, v2, v3, normal, depth):
+    ''' Returns the collision information of the MPR portal (v1, v2, v3):
+        the collision point is midway between the points of the shapes
+        at the projection of the origin on the portal. '''
+    coords, degenerate = barycentrics.triangle(v1[0], v2[0], v3[0])
+    if degenerate:
+        coords = (1.0, 0.0, 0.0)
+    indices = (0, 1, 2)
+    point1 = vectors.Vector(list(barycentrics.combine([v1[1], v2[1], v3[1]], coords, indices)))
+    point2 = vectors.Vector(list(barycentrics.combine([v1[2], v2[2], v3[2]], coords, indices)))
+    return (point1 + point2) * 0.5, normal.normalize(), max(depth, 0.0)
 
 def pointOfCollision(simplex):
     ''' Returns the point in the shapes that represents the point of collision.
@@ -230,7 +599,7 @@ def pointOfCollision(simplex):
         are closest to eachother. This is a pretty rough approximation, but
         could be sufficient for our needs. '''
     assert isinstance(simplex, simplices.Simplex), 'Input must be a Simplex'
-    assert len(simplex.get_points()) == 4, 'Terminated without full simplex'
+    assert simplex.get_size() == 4, 'Terminated without full simplex'
 
     # Get the points
     a = simplex.get(1)
@@ -291,33 +660,19 @@ def pointOfCollision_2(simplex):
     ''' Another approach to calculating the collision point, using
         baryocentric coordinates. '''
     assert isinstance(simplex, simplices.Simplex), 'Input must be a Simplex object'
-    assert len(simplex.get_points()) == 4, 'Terminated without full simplex'
+    assert simplex.get_size() == 4, 'Terminated without full simplex'
     #points in the minkowski simplex
     simpPoints = simplex.get_all_points(0)
     #points in the simplex of shape 1
     aPoints = simplex.get_all_points(1)
-    #points in the simplex of shape 2
-    bPoints = simplex.get_all_points(2)
-
-    # create a matrix 
-    matrix = [[1.0]*len(simpPoints)]
-    vecs = []
-    for vector in simpPoints:
-        value = vector.value
-        vecs.append(value)
-    for i in range(len(vecs[0])):
-        outvec = []
-        for j in range(len(vecs)):
-            outvec.append(vecs[j][i])
-        matrix.append(outvec)
-            
 
-    barCoord = gauss.solve(matrix, [1.0, 0.0, 0.0, 0.0])
-    if barCoord:
+    # The origin in barycentric coordinates of the Minkowski simplex
+    barCoord, degenerate = barycentrics.tetrahedron(*simpPoints)
+    if not degenerate:
         collisionPoint = vectors.Vector()
 
         for i in range(len(aPoints)):
-            collisionPoint += aPoints[i]*barCoord[i]
+            collisionPoint.add_scaled(aPoints[i], barCoord[i])
         assert isinstance(collisionPoint, vectors.Vector), 'CollisionPoint must be a vector'
         return collisionPoint
     else:
@@ -328,38 +683,18 @@ def normal_and_depth(shape1, shape2, collisionPoint):
     assert isinstance(shape2, shapes.Shape), 'Input must be a shape object'
     assert isinstance(collisionPoint, vectors.Vector), 'Input must be a vector'
 
-    name1 = shape1.__class__.__name__
-    name2 = shape2.__class__.__name__
-
-    # NOTE: Very specific, and a little redundant, but should be sufficient for our needs
-    # The bottom line is that the normals that we get from Surface objects are preferred,
-    # number two are the ones from Cube objects and last the ones from Sphere objects.
-    # (The ones from the sphere isn't very reliable, I've tested it in the physics engine
-    # and got very poor results)
-
-    if name1 == 'Surface':
-        penetrationNormal, penetrationDepth = \
-                           surface_normal_and_depth(shape1, shape2, collisionPoint)
-    elif name2 == 'Surface':
-        penetrationNormal, penetrationDepth = \
-                           surface_normal_and_depth(shape2, shape1, collisionPoint)
-
-    elif name1 == 'Cube':
-        penetrationNormal, penetrationDepth = \
-                           cube_normal_and_depth(shape1, shape2, collisionPoint)
-    elif name2 == 'Cube':
-        penetrationNormal, penetrationDepth = \
-                           cube_normal_and_depth(shape2, shape1, collisionPoint)
-
-    elif name1 == 'Sphere':
-        penetrationNormal, penetrationDepth = \
-                           sphere_normal_and_depth(shape1, shape2, collisionPoint)
-    elif name2 == 'Sphere':
+    # The query for each pair of shape types is found in NORMAL_AND_DEPTH,
+    # see register_normal_and_depth
+    entry = NORMAL_AND_DEPTH.get((type(shape1), type(shape2)))
+    if entry is None:
+        raise Exception('Unknown shape used in collision')
+    function, swapped = entry
+    if swapped:
         penetrationNormal, penetrationDepth = \
-                           sphere_normal_and_depth(shape2, shape1, collisionPoint)
-
+                           function(shape2, shape1, collisionPoint)
     else:
-        raise Exception('Unknown shape used in collision')
+        penetrationNormal, penetrationDepth = \
+                           function(shape1, shape2, collisionPoint)
 
     assert isinstance(penetrationNormal, vectors.Vector), \
                    'penetrationNormal must be a vector'
@@ -372,11 +707,9 @@ def normal_and_depth(shape1, shape2, collisionPoint):
 def surface_normal_and_depth(shape1, shape2, collisionPoint):
     assert isinstance(shape1, shapes.Surface), 'Shape1 must be a surface object'
     assert isinstance(shape2, shapes.Shape), 'Input must be a shape object'
-    assert shape2.__class__.__name__ != 'Surface', \
+    assert not isinstance(shape2, shapes.Surface), \
            'Surfaces can not be checked for collision with other surfaces'
-    name1 = shape1.__class__.__name__
-    name2 = shape2.__class__.__name__
-    
+
     pos = shape2.get_pos()
     points = shape1.get_points()
     a = points[0]
@@ -388,7 +721,8 @@ def surface_normal_and_depth(shape1, shape2, collisionPoint):
         penetrationNormal = shape1.get_normal(collisionPoint)
         if penetrationNormal.dot(pos) < 0:
             # It's pointing the wrong way
-            penetrationNormal *= -1.0
+            # (not flipped in place, it's the surface's own normal)
+            penetrationNormal = -penetrationNormal
         # TODO: Make generic "get distance to edge"-function for all entities
         
     else:
@@ -396,15 +730,8 @@ def surface_normal_and_depth(shape1, shape2, collisionPoint):
         # so we choosde the one from shape2
         penetrationNormal = shape2.get_normal(collisionPoint)
 
-    # TODO: Make generic "get distance to edge"-function for all entities
-    if name2 == 'Cube':
-        side = shape2.get_side()
-    elif name2 == 'Sphere':
-        side = shape2.get_radius()*2.0
-    else:                 
-        raise Exception('Unknown shape used in collision')
-    
-    penetrationDepth = side/2.0 - (pos - collisionPoint).projected(penetrationNormal).norm()
+    penetrationDepth = half_extent(shape2) - \
+                       (pos - collisionPoint).projected(penetrationNormal).norm()
 
     assert isinstance(penetrationNormal, vectors.Vector), \
            'penetrationNormal must be a vector'
@@ -418,9 +745,6 @@ def cube_normal_and_depth(shape1, shape2, collisionPoint):
     assert isinstance(shape1, shapes.Cube), 'Shape1 must be a cube object'
     assert isinstance(shape2, shapes.Shape), 'Input must be a shape object'
 
-    name1 = shape1.__class__.__name__
-    name2 = shape2.__class__.__name__
-
     dist = shape1.get_pos() - shape2.get_pos()
     halfside = shape1.get_side()/2.0
 
@@ -453,15 +777,9 @@ def cube_normal_and_depth(shape1, shape2, collisionPoint):
         # so we choose the one from shape2
         penetrationNormal = shape2.get_normal(collisionPoint)
         #print 'Normal (on cube edge):', penetrationNormal.value
-        
-        if name2 == 'Cube':
-            side = shape2.get_side()
-        elif name2 == 'Sphere':
-            side = shape2.get_radius()*2
-        else:                 
-            raise Exception('Unknown shape used in collision')
-        
-        penetrationDepth = side/2.0 - (shape2.get_pos() - collisionPoint).projected(penetrationNormal).norm()
+
+        penetrationDepth = half_extent(shape2) - \
+                           (shape2.get_pos() - collisionPoint).projected(penetrationNormal).norm()
 
         # Hack to avoid small negative penetration depths due to rounding errors
         if penetrationDepth < 0.0:
@@ -471,7 +789,7 @@ def cube_normal_and_depth(shape1, shape2, collisionPoint):
                 raise Exception('Negative penetration depth')
 
         #print 'Other info:'
-        #print '\tSide/2:', side/2.0
+        #print '\tHalf extent:', half_extent(shape2)
         #print '\tPosition:', shape2.get_pos().value
         #print '\tCollisionPoint:', collisionPoint.value
         #print '\tPenetrationDepth:', penetrationDepth
@@ -501,3 +819,78 @@ def sphere_normal_and_depth(shape1, shape2, collisionPoint):
 
     return penetrationNormal, penetrationDepth
 
+def polyhedron_normal_and_depth(shape1, shape2, collisionPoint):
+    assert isinstance(shape1, shapes.Polyhedron), 'Shape1 must be a polyhedron object'
+    assert isinstance(shape2, shapes.Shape), 'Input must be a shape object'
+
+    # The closest face of the polyhedron; its support point in the
+    # direction of the normal lies in the plane of the face
+    penetrationNormal = shape1.get_normal(collisionPoint)
+    penetrationDepth = (shape1.support_func(penetrationNormal) -
+                        collisionPoint).dot(penetrationNormal)
+    # Points just outside of the face, from rounding errors, touch it
+    penetrationDepth = max(penetrationDepth, 0.0)
+
+    assert isinstance(penetrationNormal, vectors.Vector), \
+           'penetrationNormal must be a vector'
+    assert isinstance(penetrationDepth, numbers.Number), \
+           'penetrationDepth must be a number'
+
+    return penetrationNormal, penetrationDepth
+
+# Normal and depth queries for pairs of shape types, as a function and
+# whether it takes the shapes in swapped order
+NORMAL_AND_DEPTH = {}
+
+def register_normal_and_depth(type1, type2, function):
+    ''' Makes normal_and_depth use function(shape1, shape2, collisionPoint)
+        for a shape of type1 against one of type2, and for the pair in
+        the other order (with the shapes swapped) unless that pair is
+        registered on its own. '''
+    assert issubclass(type1, shapes.Shape), 'Type1 must be a Shape class'
+    assert issubclass(type2, shapes.Shape), 'Type2 must be a Shape class'
+    NORMAL_AND_DEPTH[(type1, type2)] = (function, False)
+    reverse = NORMAL_AND_DEPTH.get((type2, type1))
+    if reverse is None or reverse[1]:
+        NORMAL_AND_DEPTH[(type2, type1)] = (function, True)
+
+# Distance from the centre of a shape to its surface, by shape type
+EXTENTS = {}
+
+def register_extent(shapeType, function):
+    ''' Makes half_extent use function(shape) for shapes of shapeType '''
+    assert issubclass(shapeType, shapes.Shape), 'ShapeType must be a Shape class'
+    EXTENTS[shapeType] = function
+
+def half_extent(shape):
+    ''' Returns the distance from the centre of the shape to its surface
+        (the radius of a sphere and half the side of a cube) '''
+    assert isinstance(shape, shapes.Shape), 'Input must be a shape object'
+    function = EXTENTS.get(type(shape))
+    if function is None:
+        raise Exception('Unknown shape used in collision')
+    extent = function(shape)
+    assert isinstance(extent, numbers.Number), 'Extent must be a number'
+    return extent
+
+# The normals from Surface objects are preferred, number two are the ones
+# from Cube objects, then the ones from Polyhedron objects and last the
+# ones from Sphere objects. (The ones from the sphere aren't very
+# reliable, I've tested them in the physics engine and got very poor
+# results.) A pair registered in its own order is kept over the reverse
+# of another registration.
+register_normal_and_depth(shapes.Surface, shapes.Cube, surface_normal_and_depth)
+register_normal_and_depth(shapes.Surface, shapes.Polyhedron, surface_normal_and_depth)
+register_normal_and_depth(shapes.Surface, shapes.Sphere, surface_normal_and_depth)
+register_normal_and_depth(shapes.Cube, shapes.Cube, cube_normal_and_depth)
+register_normal_and_depth(shapes.Cube, shapes.Polyhedron, cube_normal_and_depth)
+register_normal_and_depth(shapes.Cube, shapes.Sphere, cube_normal_and_depth)
+register_normal_and_depth(shapes.Polyhedron, shapes.Polyhedron, polyhedron_normal_and_depth)
+register_normal_and_depth(shapes.Polyhedron, shapes.Sphere, polyhedron_normal_and_depth)
+register_normal_and_depth(shapes.Sphere, shapes.Sphere, sphere_normal_and_depth)
+
+register_extent(shapes.Sphere, lambda sphere: sphere.get_radius())
+register_extent(shapes.Cube, lambda cube: cube.get_side() / 2.0)
+# The farthest corner; a Polyhedron has no single distance to its surface
+register_extent(shapes.Polyhedron,
+                lambda polyhedron: max(point.norm() for point in polyhedron.get_points()))
@@ -48,6 +48,17 @@ def plane(plane):
         glVertex3fv(point.value)
     glEnd()
 
+def polyhedron(polyhedron):
+    assert isinstance(polyhedron, shapes.Polyhedron), \
+           'Input must be a Polyhedron object'
+    points = polyhedron.get_points()
+    glColor3fv(polyhedron.get_color())
+    glBegin(GL_TRIANGLES)
+    for face in polyhedron.get_hull().get_faces():
+        for vert in face:
+            glVertex3fv(points[vert].value)
+    glEnd()
+
 def sphere(sphere):
     assert isinstance(sphere, shapes.Sphere), 'Input must be a sphere object'
     glColor3fv(sphere.get_color())
@@ -1,3 +1,5 @@
+import numpy
+
 def gauss_jordan(m, eps = 1.0/(10**10)):
   """Puts given matrix (2D array) into the Reduced Row Echelon Form.
      Returns True if successful, False if 'm' is singular.
@@ -53,3 +55,142 @@ def zeros( s , zero=0):
     :param zero: the value to use to fill the matrix (by default it's zero )
     """
     return [zeros(s[1:] ) for i in range(s[0] ) ] if not len(s) else zero
+
+def solve_many(Ms, bs, eps = 1.0/(10**10)):
+  """
+  solves Ms[k]*x[k] = bs[k] for all k at once
+  return (x, ok), where ok[k] is False if Ms[k] is singular (x[k] is then zero)
+  :param Ms: the matrices, an array of shape (K, n, n)
+  :param bs: the right hand sides, an array of shape (K, n) or (K, n, m)
+  :param eps: the smallest determinant, relative to the product of the
+    lengths of the rows, of a matrix that is not treated as singular
+  """
+  Ms = numpy.asarray(Ms, dtype = numpy.float64)
+  bs = numpy.asarray(bs, dtype = numpy.float64)
+  vector = bs.ndim == 2
+  if vector:
+    bs = bs[:, :, numpy.newaxis]
+  n = Ms.shape[1]
+  if n in _CLOSED_FORM:
+    Minv, ok = _CLOSED_FORM[n](Ms, eps)
+    x = numpy.einsum('kij,kjm->kim', Minv, bs)
+  else:
+    x, ok = _gauss_jordan_many(numpy.concatenate((Ms, bs), axis = 2), n, eps)
+  return (x[:, :, 0] if vector else x), ok
+
+def inv_many(Ms, eps = 1.0/(10**10)):
+  """
+  return (Minv, ok), the inverses of all the matrices Ms[k] at once,
+  where ok[k] is False if Ms[k] is singular (Minv[k] is then zero)
+  :param Ms: the matrices, an array of shape (K, n, n)
+  :param eps: the smallest determinant, relative to the product of the
+    lengths of the rows, of a matrix that is not treated as singular
+  """
+  Ms = numpy.asarray(Ms, dtype = numpy.float64)
+  (K, n) = Ms.shape[:2]
+  if n in _CLOSED_FORM:
+    return _CLOSED_FORM[n](Ms, eps)
+  identity = numpy.broadcast_to(numpy.eye(n), (K, n, n))
+  return _gauss_jordan_many(numpy.concatenate((Ms, identity), axis = 2), n, eps)
+
+def _gauss_jordan_many(m, n, eps):
+  """Gauss-Jordan elimination with partial pivoting on the stacked
+     augmented matrices m (K, n, w), all of them in each step.
+     Returns the last w-n columns of the reduced matrices and which
+     of them were regular; the size of the determinant is the product
+     of the pivots."""
+  K = m.shape[0]
+  items = numpy.arange(K)
+  lengths = _row_lengths(m[:, :, :n])
+  det = numpy.ones(K)
+  for y in range(n):
+    maxrow = y + numpy.argmax(abs(m[:, y:, y]), axis = 1)   # Find max pivot
+    row = m[items, maxrow].copy()
+    m[items, maxrow] = m[:, y]
+    m[:, y] = row
+    pivot = m[:, y, y]
+    det *= abs(pivot)
+    singular = pivot == 0.0           # Singular, skip the division
+    m[:, y] /= numpy.where(singular, 1.0, pivot)[:, numpy.newaxis]
+    c = m[:, :, y].copy()             # Eliminate column y in all other rows
+    c[:, y] = 0.0
+    m -= c[:, :, numpy.newaxis] * m[:, y, numpy.newaxis, :]
+  ok = _regular(det, lengths, eps)
+  out = m[:, :, n:]
+  out[~ok] = 0.0
+  return out, ok
+
+def _inv_3x3(M, eps):
+  """Inverts 3x3 matrices with the adjugate: the columns of the
+     inverse are the cross products of the rows over the determinant."""
+  r0 = M[:, 0]
+  r1 = M[:, 1]
+  r2 = M[:, 2]
+  adj = numpy.empty_like(M)
+  adj[:, :, 0] = numpy.cross(r1, r2)
+  adj[:, :, 1] = numpy.cross(r2, r0)
+  adj[:, :, 2] = numpy.cross(r0, r1)
+  det = numpy.einsum('ij,ij->i', r0, adj[:, :, 0])
+  return _divide(adj, det, _regular(det, _row_lengths(M), eps))
+
+def _inv_4x4(M, eps):
+  """Inverts 4x4 matrices with the adjugate, built from the 2x2
+     subdeterminants of the upper and lower two rows."""
+  (a00, a01, a02, a03) = (M[:, 0, 0], M[:, 0, 1], M[:, 0, 2], M[:, 0, 3])
+  (a10, a11, a12, a13) = (M[:, 1, 0], M[:, 1, 1], M[:, 1, 2], M[:, 1, 3])
+  (a20, a21, a22, a23) = (M[:, 2, 0], M[:, 2, 1], M[:, 2, 2], M[:, 2, 3])
+  (a30, a31, a32, a33) = (M[:, 3, 0], M[:, 3, 1], M[:, 3, 2], M[:, 3, 3])
+
+  s0 = a00*a11 - a10*a01
+  s1 = a00*a12 - a10*a02
+  s2 = a00*a13 - a10*a03
+  s3 = a01*a12 - a11*a02
+  s4 = a01*a13 - a11*a03
+  s5 = a02*a13 - a12*a03
+
+  c0 = a20*a31 - a30*a21
+  c1 = a20*a32 - a30*a22
+  c2 = a20*a33 - a30*a23
+  c3 = a21*a32 - a31*a22
+  c4 = a21*a33 - a31*a23
+  c5 = a22*a33 - a32*a23
+
+  det = s0*c5 - s1*c4 + s2*c3 + s3*c2 - s4*c1 + s5*c0
+
+  adj = numpy.empty_like(M)
+  adj[:, 0, 0] =  a11*c5 - a12*c4 + a13*c3
+  adj[:, 0, 1] = -a01*c5 + a02*c4 - a03*c3
+  adj[:, 0, 2] =  a31*s5 - a32*s4 + a33*s3
+  adj[:, 0, 3] = -a21*s5 + a22*s4 - a23*s3
+  adj[:, 1, 0] = -a10*c5 + a12*c2 - a13*c1
+  adj[:, 1, 1] =  a00*c5 - a02*c2 + a03*c1
+  adj[:, 1, 2] = -a30*s5 + a32*s2 - a33*s1
+  adj[:, 1, 3] =  a20*s5 - a22*s2 + a23*s1
+  adj[:, 2, 0] =  a10*c4 - a11*c2 + a13*c0
+  adj[:, 2, 1] = -a00*c4 + a01*c2 - a03*c0
+  adj[:, 2, 2] =  a30*s4 - a31*s2 + a33*s0
+  adj[:, 2, 3] = -a20*s4 + a21*s2 - a23*s0
+  adj[:, 3, 0] = -a10*c3 + a11*c1 - a12*c0
+  adj[:, 3, 1] =  a00*c3 - a01*c1 + a02*c0
+  adj[:, 3, 2] = -a30*s3 + a31*s1 - a32*s0
+  adj[:, 3, 3] =  a20*s3 - a21*s1 + a22*s0
+  return _divide(adj, det, _regular(det, _row_lengths(M), eps))
+
+def _row_lengths(M):
+  """The products of the lengths of the rows of the matrices M."""
+  return numpy.sqrt(numpy.einsum('kij,kij->ki', M, M)).prod(axis = 1)
+
+def _regular(det, lengths, eps):
+  """Which matrices are regular, given their determinants and the
+     products of their row lengths. The determinant is at most that
+     product (Hadamard), so the ratio does not depend on the scale of
+     the matrix, and the same test holds for every path."""
+  return abs(det) > eps * lengths
+
+def _divide(adj, det, ok):
+  """Divides the adjugates by their determinants, zeroing the
+     singular ones. Returns (Minv, ok)."""
+  scale = numpy.where(ok, 1.0 / numpy.where(ok, det, 1.0), 0.0)
+  return adj * scale[:, numpy.newaxis, numpy.newaxis], ok
+
+_CLOSED_FORM = {3: _inv_3x3, 4: _inv_4x4}
@@ -0,0 +1,86 @@
+# Batched integrators for the bodies in a RigidBodyStore
+
+import numpy
+
+SEMI_IMPLICIT_EULER = 'semi_implicit_euler'
+VELOCITY_VERLET = 'velocity_verlet'
+RK2 = 'rk2'
+
+def integrate(store, acceleration, dt, indices = None,
+              scheme = SEMI_IMPLICIT_EULER):
+    ''' Advances the given bodies in store (all of them if indices is
+        None) by the timestep dt, using the chosen scheme for the linear
+        motion. The orientations are advanced with the angular
+        velocities afterwards.
+
+        Input:
+            *   acceleration is either a constant acceleration, such as
+                gravity, given as three numbers, or a function
+                acceleration(positions, velocities) that takes (k, 3)
+                arrays of the bodies being integrated and returns their
+                accelerations.
+            *   scheme is SEMI_IMPLICIT_EULER, VELOCITY_VERLET or RK2.
+            *   The indices must be unique.
+    '''
+    assert scheme in SCHEMES, 'Unknown integration scheme'
+    assert dt > 0, 'The timestep must be positive'
+
+    rows = store.rows(indices)
+    positions = store.positions[rows]
+    velocities = store.velocities[rows]
+
+    positions, velocities = SCHEMES[scheme](positions, velocities,
+                                            _as_function(acceleration), dt)
+
+    store.positions[rows] = positions
+    store.velocities[rows] = velocities
+    store.orientations[rows] = integrate_orientations(store.orientations[rows],
+                                                      store.angularVelocities[rows],
+                                                      dt)
+
+def semi_implicit_euler(x, v, a, dt):
+    ''' Updates the velocity first and moves with the new velocity.'''
+    v = v + a(x, v) * dt
+    x = x + v * dt
+    return x, v
+
+def velocity_verlet(x, v, a, dt):
+    ''' Moves with the current velocity and acceleration, then updates
+        the velocity with the mean of the old and new acceleration.'''
+    a0 = a(x, v)
+    x = x + v * dt + a0 * (0.5 * dt * dt)
+    a1 = a(x, v + a0 * dt)
+    v = v + (a0 + a1) * (0.5 * dt)
+    return x, v
+
+def rk2(x, v, a, dt):
+    ''' Second order Runge-Kutta (midpoint method).'''
+    halfDt = 0.5 * dt
+    xMid = x + v * halfDt
+    vMid = v + a(x, v) * halfDt
+    x = x + vMid * dt
+    v = v + a(xMid, vMid) * dt
+    return x, v
+
+SCHEMES = {SEMI_IMPLICIT_EULER: semi_implicit_euler,
+           VELOCITY_VERLET: velocity_verlet,
+           RK2: rk2}
+
+def integrate_orientations(q, w, dt):
+    ''' Advances the (k, 4) quaternions q, given as [w, x, y, z], by the
+        (k, 3) angular velocities w during dt, using dq/dt = 0.5*(0, w)*q,
+        and normalizes them again. '''
+    qw = q[:, :1]
+    qv = q[:, 1:]
+    dw = -numpy.einsum('ij,ij->i', w, qv)[:, numpy.newaxis]
+    dv = w * qw + numpy.cross(w, qv)
+    out = q + numpy.hstack((dw, dv)) * (0.5 * dt)
+    return out / numpy.sqrt(numpy.einsum('ij,ij->i', out, out))[:, numpy.newaxis]
+
+def _as_function(acceleration):
+    ''' Returns acceleration as a function of the positions and
+        velocities. '''
+    if callable(acceleration):
+        return acceleration
+    constant = numpy.asarray(acceleration, dtype = numpy.float64)
+    return lambda x, v: constant
@@ -0,0 +1,175 @@
+# Sleeping bodies: objects that have come to rest are left out of the
+# physics, in islands of objects that touch each other
+
+import numpy
+
+# Bodies slower than these count as resting, in m/s and rad/s. Bodies
+# resting on each other still jitter by a few times gravity times the
+# timestep, up to about 0.25 m/s for a stack at the default timestep.
+LINEAR_THRESHOLD = 0.3
+ANGULAR_THRESHOLD = 0.3
+
+# How long a body must have rested before it may sleep, in seconds
+SLEEP_TIME = 0.5
+
+class Islands:
+    ''' Keeps track of which bodies rest and which sleep.
+
+        A body rests while its linear and angular speeds stay below the
+        thresholds, and counts how long it has done so over the steps.
+        The bodies that touched each other in a step form islands, and
+        an island falls asleep as a whole once all its bodies have
+        rested for sleepTime: their velocities are set to zero and the
+        physics leaves them alone. Bodies only touching the scene are
+        islands of their own, since the scene never moves.
+
+        The bodies of an island have rested only as long as the one
+        that rested the shortest, so a body carried by a moving one has
+        not rested at all, and will not sleep at once should it lose
+        its support.
+
+        A sleeping island is woken as a whole when an awake body touches
+        one of its bodies, when one of them is given a velocity from
+        outside, or when one of them leaves the game. Moving a sleeping
+        body by hand does not wake it; call wake() for that.
+
+        Entries are keyed by the shapes themselves. A sleepTime of
+        float('inf') keeps all bodies awake.
+    '''
+
+    def __init__(self, linearThreshold = LINEAR_THRESHOLD,
+                 angularThreshold = ANGULAR_THRESHOLD, sleepTime = SLEEP_TIME):
+        assert linearThreshold >= 0, 'linearThreshold must not be negative'
+        assert angularThreshold >= 0, 'angularThreshold must not be negative'
+        assert sleepTime > 0, 'sleepTime must be positive'
+        self._linear = linearThreshold
+        self._angular = angularThreshold
+        self._sleepTime = sleepTime
+        self._restTimes = {}    # Awake body -> how long it has rested
+        self._islandOf = {}     # Sleeping body -> the bodies of its island
+
+    def is_asleep(self, shape):
+        return shape in self._islandOf
+
+    def get_sleeping(self):
+        ''' Returns the sleeping bodies, in no particular order. '''
+        return self._islandOf.keys()
+
+    def wake(self, shape):
+        ''' Wakes the island of shape, if it sleeps. '''
+        island = self._islandOf.get(shape)
+        if island is None:
+            return
+        for item in island:
+            del self._islandOf[item]
+            self._restTimes[item] = 0.0
+
+    def partition(self, shapes):
+        ''' Splits the bodies in shapes into the awake and the sleeping
+            ones, both in the order of shapes. Islands that have been
+            given a velocity from outside, or have lost a body, are
+            woken first.
+
+            Output:
+                *   A tuple (awake, sleeping) of lists of shapes.
+        '''
+        sleeping = [shape for shape in shapes if shape in self._islandOf]
+        if len(sleeping) != len(self._islandOf):
+            # Some sleeping body has left the game
+            present = set(sleeping)
+            for shape in [shape for shape in self._islandOf if shape not in present]:
+                self.wake(shape)
+                self._restTimes.pop(shape, None)
+
+        if sleeping:
+            store = sleeping[0].get_store()
+            rows = [shape.get_index() for shape in sleeping]
+            pushed = numpy.flatnonzero(store.velocities[rows].any(axis = 1) |
+                                       store.angularVelocities[rows].any(axis = 1))
+            for k in pushed:
+                self.wake(sleeping[k])
+
+        awake = []
+        sleeping = []
+        for shape in shapes:
+            if shape in self._islandOf:
+                sleeping.append(shape)
+            else:
+                awake.append(shape)
+        return awake, sleeping
+
+    def update(self, shapes, touching, dt, pinned = []):
+        ''' Counts the rest of the awake bodies after a step of length dt
+            and puts the islands that have rested long enough to sleep.
+
+            Input:
+                *   shapes are the awake bodies that may sleep.
+                *   touching are the (shape1, shape2) pairs that touched
+                    in the step. Shapes in them that are neither in
+                    shapes nor in pinned are taken to be the scene.
+                *   pinned are bodies that never sleep, such as the
+                    player; islands touching them stay awake and start
+                    resting anew.
+        '''
+        if not shapes:
+            self._restTimes = {}
+            return
+
+        store = shapes[0].get_store()
+        rows = [shape.get_index() for shape in shapes]
+        velocities = store.velocities[rows]
+        angularVelocities = store.angularVelocities[rows]
+        resting = (numpy.einsum('ij,ij->i', velocities, velocities) <
+                   self._linear * self._linear) & \
+                  (numpy.einsum('ij,ij->i', angularVelocities, angularVelocities) <
+                   self._angular * self._angular)
+
+        # Only the bodies still in the game are kept
+        restTimes = {}
+        for shape, isResting in zip(shapes, resting.tolist()):
+            if isResting:
+                restTimes[shape] = self._restTimes.get(shape, 0.0) + dt
+            else:
+                restTimes[shape] = 0.0
+        self._restTimes = restTimes
+
+        # The islands, by union-find over the touching pairs
+        parent = dict((shape, shape) for shape in shapes)
+
+        def find(shape):
+            root = shape
+            while parent[root] is not root:
+                root = parent[root]
+            while parent[shape] is not root:
+                parent[shape], shape = root, parent[shape]
+            return root
+
+        pinnedRoots = []
+        for shape1, shape2 in touching:
+            if shape1 in parent and shape2 in parent:
+                parent[find(shape1)] = find(shape2)
+            elif shape1 in parent and shape2 in pinned:
+                pinnedRoots.append(shape1)
+            elif shape2 in parent and shape1 in pinned:
+                pinnedRoots.append(shape2)
+
+        islands = {}
+        for shape in shapes:
+            islands.setdefault(find(shape), []).append(shape)
+        for shape in pinnedRoots:
+            for item in islands.pop(find(shape), ()):
+                restTimes[item] = 0.0
+
+        for island in islands.itervalues():
+            restTime = min(restTimes[shape] for shape in island)
+            if restTime < self._sleepTime:
+                if len(island) > 1:
+                    for shape in island:
+                        restTimes[shape] = restTime
+                continue
+            rows = [shape.get_index() for shape in island]
+            store.velocities[rows] = 0.0
+            store.angularVelocities[rows] = 0.0
+            for shape in island:
+                self._islandOf[shape] = island
+                del restTimes[shape]
@@ -0,0 +1,395 @@
+# Narrow phase collision tests, with closed form tests for the pairs
+# that have one and GJK or MPR for all other convex pairs
+
+import vectors
+import collisions
+import shapes
+
+EPSILON = 1e-9
+
+# A separating axis only replaces a better placed one (a face normal of
+# cube1 over one of cube2, any face normal over an edge axis) if its
+# overlap is smaller than RELATIVE_TOLERANCE times the overlap of the
+# other, less ABSOLUTE_TOLERANCE times half the side of cube1
+RELATIVE_TOLERANCE = 0.98
+ABSOLUTE_TOLERANCE = 0.001
+
+# Edges closer to parallel than this (the sine of the angle) give no axis
+PARALLEL_TOLERANCE = 1e-6
+
+# The engines for the pairs without a closed form test
+GJK_ENGINE = 'gjk'      # GJK with EPA, the least penetration
+MPR_ENGINE = 'mpr'      # MPR, fewer support points
+
+def collide(shape1, shape2, cache = None, engine = GJK_ENGINE):
+    ''' Calculates whether shape1 has collided with shape2. The test is
+        chosen from the classes of the two shapes; pairs with a closed
+        form test in PAIRS use it, all other pairs use the engine named
+        in ENGINES for the pair, or else the given engine: GJK_ENGINE
+        (GJK with the optional PairCache cache) or MPR_ENGINE.
+
+        Output:
+            *   The same as for GJK: True if the shapes have collided
+                (False if not, None if it could not be told), and a tuple
+                of the collision point, the penetration normal (pointing
+                from shape1 towards shape2) and the penetration depth.
+    '''
+    assert isinstance(shape1, shapes.Shape), 'Input must be a Shape object'
+    assert isinstance(shape2, shapes.Shape), 'Input must be a Shape object'
+    assert engine in (GJK_ENGINE, MPR_ENGINE), 'Unknown narrow phase engine'
+
+    test = PAIRS.get((shape1.__class__, shape2.__class__))
+    if test is not None:
+        return test(shape1, shape2)
+
+    test = PAIRS.get((shape2.__class__, shape1.__class__))
+    if test is not None:
+        collided, (point, normal, depth) = test(shape2, shape1)
+        if collided:
+            normal = -normal
+        return collided, (point, normal, depth)
+
+    engine = ENGINES.get((shape1.__class__, shape2.__class__),
+                         ENGINES.get((shape2.__class__, shape1.__class__), engine))
+    if engine == MPR_ENGINE:
+        return collisions.MPR(shape1, shape2)
+    return collisions.GJK(shape1, shape2, cache)
+
+def contacts(shape1, shape2, cache = None, engine = GJK_ENGINE):
+    ''' Like collide, but returns all the contact points of the shapes:
+        a list of (point, normal, depth) tuples, the same as the
+        collision information of collide, that is empty if the shapes
+        have not collided. Pairs with a test in MANIFOLDS get up to four
+        points, all other pairs the single point of collide. '''
+    assert isinstance(shape1, shapes.Shape), 'Input must be a Shape object'
+    assert isinstance(shape2, shapes.Shape), 'Input must be a Shape object'
+
+    test = MANIFOLDS.get((shape1.__class__, shape2.__class__))
+    if test is not None:
+        return test(shape1, shape2)
+
+    test = MANIFOLDS.get((shape2.__class__, shape1.__class__))
+    if test is not None:
+        return [(point, -normal, depth) for point, normal, depth
+                in test(shape2, shape1)]
+
+    collided, collisionInfo = collide(shape1, shape2, cache, engine)
+    if collided:
+        return [collisionInfo]
+    return []
+
+def sphere_sphere(sphere1, sphere2):
+    ''' Collision test of two spheres '''
+    assert isinstance(sphere1, shapes.Sphere), 'Input must be a Sphere object'
+    assert isinstance(sphere2, shapes.Sphere), 'Input must be a Sphere object'
+    centre1 = sphere1.get_pos()
+    offset = sphere2.get_pos() - centre1
+    reach = sphere1.get_radius() + sphere2.get_radius()
+
+    distance = offset.norm()
+    if distance >= reach:
+        return False, (None, None, None)
+
+    if distance > EPSILON:
+        normal = offset * (1.0 / distance)
+    else:
+        # Same centre, any direction will do
+        normal = vectors.Vector([0.0, 1.0, 0.0])
+    return _contact(centre1, sphere1.get_radius(), normal, reach - distance)
+
+def sphere_surface(sphere, surface):
+    ''' Collision test of a sphere and a surface '''
+    assert isinstance(sphere, shapes.Sphere), 'Input must be a Sphere object'
+    assert isinstance(surface, shapes.Surface), 'Input must be a Surface object'
+    centre = sphere.get_pos()
+    radius = sphere.get_radius()
+    corners = surface.get_points()
+
+    closest, planeNormal = closest_on_polygon(centre, corners)
+    offset = closest - centre
+    distance = offset.norm()
+    if distance >= radius:
+        return False, (None, None, None)
+
+    if distance > EPSILON:
+        normal = offset * (1.0 / distance)
+    else:
+        # The centre is in the polygon, push it out to the side it is
+        # on, whichever way the corners wind (to the front, the side
+        # the winding faces, if it is on neither)
+        if (centre - corners[0]).dot(planeNormal) >= 0:
+            normal = -planeNormal
+        else:
+            normal = planeNormal
+    return _contact(centre, radius, normal, radius - distance)
+
+def sphere_cube(sphere, cube):
+    ''' Collision test of a sphere and an axis-aligned cube '''
+    assert isinstance(sphere, shapes.Sphere), 'Input must be a Sphere object'
+    assert isinstance(cube, shapes.Cube), 'Input must be a Cube object'
+    centre = sphere.get_pos()
+    radius = sphere.get_radius()
+    halfSide = cube.get_side() / 2.0
+    low = [x - halfSide for x in cube.get_pos().value]
+    high = [x + halfSide for x in cube.get_pos().value]
+
+    c = centre.value
+    closest = vectors.Vector([min(max(c[i], low[i]), high[i]) for i in range(3)])
+    offset = closest - centre
+    distance = offset.norm()
+
+    if distance > EPSILON:
+        if distance >= radius:
+            return False, (None, None, None)
+        return _contact(centre, radius, offset * (1.0 / distance),
+                        radius - distance)
+
+    # The centre is inside the box, push it out through the closest face
+    best = None
+    for i in range(3):
+        for faceDistance, sign in ((c[i] - low[i], 1.0), (high[i] - c[i], -1.0)):
+            if best is None or faceDistance < best[0]:
+                best = (faceDistance, i, sign)
+    faceDistance, i, sign = best
+    axis = [0.0, 0.0, 0.0]
+    axis[i] = sign
+    normal = vectors.Vector(axis)
+    return _contact(centre, radius, normal, radius + faceDistance)
+
+def cube_cube(cube1, cube2):
+    ''' Collision test of two cubes, with the deepest point of
+        cube_cube_manifold '''
+    manifold = cube_cube_manifold(cube1, cube2)
+    if not manifold:
+        return False, (None, None, None)
+    return True, max(manifold, key = lambda contact: contact[2])
+
+def cube_cube_manifold(cube1, cube2):
+    ''' Collision test of two cubes in any orientation, by the separating
+        axis test: the cubes overlap if their projections overlap on all
+        of the 15 axes that can separate two boxes (the 3 face normals of
+        each and the 9 cross products of their edges).
+
+        Output:
+            *   The contact points, as a list of up to four (point,
+                normal, depth) tuples, with the normal pointing from cube1
+                towards cube2. The list is empty if the cubes are apart.
+                If they touch face to face, the face of one cube is
+                clipped against the other to get the corners of the
+                contact area; an edge against an edge touches in one
+                point.
+    '''
+    assert isinstance(cube1, shapes.Cube), 'Input must be a Cube object'
+    assert isinstance(cube2, shapes.Cube), 'Input must be a Cube object'
+    centre1 = cube1.get_pos()
+    centre2 = cube2.get_pos()
+    axes1 = cube_axes(cube1)
+    axes2 = cube_axes(cube2)
+    half1 = cube1.get_side() / 2.0
+    half2 = cube2.get_side() / 2.0
+    offset = centre2 - centre1
+
+    # The overlap along each face normal; the face of cube2 is only
+    # used if it is clearly better, so that resting contacts do not
+    # flip between the two cubes
+    faces = []
+    for cube, axes in ((0, axes1), (1, axes2)):
+        face = None
+        for axis in axes:
+            overlap = _overlap(axis, offset, axes1, half1, axes2, half2)
+            if overlap < 0:
+                return []
+            if face is None or overlap < face[0]:
+                face = (overlap, axis, cube)
+        faces.append(face)
+    best = faces[0]
+    if faces[1][0] < RELATIVE_TOLERANCE * best[0] - ABSOLUTE_TOLERANCE * half1:
+        best = faces[1]
+
+    # The edge against edge axes, used if they are clearly better still
+    edge = None
+    for i in range(3):
+        for j in range(3):
+            axis = axes1[i].cross(axes2[j])
+            length = axis.norm()
+            if length < PARALLEL_TOLERANCE:
+                # Parallel edges, covered by the face normals
+                continue
+            axis = axis * (1.0 / length)
+            overlap = _overlap(axis, offset, axes1, half1, axes2, half2)
+            if overlap < 0:
+                return []
+            if overlap < RELATIVE_TOLERANCE * best[0] - ABSOLUTE_TOLERANCE * half1 \
+               and (edge is None or overlap < edge[0]):
+                edge = (overlap, axis, i, j)
+
+    if edge is not None:
+        overlap, normal, i, j = edge
+        if normal.dot(offset) < 0:
+            normal = -normal
+        point = _edge_contact(normal, centre1, axes1, half1, i,
+                              centre2, axes2, half2, j)
+        return [(point, normal, overlap)]
+
+    overlap, normal, cube = best
+    if normal.dot(offset) < 0:
+        normal = -normal
+    if cube == 0:
+        return _face_contacts(normal, centre1, axes1, half1,
+                              centre2, axes2, half2)
+    return [(point, -faceNormal, depth) for point, faceNormal, depth in
+            _face_contacts(-normal, centre2, axes2, half2,
+                           centre1, axes1, half1)]
+
+def cube_axes(cube):
+    ''' Returns the directions of the edges of the cube, its local x, y
+        and z axes turned by its orientation '''
+    assert isinstance(cube, shapes.Cube), 'Input must be a Cube object'
+    # The columns of the rotation matrix
+    m = cube.get_orientation().convert_to_matrix()
+    return [vectors.Vector(m[0:3]), vectors.Vector(m[4:7]),
+            vectors.Vector(m[8:11])]
+
+def _overlap(axis, offset, axes1, half1, axes2, half2):
+    ''' Returns how much the projections of two cubes on axis overlap '''
+    reach1 = half1 * sum(abs(a.dot(axis)) for a in axes1)
+    reach2 = half2 * sum(abs(a.dot(axis)) for a in axes2)
+    return reach1 + reach2 - abs(offset.dot(axis))
+
+def _face_contacts(normal, centre, axes, half, otherCentre, otherAxes, otherHalf):
+    ''' Returns the contacts of a face of a cube (the reference face,
+        the one facing along normal) with the face of the other cube
+        that faces it the most (the incident face). The incident face
+        is clipped to the sides of the reference face, and the corners
+        left below the reference face are the contact points. '''
+    # The reference face, its centre and its edge directions
+    k = max(range(3), key = lambda i: abs(axes[i].dot(normal)))
+    faceCentre = centre + normal * half
+    u = axes[(k + 1) % 3]
+    v = axes[(k + 2) % 3]
+
+    # The incident face, turned the most against normal
+    k = max(range(3), key = lambda i: abs(otherAxes[i].dot(normal)))
+    sign = -1.0 if otherAxes[k].dot(normal) > 0 else 1.0
+    middle = otherCentre + otherAxes[k] * (sign * otherHalf)
+    a = otherAxes[(k + 1) % 3] * otherHalf
+    b = otherAxes[(k + 2) % 3] * otherHalf
+    polygon = [middle + a + b, middle - a + b, middle - a - b, middle + a - b]
+
+    # Clip it to the sides of the reference face
+    for side in (u, -u, v, -v):
+        polygon = _clip(polygon, side, side.dot(faceCentre) + half)
+        if not polygon:
+            break
+
+    surface = normal.dot(faceCentre)
+    found = []
+    for point in polygon:
+        depth = surface - normal.dot(point)
+        if depth >= 0:
+            # Midway between the corner and the reference face
+            found.append((point + normal * (0.5 * depth), normal, depth))
+    return _reduce(found)
+
+def _clip(polygon, normal, offset):
+    ''' Clips the polygon (a list of its corners in order) to the part
+        where normal.dot(point) <= offset '''
+    out = []
+    count = len(polygon)
+    for i in range(count):
+        p = polygon[i]
+        q = polygon[(i + 1) % count]
+        dp = normal.dot(p) - offset
+        dq = normal.dot(q) - offset
+        if dp <= 0:
+            out.append(p)
+        if (dp < 0 < dq) or (dq < 0 < dp):
+            out.append(p + (q - p) * (dp / (dp - dq)))
+    return out
+
+def _reduce(found):
+    ''' Keeps at most four of the contacts: the deepest, and then the
+        ones furthest from those already kept '''
+    if len(found) <= 4:
+        return found
+    kept = [max(found, key = lambda contact: contact[2])]
+    while len(kept) < 4:
+        def spread(contact):
+            return min((contact[0] - other[0]).dot(contact[0] - other[0])
+                       for other in kept)
+        kept.append(max(found, key = spread))
+    return kept
+
+def _edge_contact(normal, centre1, axes1, half1, i, centre2, axes2, half2, j):
+    ''' Returns the point midway between the closest points of the edge
+        of cube1 along axes1[i] that is furthest along normal, and the
+        edge of cube2 along axes2[j] that is furthest against it '''
+    start1 = centre1.copy()
+    start2 = centre2.copy()
+    for k in range(3):
+        if k != i:
+            start1.add_scaled(axes1[k], half1 if axes1[k].dot(normal) > 0 else -half1)
+        if k != j:
+            start2.add_scaled(axes2[k], -half2 if axes2[k].dot(normal) > 0 else half2)
+
+    # The closest points of the lines start1 + s*d1 and start2 + t*d2,
+    # kept on the edges
+    d1 = axes1[i]
+    d2 = axes2[j]
+    r = start1 - start2
+    b = d1.dot(d2)
+    c = d1.dot(r)
+    f = d2.dot(r)
+    denom = 1.0 - b * b
+    s = (b * f - c) / denom if denom > EPSILON else 0.0
+    s = min(max(s, -half1), half1)
+    t = min(max(b * s + f, -half2), half2)
+    return (start1 + d1 * s + start2 + d2 * t) * 0.5
+
+def _contact(centre, radius, normal, depth):
+    ''' Returns the collision information of a sphere with the given
+        centre and radius that penetrates a shape by depth along normal.
+        The collision point is midway between the deepest point of the
+        sphere and the deepest point of the other shape. '''
+    point = centre + normal * (radius - 0.5 * depth)
+    return True, (point, normal, depth)
+
+def closest_on_polygon(point, corners):
+    ''' Returns the point on the flat convex polygon with the given
+        corners (in order) that is closest to point, and the normal of
+        the polygon. '''
+    a = corners[0]
+    planeNormal = (corners[1] - a).cross(corners[2] - a).normalize()
+    projected = point - planeNormal * (point - a).dot(planeNormal)
+
+    # Inside if the projection is on the same side of all edges
+    count = len(corners)
+    sides = [(corners[(i + 1) % count] - corners[i]).cross(projected - corners[i])
+             .dot(planeNormal) for i in range(count)]
+    if min(sides) >= 0 or max(sides) <= 0:
+        return projected, planeNormal
+
+    # Otherwise the closest point is on one of the edges
+    best = None
+    for i in range(count):
+        start = corners[i]
+        edge = corners[(i + 1) % count] - start
+        t = (point - start).dot(edge) / edge.dot(edge)
+        candidate = start + edge * min(max(t, 0.0), 1.0)
+        distance = (candidate - point).dot(candidate - point)
+        if best is None or distance < best[0]:
+            best = (distance, candidate)
+    return best[1], planeNormal
+
+# The closed form tests, keyed on the classes of the shapes
+PAIRS = {(shapes.Sphere, shapes.Sphere): sphere_sphere,
+         (shapes.Sphere, shapes.Surface): sphere_surface,
+         (shapes.Sphere, shapes.Cube): sphere_cube,
+         (shapes.Cube, shapes.Cube): cube_cube}
+
+# The tests that give several contact points, for contacts
+MANIFOLDS = {(shapes.Cube, shapes.Cube): cube_cube_manifold}
+
+# Engines to use for particular pairs, keyed on the classes of
+# the shapes, whatever engine collide is asked for
+ENGINES = {}
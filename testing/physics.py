@@ -1,111 +1,187 @@
+import math
+import numpy
 import vectors
 import collisions
+import broadphases
+import narrowphases
 import shapes
 import numbers
 import games
+import integrators
+import islands
 
 GRAVITY = vectors.Vector([0.0, -10.0, 0.0])
-dt = 0.0005
+dt = 0.01   # Default timestep, in seconds
+
+# Where the last GJK query of each pair ended, to start the next from
+pairCache = collisions.PairCache()
+
+# The bounding boxes of the shapes and the pairs of them that overlap;
+# the scene is passive, as its items never move. For dense crowds of
+# similar objects, a broadphases.SpatialHash may take its place.
+broadPhase = broadphases.SweepAndPrune()
+
+# Which objects have come to rest and sleep, in islands of objects that
+# touch; sleeping objects cost about as little as the scene
+sleepIslands = islands.Islands()
+
+# Contacts deeper than PENETRATION_SLOP (in m) are pushed apart by
+# CORRECTION of the rest of their depth per step, see separate
+PENETRATION_SLOP = 0.005
+CORRECTION = 0.2
+
+# The passes of the contact solver over the contact points of a step,
+# and the speed (in m/s) below which impacts do not bounce, so that
+# resting contacts stay at rest; see manifold_response
+SOLVER_ITERATIONS = 8
+BOUNCE_SPEED = 0.5
 
 #                                (1+e)(relv.norm)
 #j =------------------------------------------------------------------------------
 #    norm.norm(1/Mass0 + 1/Mass1) + (sqr(r0 x norm) / Inertia0) + (sqr(r1 x norm) / Inertia1)
 
-def collision_response(shape1, shape2, collisionInfo):
+def collision_response(shape1, shape2, collisionInfo, dt = dt):
+    ''' Collision response for a single contact point of two shapes,
+        see manifold_response. '''
+    manifold_response(shape1, shape2, [collisionInfo])
+
+def manifold_response(shape1, shape2, contacts, iterations = SOLVER_ITERATIONS):
+    ''' Collision response for all the contact points of two shapes at
+        once, with sequential impulses. The points are visited in turn,
+        iterations times, and each visit corrects the impulse at a point
+        for the relative velocity there, which the impulses at the other
+        points have changed since. The normal impulse accumulated at a
+        point never pulls the shapes together, and its friction impulse
+        never exceeds mu times it. Impacts faster than BOUNCE_SPEED
+        bounce back with restitution e.
+
+        update_physics solves the points of all colliding pairs of a
+        step together in the same way, so that the impulses also reach
+        through piles of objects.
+
+        Input:
+            *   contacts is a list of (point, normal, depth) tuples, as
+                from narrowphases.contacts.
+    '''
+    manifold = _prepare_manifold(shape1, shape2, contacts)
+    if manifold is None:
+        return
+    for iteration in range(iterations):
+        _solve_manifold(manifold)
+
+def _prepare_manifold(shape1, shape2, contacts):
+    ''' Returns the contact points of two shapes, ready for
+        _solve_manifold, or None if neither shape can move. '''
     assert isinstance(shape1, shapes.Shape), 'Input must be a Shape object'
     assert isinstance(shape2, shapes.Shape), 'Input must be a Shape object'
-    assert isinstance(collisionInfo, tuple), 'Input must be a tuple'
-    assert len(collisionInfo) == 3, 'CollisionInfo must be of length 3'
-
-    collisionPoint, normal, depth = collisionInfo
-
-    assert isinstance(collisionPoint, vectors.Vector), \
-           'Input must be a vector'
-    assert isinstance(normal, vectors.Vector), \
-           'Input must be a vector'
-    assert isinstance(depth, numbers.Number), \
-           'Input must be a number'
-
-    if normal.dot(shape1.get_pos() - shape2.get_pos()) < 0:
-        # It's pointing the wrong way
-        normal *= -1.0
+    assert isinstance(contacts, list), 'Input must be a list'
+    if __debug__:
+        for collisionInfo in contacts:
+            assert isinstance(collisionInfo, tuple), 'Input must be a tuple'
+            assert len(collisionInfo) == 3, 'CollisionInfo must be of length 3'
+            assert isinstance(collisionInfo[0], vectors.Vector), \
+                   'Input must be a vector'
+            assert isinstance(collisionInfo[1], vectors.Vector), \
+                   'Input must be a vector'
+            assert isinstance(collisionInfo[2], numbers.Number), \
+                   'Input must be a number'
 
     # The inverted inertia matrices of the two shapes
     invInertia1 = shape1.get_invInertia()
     invInertia2 = shape2.get_invInertia()
 
     # The inverted masses of the two objects
-    invMass1 = 1.0 / shape1.get_mass()
-    invMass2 = 1.0 / shape2.get_mass()
+    invMass1 = shape1.get_inv_mass()
+    invMass2 = shape2.get_inv_mass()
 
     if invMass1 + invMass2 == 0.0:
         # Both objects are immobile
-        return
-
-    # The vectors from the collision point to the respective centra of the shapes
-    r1 = collisionPoint - shape1.get_pos()
-    r2 = collisionPoint - shape2.get_pos()
-
-    # The velocities of the collision point on the two shapes    
+        return None
+
+    e = 0.5     # Coefficient of restitution
+
+    bodies = (shape1, shape2, invMass1, invMass2, invInertia1, invInertia2)
+
+    # Each point as [normal, r1, r2, target, normalMass, normalImpulse,
+    # frictionImpulse]: the normal pointing towards shape1, the vectors
+    # from the centra of the shapes to the point, the relative velocity
+    # along the normal to reach, the effective mass along the normal and
+    # the impulses accumulated so far
+    points = []
+    for collisionPoint, normal, depth in contacts:
+        if normal.dot(shape1.get_pos() - shape2.get_pos()) < 0:
+            # It's pointing the wrong way
+            normal = -normal
+        r1 = collisionPoint - shape1.get_pos()
+        r2 = collisionPoint - shape2.get_pos()
+
+        approach = _point_velocity(bodies, r1, r2).dot(normal)
+        if approach < -BOUNCE_SPEED:
+            target = -e * approach
+        else:
+            target = 0.0
+        points.append([normal, r1, r2, target, _point_mass(bodies, r1, r2, normal),
+                       0.0, vectors.Vector([0.0, 0.0, 0.0])])
+    return bodies, points
+
+def _solve_manifold(manifold):
+    ''' Makes one pass over the contact points from _prepare_manifold,
+        correcting the impulse at each. '''
+    bodies, points = manifold
+    mu = 0.5    # Coefficient of friction
+
+    for point in points:
+        normal, r1, r2, target, normalMass, normalImpulse, frictionImpulse = point
+
+        # NORMAL Impulse, up to the target velocity but never pulling
+        relVel = _point_velocity(bodies, r1, r2)
+        impulse = max(normalImpulse + (target - relVel.dot(normal)) / normalMass, 0.0)
+        _apply_impulse(bodies, r1, r2, normal * (impulse - normalImpulse))
+        point[5] = impulse
+
+        # TANGENT Impulse, against the sliding at the point, within the
+        # friction cone of the normal impulse
+        relVel = _point_velocity(bodies, r1, r2)
+        sliding = relVel - normal * relVel.dot(normal)
+        speed = sliding.norm()
+        if speed < 1e-9:
+            continue
+        tangent = sliding * (1.0 / speed)
+        total = frictionImpulse - tangent * (speed / _point_mass(bodies, r1, r2, tangent))
+        size = total.norm()
+        if size > mu * impulse:
+            total = total * (mu * impulse / size)
+        _apply_impulse(bodies, r1, r2, total - frictionImpulse)
+        point[6] = total
+
+def _point_velocity(bodies, r1, r2):
+    ''' Returns the velocity of the point at r1 from the centre of
+        shape1 relative to the point at r2 from the centre of shape2. '''
+    shape1, shape2 = bodies[:2]
     v1 = shape1.get_velocity() + shape1.get_angular_velocity().cross(r1)
     v2 = shape2.get_velocity() + shape2.get_angular_velocity().cross(r2)
-
-    # The relative velocity
-    relVel = v1 - v2
-
-    # If the shapes are moving away from eachother we don't need to apply an impulse
-    relMov = - relVel.dot(normal)
-    if relMov < -0.01:
-        return
-
-    # NORMAL Impulse
-
-    e = 0.5 # Coefficient of restitution
-
-    normalInert1 = r1.triple_product_2(normal, r1).left_matrix_mult(invInertia1)
-    normalInert2 = r2.triple_product_2(normal, r2).left_matrix_mult(invInertia2)
-
-    normalImpulse = -(1+e)*relVel.dot(normal)/ \
-              (invMass1 + invMass2 + (normalInert1 + normalInert2).dot(normal))
-    
-
-    # Hack fix to stop sinking
-
-    normalImpulse += depth*1.0
-
-    shape1.add_velocity(normal * normalImpulse * invMass1)
-    shape2.add_velocity(normal * normalImpulse * invMass2 * -1.0)
-
-    shape1.add_angular_velocity(r1.cross(normal*normalImpulse).\
-                                left_matrix_mult(invInertia1))
-    shape2.add_angular_velocity(r2.cross(normal*normalImpulse).\
-                                left_matrix_mult(invInertia2))
-
-    # TANGENT Impulse Code
-
-    # Work out our tangent vector, with is perpendicular
-    # to our collision normal
-
-    tangent = (relVel - normal * relVel.dot(normal))
-    if tangent.is_not_zero():
-        tangent = tangent.normalize()
-    tangDiv = invMass1 + invMass2 + tangent.dot(r1.cross(tangent).left_matrix_mult(invInertia1).cross(r1) + \
-                                                r2.cross(tangent).left_matrix_mult(invInertia2).cross(r2))
-
-    tangentImpulse = -(relVel.dot(tangent))/tangDiv
-
-    shape1.add_velocity(normal * tangentImpulse * invMass1)
-    shape2.add_velocity(normal * tangentImpulse * invMass2 * -1.0)
-
-    shape1.add_angular_velocity(r1.cross(tangent*tangentImpulse).\
-                                left_matrix_mult(invInertia1))
-    shape2.add_angular_velocity(r2.cross(tangent*tangentImpulse).\
-                                left_matrix_mult(invInertia2))
-
-
-
-
-def linear_collision_response(shape1, shape2, collisionInfo):
+    return v1 - v2
+
+def _point_mass(bodies, r1, r2, direction):
+    ''' Returns the inverse of the effective mass of the shapes along
+        the unit vector direction at the point: how much their relative
+        velocity there changes per unit of impulse. '''
+    shape1, shape2, invMass1, invMass2, invInertia1, invInertia2 = bodies
+    return invMass1 + invMass2 + \
+           direction.dot(r1.cross(direction).left_matrix_mult(invInertia1).cross(r1) +
+                         r2.cross(direction).left_matrix_mult(invInertia2).cross(r2))
+
+def _apply_impulse(bodies, r1, r2, impulse):
+    ''' Applies the impulse to shape1 at the point, and the opposite
+        impulse to shape2. '''
+    shape1, shape2, invMass1, invMass2, invInertia1, invInertia2 = bodies
+    shape1.add_velocity(impulse, invMass1)
+    shape2.add_velocity(impulse, -invMass2)
+    shape1.add_angular_velocity(r1.cross(impulse).left_matrix_mult(invInertia1))
+    shape2.add_angular_velocity(r2.cross(impulse).left_matrix_mult(invInertia2), -1.0)
+
+
+def linear_collision_response(shape1, shape2, collisionInfo, dt = dt):
     assert isinstance(shape1, shapes.Shape), 'Input must be a Shape object'
     assert isinstance(shape2, shapes.Shape), 'Input must be a Shape object'
     assert isinstance(collisionInfo, tuple), 'Input must be a tuple'
@@ -122,13 +198,14 @@ def linear_collision_response(shape1, shape2, collisionInfo):
 
     if penetrationNormal.dot(shape2.get_pos() - shape1.get_pos()) < 0:
         # It's pointing the wrong way
-        penetrationNormal *= -1.0
+        penetrationNormal = -penetrationNormal
 
-    mass1 = shape1.get_mass()
-    mass2 = shape2.get_mass()
+    invMass1 = shape1.get_inv_mass()
+    invMass2 = shape2.get_inv_mass()
 
-    invMass1 = 1.0/shape1.get_mass()
-    invMass2 = 1.0/shape2.get_mass()
+    if invMass1 + invMass2 == 0.0:
+        # Both objects are immobile
+        return
 
     relativeVel = shape1.get_velocity() - shape2.get_velocity()
 
@@ -143,55 +220,195 @@ def linear_collision_response(shape1, shape2, collisionInfo):
 
     impulse = -(1+e)*v_ab.dot(n)/((invMass1+invMass2)*n.dot(n))
 
-    #print 'impulse before:', impulse
-    # Hack to prevent sinking
-    impulse -= penetrationDepth*1.0
-    #print 'depth:', penetrationDepth
-    #print 'impulse after:', impulse
-    shape1.add_velocity(n*impulse*invMass1)
-    shape2.add_velocity(n*impulse*invMass2*(-1.0))
+    shape1.add_velocity(n, impulse*invMass1)
+    shape2.add_velocity(n, -impulse*invMass2)
 
+def separate(shape1, shape2, collisionInfo):
+    ''' Pushes two colliding shapes apart along the penetration normal,
+        by CORRECTION of their penetration depth beyond PENETRATION_SLOP,
+        each in proportion to its inverse mass. Only the positions are
+        moved, not the velocities, so stopping the shapes from sinking
+        into each other adds no energy; the collision responses handle
+        the velocities. '''
+    assert isinstance(shape1, shapes.Shape), 'Input must be a Shape object'
+    assert isinstance(shape2, shapes.Shape), 'Input must be a Shape object'
+    assert isinstance(collisionInfo, tuple), 'Input must be a tuple'
+    assert len(collisionInfo) == 3, 'CollisionInfo must be of length 3'
 
-def update_physics(game):
-    ''' Updates all physics in the game; takes all the objects in
-        the game, calculates collisions etc and moves them to their
-        new locations.'''
-    assert isinstance(game, games.Game), 'Input must be a game object'
-    # TODO: Make it have an input called dt, which gives it the
-    # timestep it should simulate
+    collisionPoint, normal, depth = collisionInfo
 
-    player, objectList, sceneList = game.get_objects()
-    #print ''
-    for item in objectList:
-        #print 'Checking collision with item:', item
+    if normal.dot(shape1.get_pos() - shape2.get_pos()) < 0:
+        # It's pointing the wrong way
+        normal = -normal
 
-        collided, collisionInfo = collisions.GJK(player, item)
+    invMass1 = shape1.get_inv_mass()
+    invMass2 = shape2.get_inv_mass()
 
-        if collided:
-            #print 'Player collided with item'
-            collision_response(player, item, collisionInfo)
+    excess = depth - PENETRATION_SLOP
+    if excess <= 0.0 or invMass1 + invMass2 == 0.0:
+        return
 
-        for thing in sceneList:
-            collided, collisionInfo = collisions.GJK(item, thing)
+    push = CORRECTION * excess / (invMass1 + invMass2)
+    shape1.add_pos(normal, push * invMass1)
+    shape2.add_pos(normal, -push * invMass2)
 
-            if collided:
-                #print 'Item collided with scene'
-                collision_response(item, thing, collisionInfo)
 
-    for item in sceneList:
-        #print 'Checking collision with scene:', item
+def moving_indices(game):
+    ''' Returns the store shared by the moving bodies of the game
+        (the player and the objects) and their indices in it. '''
+    assert isinstance(game, games.Game), 'Input must be a game object'
 
-        collided, collisionInfo = collisions.GJK(player, item)
+    player, objectList, sceneList = game.get_objects()
+    store = player.get_store()
+    indices = [player.get_index()]
+    for item in objectList:
+        assert item.get_store() is store, 'All shapes must share a store'
+        indices.append(item.get_index())
+    return store, indices
 
-        if collided:
-            #print 'Player collided with scene'
-            collision_response(player, item, collisionInfo)
-    
-    # TODO: switch to semi-implicit Euler integration
-    
-    player.add_velocity(GRAVITY*dt)
-    player.add_pos(player.get_velocity())
+def update_physics(game, dt = dt, scheme = integrators.SEMI_IMPLICIT_EULER,
+                   engine = narrowphases.GJK_ENGINE):
+    ''' Updates all physics in the game; takes all the objects in
+        the game, calculates collisions etc and moves them to their
+        new locations, simulating the timestep dt (in seconds) with
+        the given integration scheme (see integrators.py) and narrow
+        phase engine (see narrowphases.py). Objects that have come to
+        rest are put to sleep and skipped until something wakes them,
+        see sleepIslands.
+        Returns the deepest penetration depth found (0 if nothing
+        collided).'''
+    assert isinstance(game, games.Game), 'Input must be a game object'
+    assert isinstance(dt, numbers.Number), 'dt must be a number'
+    assert dt > 0, 'dt must be positive'
 
-    for item in objectList:
-        item.add_velocity(GRAVITY*dt)
-        item.add_pos(item.get_velocity())
+    player, objectList, sceneList = game.get_objects()
+    deepest = 0.0
+    pairCache.new_frame()
+
+    # Sleeping objects are passive like the scene, so pairs of them,
+    # or of them and the scene, are not tested
+    awake, sleeping = sleepIslands.partition(objectList)
+
+    # Only the pairs whose boxes overlap go to the narrow phase: the
+    # player and the awake objects with each other and with the scene
+    # and the sleeping objects. The pairs that stop overlapping age
+    # out of the pair cache.
+    touching = []
+    collided = []
+    for shape1, shape2 in broadPhase.update([player] + awake, sleeping + sceneList, dt):
+        #print 'Checking collision between', shape1, 'and', shape2
+
+        # A pair can touch in several points, see narrowphases.contacts
+        contacts = narrowphases.contacts(shape1, shape2, pairCache, engine)
+        if contacts:
+            # An impact wakes the island of a sleeping object; it starts
+            # moving in the next step
+            sleepIslands.wake(shape1)
+            sleepIslands.wake(shape2)
+            touching.append((shape1, shape2))
+            collided.append((shape1, shape2, contacts))
+
+    # The contact points of all pairs are solved together, see
+    # manifold_response, so that the impulses reach through piles
+    manifolds = [_prepare_manifold(shape1, shape2, contacts)
+                 for shape1, shape2, contacts in collided]
+    manifolds = [manifold for manifold in manifolds if manifold is not None]
+    for iteration in range(SOLVER_ITERATIONS):
+        for manifold in manifolds:
+            _solve_manifold(manifold)
+
+    # The points of a pair share their normal, so pushing the pair out
+    # of its deepest point separates it
+    for shape1, shape2, contacts in collided:
+        deepest = max([deepest] + [info[2] for info in contacts])
+        separate(shape1, shape2, max(contacts, key = lambda info: info[2]))
+    
+    # Gravity and movement for all awake bodies at once
+    store = player.get_store()
+    indices = [player.get_index()] + [item.get_index() for item in awake]
+    integrators.integrate(store, GRAVITY.value, dt, indices, scheme)
+
+    # The objects woken in this step join the islands, so that the
+    # objects that woke them do not fall asleep on their own
+    sleepIslands.update([item for item in objectList if not sleepIslands.is_asleep(item)],
+                        touching, dt, [player])
+    return deepest
+
+
+class Substepper:
+    ''' Splits a physics step into more substeps when the bodies move
+        fast, and merges them back when they slow down. A resting scene
+        costs a single update_physics call per step.
+
+        Before each step, the number of substeps is chosen from the
+        motion predicted for it: no moving body may move further than
+        maxDisplacement, nor than half the shortest side of its bounding
+        box, per substep, at its current speed plus what gravity adds
+        during the step. Fast bodies are then stopped by the contacts
+        they reach before passing through them. More substeps are taken
+        at once; fewer only after calmSteps calm steps in a row, halving
+        each time. The push out of contacts (see separate) moves
+        positions only, so it adds no more energy in short substeps.
+    '''
+
+    def __init__(self, maxDisplacement = 0.1, maxSubsteps = 8, calmSteps = 10):
+        assert isinstance(maxDisplacement, numbers.Number), \
+               'maxDisplacement must be a number'
+        assert maxDisplacement > 0, 'maxDisplacement must be positive'
+        assert maxSubsteps >= 1, 'At least one substep must be allowed'
+        self._maxDisplacement = maxDisplacement
+        self._maxSubsteps = maxSubsteps
+        self._calmSteps = calmSteps
+        self._substeps = 1
+        self._calm = 0
+
+    def get_substeps(self):
+        ''' Returns the number of substeps of the last step. '''
+        return self._substeps
+
+    def step(self, game, dt = dt, scheme = integrators.SEMI_IMPLICIT_EULER,
+             engine = narrowphases.GJK_ENGINE):
+        ''' Picks the substep count for the motion predicted over dt
+            and advances the game by dt in that many substeps. Returns
+            the number of substeps taken. '''
+        assert isinstance(dt, numbers.Number), 'dt must be a number'
+        assert dt > 0, 'dt must be positive'
+
+        needed = self.predict(game, dt)
+        substeps = self._substeps
+        if needed > substeps:
+            self._substeps = needed
+            self._calm = 0
+        elif needed * 2 <= substeps:
+            self._calm += 1
+            if self._calm >= self._calmSteps:
+                self._substeps = max(substeps // 2, needed)
+                self._calm = 0
+        else:
+            self._calm = 0
+
+        substeps = self._substeps
+        subDt = dt / substeps
+        for i in range(substeps):
+            update_physics(game, subDt, scheme, engine)
+        return substeps
+
+    def predict(self, game, dt):
+        ''' Returns the number of substeps (at most maxSubsteps) that
+            the motion of the moving bodies over dt needs. '''
+        player, objectList, sceneList = game.get_objects()
+        store, indices = moving_indices(game)
+        velocities = store.velocities[indices]
+        speeds = numpy.sqrt(numpy.einsum('ij,ij->i', velocities, velocities))
+        reaches = ((speeds + GRAVITY.norm() * dt) * dt).tolist()
+
+        needed = 1.0
+        for shape, reach in zip([player] + objectList, reaches):
+            lower, upper = shape.get_bounds()
+            limit = self._maxDisplacement
+            shortest = min(high - low for low, high in zip(lower, upper))
+            if shortest > 0.0:
+                # Flat bodies are only held to maxDisplacement
+                limit = min(limit, 0.5 * shortest)
+            needed = max(needed, reach / limit)
+        return min(int(math.ceil(needed)), self._maxSubsteps)
@@ -4,10 +4,25 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 from OpenGL.GLUT import *
 import shapes
+import quaternions
+
+def place(item, interpolation = None):
+    ''' Translates and rotates to the pose of item, interpolated
+        by interpolation (a FixedTimestep) if given. '''
+    if interpolation is None:
+        pos = item.get_pos().value
+        orientation = item.get_orientation()
+    else:
+        pos = interpolation.get_pos(item)
+        orientation = quaternions.Quaternion(interpolation.get_orientation(item))
+    glTranslatef(pos[0], pos[1], pos[2])
+    glMultMatrixf(orientation.convert_to_matrix())
 
 #def render(game, collisionInfo):
-def render(game):
-    ''' Draws the player and all other entities at their current position '''
+def render(game, interpolation = None):
+    ''' Draws the player and all other entities at their current position,
+        or at their interpolated position if interpolation (a
+        FixedTimestep) is given. '''
 
     player, objectList, sceneList = game.get_objects()
 
@@ -41,25 +56,21 @@ def render(game):
     #          0, 0, 0,
     #          0, 1, 0)
 
-    pos = player.get_pos().value
-    
     glPushMatrix()
-    glTranslatef(pos[0], pos[1], pos[2])
+    place(player, interpolation)
     player.draw()
     glPopMatrix()
 
     for item in objectList:
-        pos = item.get_pos().value
         glPushMatrix()
-        glTranslatef(pos[0], pos[1], pos[2])
+        place(item, interpolation)
         item.draw()
         glPopMatrix()
 
     
     for item in sceneList:
-        pos = item.get_pos().value
         glPushMatrix()
-        glTranslatef(pos[0], pos[1], pos[2])
+        place(item, interpolation)
         item.draw()
         glPopMatrix()
 
@@ -1,72 +1,168 @@
 import vectors
 import quaternions
 import supports
+import rigidbodies
+import hulls
 import numbers
 import draw
 
 class Shape(object):
 
-    def __init__(self):
+    def __init__(self, store = None):
+        assert store is None or isinstance(store, rigidbodies.RigidBodyStore), \
+               'Store must be a RigidBodyStore object'
+
+        # Position, velocity, mass, orientation and inertia live in a
+        # RigidBodyStore; the shape only keeps its row index in it.
+        # A new body has infinite mass, which makes it "immobile", and
+        # no inverse inertia, which makes it unable to rotate.
+        if store is None:
+            store = rigidbodies.DEFAULT_STORE
+        self._store = store
+        self._index = store.add_body()
 
         # Linear motion
-        self._pos = vectors.Vector()
-        self._velocity = vectors.Vector()
-        self._mass = float('inf')      # Makes it "immobile"
         self._force = vectors.Vector()
 
         # Angular motion
-        self._orientation = quaternions.Quaternion()
-        self._angularVelocity = vectors.Vector()
-        self._invInertia = [[0.0, 0.0, 0.0],
-                            [0.0, 0.0, 0.0],
-                            [0.0, 0.0, 0.0]]   # Makes it unable to rotate
         self._torque = vectors.Vector()
 
         self._color = None
 
+        # The bounds in the frame of the shape, relative to its position,
+        # set once by the subclass, and the box and sphere centre turned
+        # by the orientation they were last computed for
+        self._localBounds = None
+        self._localSphere = None
+        self._turnedOrientation = None
+        self._turnedBounds = None
+
+    def get_store(self):
+        return self._store
+
+    def get_index(self):
+        return self._index
+
     def get_velocity(self):
-        return self._velocity
+        return vectors.Vector(self._store.velocities[self._index].tolist())
 
     def set_velocity(self, velocity):
         assert isinstance(velocity, vectors.Vector), 'Velocity must be a vector'
-        self._velocity = velocity
+        self._store.velocities[self._index] = velocity.value
 
-    def add_velocity(self, velocity):
+    def add_velocity(self, velocity, scale = 1.0):
         assert isinstance(velocity, vectors.Vector), 'Velocity must be a vector'
-        self._velocity += velocity
+        assert isinstance(scale, numbers.Number), 'Scale must be a number'
+        x, y, z = velocity.value
+        row = self._store.velocities[self._index]
+        row += (x * scale, y * scale, z * scale)
 
     def get_angular_velocity(self):
-        return self._angularVelocity
+        return vectors.Vector(self._store.angularVelocities[self._index].tolist())
 
     def set_angular_velocity(self, velocity):
         assert isinstance(velocity, vectors.Vector), 'Velocity must be a vector'
-        self._angularVelocity = velocity
+        self._store.angularVelocities[self._index] = velocity.value
 
-    def add_angular_velocity(self, velocity):
+    def add_angular_velocity(self, velocity, scale = 1.0):
         assert isinstance(velocity, vectors.Vector), 'Velocity must be a vector'
-        self._angularVelocity += velocity
+        assert isinstance(scale, numbers.Number), 'Scale must be a number'
+        x, y, z = velocity.value
+        row = self._store.angularVelocities[self._index]
+        row += (x * scale, y * scale, z * scale)
 
     def get_mass(self):
-        return self._mass
+        return float(self._store.masses[self._index])
+
+    def get_inv_mass(self):
+        ''' Returns the inverse mass, 0 for an immobile body '''
+        return float(self._store.invMasses[self._index])
 
     def set_mass(self, mass):
         assert isinstance(mass, numbers.Number), 'Mass must be a number'
         assert mass >= 0, 'Mass must be at least 0'
-        self._mass = mass
+        self._store.set_mass(self._index, mass)
 
     def get_invInertia(self):
-        return self._invInertia
+        return self._store.invInertias[self._index].tolist()
+
+    def set_invInertia(self, invInertia):
+        assert isinstance(invInertia, list), 'Input must be a matrix, represented as a list of lists'
+        assert len(invInertia) == 3, 'The inverted inertia must be a 3x3 matrix'
+        self._store.invInertias[self._index] = invInertia
+
+    def get_orientation(self):
+        return quaternions.Quaternion(self._store.orientations[self._index].tolist())
+
+    def set_orientation(self, orientation):
+        assert isinstance(orientation, quaternions.Quaternion), \
+               'Orientation must be a quaternion'
+        self._store.orientations[self._index] = orientation.value
 
     def get_pos(self):
-        return self._pos
+        return vectors.Vector(self._store.positions[self._index].tolist())
 
     def set_pos(self, pos):
         assert isinstance(pos, vectors.Vector), 'Pos must be a vector'
-        self._pos = pos
+        self._store.positions[self._index] = pos.value
 
-    def add_pos(self, pos):
+    def add_pos(self, pos, scale = 1.0):
         assert isinstance(pos, vectors.Vector), 'Pos must be a vector'
-        self._pos += pos
+        assert isinstance(scale, numbers.Number), 'Scale must be a number'
+        x, y, z = pos.value
+        row = self._store.positions[self._index]
+        row += (x * scale, y * scale, z * scale)
+
+    def set_local_bounds(self, lower, upper, centre, radius):
+        ''' Sets the axis-aligned box (its lowest and highest corners)
+            and the bounding sphere (its centre and radius) of the shape
+            in its own frame, relative to its position, as lists of three
+            numbers. Subclasses call this once their size is known. '''
+        self._localBounds = (list(lower), list(upper))
+        self._localSphere = (list(centre), radius)
+        self._turnedOrientation = None
+
+    def get_local_bounds(self):
+        return self._localBounds
+
+    def get_bounds(self):
+        ''' Returns the lowest and highest corners of the axis-aligned box
+            around the shape in world space, as lists of three numbers.
+            The local box is only turned again when the orientation has
+            changed since the last call; a move only shifts it. '''
+        lower, upper, centre = self._turned()
+        x, y, z = self._store.positions[self._index].tolist()
+        return ([x + lower[0], y + lower[1], z + lower[2]],
+                [x + upper[0], y + upper[1], z + upper[2]])
+
+    def get_swept_bounds(self, dt):
+        ''' Returns the box of get_bounds, stretched to also cover where
+            the shape moves during dt with its current velocity. '''
+        lower, upper = self.get_bounds()
+        for k, v in enumerate(self._store.velocities[self._index].tolist()):
+            if v < 0.0:
+                lower[k] += v * dt
+            else:
+                upper[k] += v * dt
+        return lower, upper
+
+    def get_bounding_sphere(self):
+        ''' Returns the centre, as a list of three numbers, and the radius
+            of a sphere around the shape in world space. '''
+        lower, upper, centre = self._turned()
+        x, y, z = self._store.positions[self._index].tolist()
+        return [x + centre[0], y + centre[1], z + centre[2]], self._localSphere[1]
+
+    def _turned(self):
+        ''' Returns the local box and sphere centre turned by the current
+            orientation, computing them again only if it has changed. '''
+        orientation = self._store.orientations[self._index].tolist()
+        if orientation != self._turnedOrientation:
+            assert self._localBounds is not None, 'The shape has no bounds'
+            self._turnedBounds = turn_bounds(self._localBounds,
+                                             self._localSphere[0], orientation)
+            self._turnedOrientation = orientation
+        return self._turnedBounds
 
     def get_color(self):
         return self._color
@@ -83,11 +179,44 @@ class Shape(object):
                        'Every component of color must be a number between 0 and 1'
         self._color = color
 
+def point_bounds(points):
+    ''' Returns the lowest and highest corners of the axis-aligned box
+        around the given Vectors, and the centre and radius of a sphere
+        around them, centred in the box '''
+    lower = [min(point.value[k] for point in points) for k in range(3)]
+    upper = [max(point.value[k] for point in points) for k in range(3)]
+    centre = vectors.Vector([(lower[k] + upper[k]) * 0.5 for k in range(3)])
+    radius = max((point - centre).norm() for point in points)
+    return lower, upper, centre.value, radius
+
+def turn_bounds(bounds, centre, orientation):
+    ''' Returns the corners of the axis-aligned box around the box
+        bounds turned by orientation (a quaternion as [w, x, y, z]), and
+        the turned point centre, as lists of three numbers '''
+    lower, upper = bounds
+    if orientation == [1.0, 0.0, 0.0, 0.0]:
+        return list(lower), list(upper), list(centre)
+
+    # The columns of the rotation matrix are the turned axes
+    m = quaternions.Quaternion(orientation).convert_to_matrix()
+    mid = [(lower[k] + upper[k]) * 0.5 for k in range(3)]
+    half = [(upper[k] - lower[k]) * 0.5 for k in range(3)]
+    turnedLower = []
+    turnedUpper = []
+    turnedCentre = []
+    for i in range(3):
+        c = m[i]*mid[0] + m[4 + i]*mid[1] + m[8 + i]*mid[2]
+        h = abs(m[i])*half[0] + abs(m[4 + i])*half[1] + abs(m[8 + i])*half[2]
+        turnedLower.append(c - h)
+        turnedUpper.append(c + h)
+        turnedCentre.append(m[i]*centre[0] + m[4 + i]*centre[1] + m[8 + i]*centre[2])
+    return turnedLower, turnedUpper, turnedCentre
+
 class Sphere(Shape):
 
     def __init__(self, pos = vectors.Vector(), radius = 0.5,
-                 mass = 1.0, color = [1.0, 0.5, 0.3]):
-        super(Sphere, self).__init__()
+                 mass = 1.0, color = [1.0, 0.5, 0.3], store = None):
+        super(Sphere, self).__init__(store)
         assert isinstance(pos, vectors.Vector), 'Pos must be a vector'
         assert isinstance(mass, numbers.Number), 'Mass must be a number'
         assert mass >= 0, 'Mass must be at least 0'
@@ -103,14 +232,15 @@ class Sphere(Shape):
                 assert 0 <= item <= 1, \
                        'Every component of color must be a number between 0 and 1'
                 
-        self._pos = pos
-        self._mass = mass
+        self.set_pos(pos)
+        self.set_mass(mass)
         self._radius = radius
         self._color = color
-        I = 5/(2*self._mass*self._radius*self._radius)
-        self._invInertia = [[I, 0.0, 0.0],
-                            [0.0, I, 0.0],
-                            [0.0, 0.0, I]]
+        self.set_local_bounds([-radius]*3, [radius]*3, [0.0, 0.0, 0.0], radius)
+        I = 5*self.get_inv_mass()/(2*self._radius*self._radius)
+        self.set_invInertia([[I, 0.0, 0.0],
+                             [0.0, I, 0.0],
+                             [0.0, 0.0, I]])
         #self._orientation = quaternions.axis_angle_to_quat(Vector([1.0, 0.0, 0.0]), 0.0)
         #self._orientation = quaternions.Quaternion([1.0, 0.0, 0.0, 0.0]) #This is equivalent, maybe better?
 
@@ -120,7 +250,7 @@ class Sphere(Shape):
     def get_normal(self, point):
         ''' Returns the normal of the sphere in the given point '''
         assert isinstance(point, vectors.Vector), 'Input must be a vector'
-        return (point - self._pos).normalize()
+        return (point - self.get_pos()).normalize()
 
     def get_radius(self):
         return self._radius
@@ -133,8 +263,8 @@ class Sphere(Shape):
 class Cube(Shape):
 
     def __init__(self, pos = vectors.Vector(), side = 1,
-                 mass = 1, color = [0.8, 0.8, 0.8]):
-        super(Cube, self).__init__()
+                 mass = 1, color = [0.8, 0.8, 0.8], store = None):
+        super(Cube, self).__init__(store)
         assert isinstance(pos, vectors.Vector), 'Pos must be a vector'
         assert isinstance(mass, numbers.Number), 'Mass must be a number'
         assert mass >= 0, 'Mass must be at least 0'
@@ -150,10 +280,12 @@ class Cube(Shape):
                 assert 0 <= item <= 1, \
                        'Every component of color must be a number between 0 and 1'
 
-        self._pos = pos
+        self.set_pos(pos)
         self._side = side
-        self._mass = mass
+        self.set_mass(mass)
         self._color = color
+        h = side/2.0
+        self.set_local_bounds([-h]*3, [h]*3, [0.0, 0.0, 0.0], h*3**0.5)
 
     def support_func(self, direction):
         #return supports.cube(self, direction)
@@ -174,7 +306,7 @@ class Cube(Shape):
             lies inside of the cube. '''
         assert isinstance(point, vectors.Vector), 'Input must be a vector'
 
-        dist = point - self._pos
+        dist = point - self.get_pos()
         halfside = self._side/2.0
 
         xdot = dist.dot(vectors.Vector([1.0, 0.0, 0.0]))
@@ -215,8 +347,8 @@ class Surface(Shape):
     def __init__(self, pos = vectors.Vector(),
                  points = [vectors.Vector([-5.0, 0.0, -5.0]), vectors.Vector([5.0, 0.0, -5.0]),
                            vectors.Vector([5.0, 0.0, 5.0]), vectors.Vector([-5.0, 0.0, 5.0])],
-                 color = [1.0, 0.0, 1.0]):
-        super(Surface, self).__init__()
+                 color = [1.0, 0.0, 1.0], store = None):
+        super(Surface, self).__init__(store)
         assert isinstance(pos, vectors.Vector), 'Pos must be a vector'
         assert isinstance(color, list), 'Color must be a list'
         # NOTE: If we use alpha values this should be 4
@@ -234,10 +366,11 @@ class Surface(Shape):
                 assert isinstance(point, vectors.Vector), \
                        'Every component of points must be a vector'
 
-        self._pos = pos
+        self.set_pos(pos)
         self._points = points
         self._color = color
         self._normal = (points[0] - points[1]).cross(points[3] - points[1]).normalize()
+        self.set_local_bounds(*point_bounds(points))
 
     def support_func(self, direction):
         return supports.polyhedron(self, direction)
@@ -250,3 +383,76 @@ class Surface(Shape):
 
     def draw(self):
         draw.plane(self)
+
+
+class Polyhedron(Shape):
+
+    def __init__(self, points, pos = vectors.Vector(), mass = 1,
+                 color = [0.6, 0.6, 0.9], store = None):
+        super(Polyhedron, self).__init__(store)
+        assert isinstance(pos, vectors.Vector), 'Pos must be a vector'
+        assert isinstance(mass, numbers.Number), 'Mass must be a number'
+        assert mass >= 0, 'Mass must be at least 0'
+        assert isinstance(color, list), 'Color must be a list'
+        # NOTE: If we use alpha values this should be 4
+        assert len(color) == 3, 'Color must be of length 3'
+        if __debug__:
+            for item in color:
+                assert isinstance(item, numbers.Number), \
+                       'Every component of color must be a number'
+                assert 0 <= item <= 1, \
+                       'Every component of color must be a number between 0 and 1'
+        assert isinstance(points, list), 'Points must be a list'
+        assert len(points) >= 4, 'Points must be at least of length 4'
+        if __debug__:
+            for point in points:
+                assert isinstance(point, vectors.Vector), \
+                       'Every component of points must be a vector'
+
+        self.set_pos(pos)
+        self.set_mass(mass)
+        # The points are relative to pos, in the frame of the shape;
+        # the hull is built once, as it does not change with the pose
+        self._points = points
+        self._hull = hulls.Hull([point.value for point in points])
+        self._color = color
+        self.set_local_bounds(*point_bounds(points))
+
+        # The planes of the faces of the hull in the frame of the shape,
+        # as their outward unit normals and distances from pos
+        self._planes = []
+        for i, j, k in self._hull.get_faces():
+            a = points[i]
+            normal = (points[j] - a).cross(points[k] - a).normalize()
+            self._planes.append((normal, normal.dot(a)))
+
+    def support_func(self, direction):
+        return supports.hull(self, direction)
+
+    def get_points(self):
+        return self._points
+
+    def get_hull(self):
+        return self._hull
+
+    def get_normal(self, point):
+        ''' Returns the outward normal of the face of the polyhedron that
+            is closest to the given point. Assumes the point lies inside
+            of the polyhedron. '''
+        assert isinstance(point, vectors.Vector), 'Input must be a vector'
+
+        # The point in the frame of the shape, where the faces are
+        m = self.get_orientation().convert_to_matrix()
+        x, y, z = (point - self.get_pos()).value
+        local = vectors.Vector([m[0]*x + m[1]*y + m[2]*z,
+                                m[4]*x + m[5]*y + m[6]*z,
+                                m[8]*x + m[9]*y + m[10]*z])
+
+        normal = min(self._planes, key = lambda plane: plane[1] - plane[0].dot(local))[0]
+        nx, ny, nz = normal.value
+        return vectors.Vector([m[0]*nx + m[4]*ny + m[8]*nz,
+                               m[1]*nx + m[5]*ny + m[9]*nz,
+                               m[2]*nx + m[6]*ny + m[10]*nz])
+
+    def draw(self):
+        draw.polyhedron(self)
@@ -27,13 +27,30 @@ def support(shape1, shape2, direction):
 def polyhedron(shape, direction):
     ''' Support function for convex polyhedra '''
     # TODO: Edit to take orientation into account?
-    pointList = []
-    shapePoints = shape.get_points()
-    for point in shapePoints:
-        pointList.append(point.dot(direction))
-    outPoint = shapePoints[pointList.index(max(pointList))]
-    outPoint += shape.get_pos()
-    return outPoint
+    best = None
+    for point in shape.get_points():
+        distance = point.dot(direction)
+        if best is None or distance > best:
+            best = distance
+            outPoint = point
+    return outPoint + shape.get_pos()
+
+def hull(shape, direction):
+    ''' Support function for convex polyhedra with a precomputed hull
+        (see hulls.py), in any orientation. The direction is turned into
+        the frame of the shape, where the hull is searched. '''
+    # The columns of the rotation matrix, the axes of the shape
+    m = shape.get_orientation().convert_to_matrix()
+    x, y, z = direction.value
+    local = (m[0]*x + m[1]*y + m[2]*z,
+             m[4]*x + m[5]*y + m[6]*z,
+             m[8]*x + m[9]*y + m[10]*z)
+    px, py, pz = shape.get_points()[shape.get_hull().support(local)].value
+    out = shape.get_pos()
+    out += vectors.Vector([m[0]*px + m[4]*py + m[8]*pz,
+                           m[1]*px + m[5]*py + m[9]*pz,
+                           m[2]*px + m[6]*py + m[10]*pz])
+    return out
 
 def sphere(sphere, direction):
     ''' Support function for spheres '''
@@ -42,7 +59,7 @@ def sphere(sphere, direction):
 def cube(cube, direction):
     ''' Support function for axis-aligned cubes '''
     side = cube.get_side()
-    out = cube.get_pos()
+    out = cube.get_pos().copy()
 
     if direction.dot(vectors.Vector([1.0, 0.0, 0.0])) < 0:
         out += vectors.Vector([side*0.5, 0.0, 0.0])
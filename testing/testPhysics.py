@@ -11,6 +11,7 @@ import render
 import physics
 import games
 import vectors
+import timesteps
 
 
 pygame.init()
@@ -32,7 +33,7 @@ PLANE_POINTS = [[-10.0, 0.0, -10.0], [10.0, 0.0, -10.0],
                 [10.0, 0.0, 10.0], [-10.0, 0.0, 10.0]]
 
 
-speed = 0.1
+speed = 10.0   # units per second
 xPos = 0.0
 yPos = 5.0
 zPos = 0.0
@@ -71,6 +72,13 @@ game = games.Game(player, objectList, sceneList)
 run = True
 lastDirection = vectors.Vector()
 
+# Physics runs in fixed steps of dt, rendering as fast as it can;
+# each step is split into substeps when the scene moves fast
+clock = pygame.time.Clock()
+substepper = physics.Substepper()
+stepper = timesteps.FixedTimestep(lambda dt: substepper.step(game, dt),
+                                  physics.dt, store = player.get_store())
+
 
 while run:
 
@@ -99,8 +107,8 @@ while run:
         lastDirection = direction
 
 
-    physics.update_physics(game)
-    render.render(game)
+    stepper.update(clock.tick() / 1000.0)
+    render.render(game, stepper)
     #print 'Pos:', player.get_pos().value
 
 pygame.quit()
@@ -0,0 +1,119 @@
+# Fixed timestep loop driver with render interpolation
+
+import numpy
+
+class FixedTimestep:
+    ''' Runs a simulation step function in fixed slices of dt, no
+        matter how long the rendered frames take. The time that is left
+        over after the last whole step is kept in an accumulator for the
+        next frame.
+
+        If a RigidBodyStore is given, the state before the last step is
+        saved, and the pose of a body can be read interpolated between
+        the last two states, at the fraction get_alpha() of a step.
+        That keeps the motion smooth when the render rate and the
+        simulation rate differ.
+    '''
+
+    def __init__(self, step, dt, maxSteps = 5, store = None):
+        ''' Input:
+                *   step is a function step(dt) that advances the
+                    simulation by dt.
+                *   maxSteps is the largest number of steps taken in one
+                    frame; if the simulation falls further behind, the
+                    remaining time is dropped instead of caught up with.
+                *   store is the RigidBodyStore to interpolate, if any.
+        '''
+        assert dt > 0, 'The timestep must be positive'
+        assert maxSteps >= 1, 'At least one step per frame must be allowed'
+        self._step = step
+        self._dt = dt
+        self._maxSteps = maxSteps
+        self._store = store
+        self._accumulator = 0.0
+
+        self._previous = None
+        self._pose = None
+
+    def get_dt(self):
+        return self._dt
+
+    def get_alpha(self):
+        ''' Returns how far, as a fraction of a step, the rendered frame
+            is past the last simulated state. '''
+        return self._accumulator / self._dt
+
+    def update(self, frameTime):
+        ''' Adds the time frameTime (in seconds) to the accumulator and
+            runs as many whole steps as fit in it, at most maxSteps.
+            Returns the number of steps taken. '''
+        self._accumulator += frameTime
+        steps = int(self._accumulator / self._dt)
+        if steps > self._maxSteps:
+            # Too far behind to catch up, drop the extra time
+            self._accumulator -= (steps - self._maxSteps) * self._dt
+            steps = self._maxSteps
+
+        for i in range(steps):
+            if i == steps - 1 and self._store is not None:
+                self._save_state()
+            self._step(self._dt)
+            self._accumulator -= self._dt
+
+        self._pose = None
+        return steps
+
+    def _save_state(self):
+        count = self._store.get_count()
+        self._previous = (self._store.positions[:count].copy(),
+                          self._store.orientations[:count].copy())
+
+    def _interpolate(self):
+        ''' Computes the interpolated positions and orientations of all
+            bodies in the store at once. '''
+        count = self._store.get_count()
+        positions = self._store.positions[:count].copy()
+        orientations = self._store.orientations[:count].copy()
+        if self._previous is not None:
+            alpha = min(self.get_alpha(), 1.0)
+            oldPositions, oldOrientations = self._previous
+            k = len(oldPositions)
+            positions[:k] = lerp(oldPositions, positions[:k], alpha)
+            orientations[:k] = slerp(oldOrientations, orientations[:k], alpha)
+        self._pose = (positions, orientations)
+
+    def get_pos(self, shape):
+        ''' Returns the interpolated position of the shape as a list. '''
+        if self._pose is None:
+            self._interpolate()
+        return self._pose[0][shape.get_index()].tolist()
+
+    def get_orientation(self, shape):
+        ''' Returns the interpolated orientation of the shape as a list
+            [w, x, y, z]. '''
+        if self._pose is None:
+            self._interpolate()
+        return self._pose[1][shape.get_index()].tolist()
+
+def lerp(a, b, alpha):
+    ''' Linear interpolation between the arrays a and b. '''
+    return a + (b - a) * alpha
+
+def slerp(q0, q1, alpha):
+    ''' Spherical linear interpolation between the unit quaternions in
+        the rows of the (k, 4) arrays q0 and q1. '''
+    d = numpy.einsum('ij,ij->i', q0, q1)
+    # q and -q are the same rotation, take the shorter way
+    q1 = numpy.where((d < 0.0)[:, numpy.newaxis], -q1, q1)
+    d = numpy.abs(d)
+
+    # Nearly equal quaternions are interpolated linearly, to avoid
+    # dividing by sin(theta) close to zero
+    close = d > 0.9995
+    theta = numpy.arccos(numpy.clip(d, -1.0, 1.0))
+    sinTheta = numpy.where(close, 1.0, numpy.sin(theta))
+    w0 = numpy.where(close, 1.0 - alpha, numpy.sin((1.0 - alpha) * theta) / sinTheta)
+    w1 = numpy.where(close, alpha, numpy.sin(alpha * theta) / sinTheta)
+
+    out = q0 * w0[:, numpy.newaxis] + q1 * w1[:, numpy.newaxis]
+    return out / numpy.sqrt(numpy.einsum('ij,ij->i', out, out))[:, numpy.newaxis]
@@ -107,6 +107,51 @@ class Vector:
 
         return self + (-v2)
 
+    def __iadd__(self, v2):
+        ''' Adds the given vector to the vector in place, overloads "+=".
+            The value list is replaced rather than mutated, since it may
+            be shared with the list the vector was created from.'''
+        assert isinstance(v2, Vector), 'Input must be a vector.'
+        assert self.dim() == v2.dim(), \
+                'Vectors must be of the same dimension'
+
+        self.value = [comp1 + comp2 for comp1, comp2 in zip(self.value, v2.value)]
+        return self
+
+    def __isub__(self, v2):
+        ''' Subtracts the given vector from the vector in place, overloads "-=" '''
+        assert isinstance(v2, Vector), 'Input must be a vector.'
+        assert self.dim() == v2.dim(), \
+                'Vectors must be of the same dimension'
+
+        self.value = [comp1 - comp2 for comp1, comp2 in zip(self.value, v2.value)]
+        return self
+
+    def __imul__(self, scalar):
+        ''' Multiplies the vector with the given scalar in place, overloads "*=" '''
+        assert isinstance(scalar, numbers.Number), \
+            'Input must be a real number.'
+
+        self.value = [component * scalar for component in self.value]
+        return self
+
+    def add_scaled(self, v2, scalar):
+        ''' Adds v2 multiplied with the given scalar to the vector in place,
+            without building the scaled vector. Returns the vector itself.'''
+        assert isinstance(v2, Vector), 'Input must be a vector.'
+        assert self.dim() == v2.dim(), \
+                'Vectors must be of the same dimension'
+        assert isinstance(scalar, numbers.Number), \
+            'Input must be a real number.'
+
+        self.value = [comp1 + comp2 * scalar
+                      for comp1, comp2 in zip(self.value, v2.value)]
+        return self
+
+    def copy(self):
+        ''' Returns a new vector with the same value.'''
+        return Vector(self.value[:])
+
     def projected(self, *base):
         ''' Returns the projection of the vector on the vector space 
         defined by the supplied vectors. Assumes orthogonal and linearly
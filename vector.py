@@ -1,8 +1,11 @@
 from math import *
 import numbers
+import numpy
 
-class Vector:
+class Vector(object):
     ''' A vector class to simplify calculations on vectors '''
+
+    __slots__ = ('value',)
     
     def __init__(self, value = [0.0, 0.0, 0.0]):
         assert isinstance(value, list), \
@@ -107,6 +110,51 @@ class Vector:
 
         return self + (-v2)
 
+    def __iadd__(self, v2):
+        ''' Adds the given vector to the vector in place, overloads "+=".
+            The value list is replaced rather than mutated, since it may
+            be shared with the list the vector was created from.'''
+        assert isinstance(v2, Vector), 'Input must be a vector.'
+        assert self.dim() == v2.dim(), \
+                'Vectors must be of the same dimension'
+
+        self.value = [comp1 + comp2 for comp1, comp2 in zip(self.value, v2.value)]
+        return self
+
+    def __isub__(self, v2):
+        ''' Subtracts the given vector from the vector in place, overloads "-=" '''
+        assert isinstance(v2, Vector), 'Input must be a vector.'
+        assert self.dim() == v2.dim(), \
+                'Vectors must be of the same dimension'
+
+        self.value = [comp1 - comp2 for comp1, comp2 in zip(self.value, v2.value)]
+        return self
+
+    def __imul__(self, scalar):
+        ''' Multiplies the vector with the given scalar in place, overloads "*=" '''
+        assert isinstance(scalar, numbers.Number), \
+            'Input must be a real number.'
+
+        self.value = [component * scalar for component in self.value]
+        return self
+
+    def add_scaled(self, v2, scalar):
+        ''' Adds v2 multiplied with the given scalar to the vector in place,
+            without building the scaled vector. Returns the vector itself.'''
+        assert isinstance(v2, Vector), 'Input must be a vector.'
+        assert self.dim() == v2.dim(), \
+                'Vectors must be of the same dimension'
+        assert isinstance(scalar, numbers.Number), \
+            'Input must be a real number.'
+
+        self.value = [comp1 + comp2 * scalar
+                      for comp1, comp2 in zip(self.value, v2.value)]
+        return self
+
+    def copy(self):
+        ''' Returns a new vector with the same value.'''
+        return Vector(self.value[:])
+
     def projected(self, *base):
         ''' Returns the projection of the vector on the vector space 
         defined by the supplied vectors. Assumes orthogonal and linearly
@@ -145,3 +193,357 @@ class Vector:
     def __str__(self):
         ''' Returns the string representation of the vector.'''
         return self.value.__str__()
+
+
+class Vec3(Vector):
+    ''' A fixed-size 3D vector. Has the same interface as Vector, but
+        keeps its components in the slots x, y and z and unrolls all
+        arithmetic, so no temporary lists are built. Skips the type
+        asserts of Vector; operands that are not Vec3 objects are
+        converted with as_vec3. '''
+
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x = 0.0, y = 0.0, z = 0.0):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    def _get_value(self):
+        return [self.x, self.y, self.z]
+
+    def _set_value(self, value):
+        self.x, self.y, self.z = value
+
+    value = property(_get_value, _set_value)
+
+    def dim(self):
+        return 3
+
+    def is_zero(self):
+        return self.x == 0 and self.y == 0 and self.z == 0
+
+    def is_not_zero(self):
+        return self.x != 0 or self.y != 0 or self.z != 0
+
+    def dot(self, v):
+        ''' Calculates the dot product of the vector and v '''
+        if v.__class__ is not Vec3:
+            v = as_vec3(v)
+        return self.x * v.x + self.y * v.y + self.z * v.z
+
+    def cross(self, v):
+        ''' Calculates the cross product (self x v) '''
+        if v.__class__ is not Vec3:
+            v = as_vec3(v)
+        return Vec3(self.y * v.z - self.z * v.y,
+                    self.z * v.x - self.x * v.z,
+                    self.x * v.y - self.y * v.x)
+
+    def norm(self):
+        ''' Calculates the norm of the vector '''
+        return sqrt(self.x * self.x + self.y * self.y + self.z * self.z)
+
+    def normalize(self):
+        ''' Returns a normalized version of the vector.
+        Returns None if the vector is the zero vector.'''
+        n = self.norm()
+        if n == 0:
+            return None
+        return Vec3(self.x / n, self.y / n, self.z / n)
+
+    def __eq__(self, v):
+        ''' Checks if two vectors have the same value, overloads "==" '''
+        if v.__class__ is not Vec3:
+            return self.value == v.value
+        return self.x == v.x and self.y == v.y and self.z == v.z
+
+    def __ne__(self, v):
+        ''' Checks if two vectors do not have the same value, overloads "!=" '''
+        return not self == v
+
+    def __mul__(self, scalar):
+        ''' Returns the vector multiplied with the given scalar '''
+        return Vec3(self.x * scalar, self.y * scalar, self.z * scalar)
+
+    def __neg__(self):
+        '''Returns the vector in negative direction.'''
+        return Vec3(-self.x, -self.y, -self.z)
+
+    def __add__(self, v):
+        ''' Returns the vector added with the given other vector.'''
+        if v.__class__ is not Vec3:
+            v = as_vec3(v)
+        return Vec3(self.x + v.x, self.y + v.y, self.z + v.z)
+
+    def __sub__(self, v):
+        ''' Returns the given vector subtracted from the vector.'''
+        if v.__class__ is not Vec3:
+            v = as_vec3(v)
+        return Vec3(self.x - v.x, self.y - v.y, self.z - v.z)
+
+    def __iadd__(self, v):
+        ''' Adds the given vector to the vector in place, overloads "+=" '''
+        if v.__class__ is not Vec3:
+            v = as_vec3(v)
+        self.x += v.x
+        self.y += v.y
+        self.z += v.z
+        return self
+
+    def __isub__(self, v):
+        ''' Subtracts the given vector from the vector in place, overloads "-=" '''
+        if v.__class__ is not Vec3:
+            v = as_vec3(v)
+        self.x -= v.x
+        self.y -= v.y
+        self.z -= v.z
+        return self
+
+    def __imul__(self, scalar):
+        ''' Multiplies the vector with the given scalar in place, overloads "*=" '''
+        self.x *= scalar
+        self.y *= scalar
+        self.z *= scalar
+        return self
+
+    def add_scaled(self, v, scalar):
+        ''' Adds v multiplied with the given scalar to the vector in place,
+            without building the scaled vector. Returns the vector itself.'''
+        if v.__class__ is not Vec3:
+            v = as_vec3(v)
+        self.x += v.x * scalar
+        self.y += v.y * scalar
+        self.z += v.z * scalar
+        return self
+
+    def copy(self):
+        ''' Returns a new vector with the same value.'''
+        return Vec3(self.x, self.y, self.z)
+
+    def projected(self, *base):
+        ''' Returns the projection of the vector on the vector space
+        defined by the supplied vectors. Assumes orthogonal and linearly
+        independant base vectors.'''
+        x = y = z = 0.0
+        for v in base:
+            if v.__class__ is not Vec3:
+                v = as_vec3(v)
+            s = float(self.dot(v)) / float(v.dot(v))
+            x += v.x * s
+            y += v.y * s
+            z += v.z * s
+        return Vec3(x, y, z)
+
+    def triple_product_1(self, v2, v3):
+        ''' Calculates the triple product self x (v2 x v3)
+            as v2*(self.v3) - v3*(self.v2).'''
+        if v2.__class__ is not Vec3:
+            v2 = as_vec3(v2)
+        if v3.__class__ is not Vec3:
+            v3 = as_vec3(v3)
+        s2 = self.x * v3.x + self.y * v3.y + self.z * v3.z
+        s3 = self.x * v2.x + self.y * v2.y + self.z * v2.z
+        return Vec3(v2.x * s2 - v3.x * s3,
+                    v2.y * s2 - v3.y * s3,
+                    v2.z * s2 - v3.z * s3)
+
+    def triple_product_2(self, v2, v3):
+        ''' Calculates the triple product (self x v2) x v3
+            as v2*(self.v3) - self*(v2.v3).'''
+        if v2.__class__ is not Vec3:
+            v2 = as_vec3(v2)
+        if v3.__class__ is not Vec3:
+            v3 = as_vec3(v3)
+        s1 = v2.x * v3.x + v2.y * v3.y + v2.z * v3.z
+        s2 = self.x * v3.x + self.y * v3.y + self.z * v3.z
+        return Vec3(v2.x * s2 - self.x * s1,
+                    v2.y * s2 - self.y * s1,
+                    v2.z * s2 - self.z * s1)
+
+    def __str__(self):
+        ''' Returns the string representation of the vector.'''
+        return self.value.__str__()
+
+def as_vec3(v):
+    ''' Returns a new Vec3 with the same value as v, which can be a
+        Vector of dimension 3 or a list of three numbers. '''
+    if isinstance(v, Vector):
+        v = v.value
+    assert len(v) == 3, 'Vec3 must be of dimension 3'
+    return Vec3(v[0], v[1], v[2])
+
+
+class VectorView(Vector):
+    ''' A Vector that reads and writes one row of a VectorArray, so
+        changes to the view (including in place operations) end up
+        in the array. '''
+
+    __slots__ = ('_owner', '_index')
+
+    def __init__(self, owner, index):
+        self._owner = owner
+        self._index = index
+
+    def _get_value(self):
+        return self._owner._data[self._index].tolist()
+
+    def _set_value(self, value):
+        self._owner._data[self._index] = value
+
+    value = property(_get_value, _set_value)
+
+    def copy(self):
+        ''' Returns a Vec3 with the current value of the row.'''
+        return as_vec3(self.value)
+
+class VectorArray(object):
+    ''' An array of 3D vectors, backed by an (N, 3) NumPy array of
+        float64. Operations work on all rows at once; scalars, Vectors
+        and other VectorArrays of the same length are accepted as
+        operands and broadcast against the rows. '''
+
+    def __init__(self, vectors = []):
+        ''' Takes a list of Vectors (or lists of three numbers) or an
+            (N, 3) array. The values are always copied. '''
+        if isinstance(vectors, numpy.ndarray):
+            data = numpy.array(vectors, dtype = numpy.float64)
+        else:
+            data = numpy.array([v.value if isinstance(v, Vector) else v
+                                for v in vectors], dtype = numpy.float64)
+        self._data = data.reshape(-1, 3)
+
+    @classmethod
+    def _wrap(cls, data):
+        ''' Returns a VectorArray using data without copying it.'''
+        out = cls.__new__(cls)
+        out._data = data
+        return out
+
+    def get_array(self):
+        ''' Returns the underlying (N, 3) array.'''
+        return self._data
+
+    def __len__(self):
+        return self._data.shape[0]
+
+    def __getitem__(self, index):
+        ''' Returns a view of row index, see VectorView.'''
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('VectorArray index out of range')
+        return VectorView(self, index)
+
+    def __setitem__(self, index, v):
+        self._data[index] = _operand(v)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield VectorView(self, i)
+
+    def get(self, index):
+        ''' Returns a copy of row index as a Vec3.'''
+        x, y, z = self._data[index].tolist()
+        return Vec3(x, y, z)
+
+    def to_vectors(self):
+        ''' Returns a list of Vec3 copies of all rows.'''
+        return [Vec3(x, y, z) for x, y, z in self._data.tolist()]
+
+    def copy(self):
+        return VectorArray._wrap(self._data.copy())
+
+    def __add__(self, v):
+        return VectorArray._wrap(self._data + _operand(v))
+
+    def __sub__(self, v):
+        return VectorArray._wrap(self._data - _operand(v))
+
+    def __mul__(self, scalar):
+        ''' Multiplies every row with scalar, which can also be an array
+            with one scalar per row. '''
+        return VectorArray._wrap(self._data * _scalars(scalar))
+
+    def __neg__(self):
+        return VectorArray._wrap(-self._data)
+
+    def __iadd__(self, v):
+        self._data += _operand(v)
+        return self
+
+    def __isub__(self, v):
+        self._data -= _operand(v)
+        return self
+
+    def __imul__(self, scalar):
+        self._data *= _scalars(scalar)
+        return self
+
+    def add_scaled(self, v, scalar):
+        ''' Adds v multiplied with scalar to every row in place.
+            Returns the array itself.'''
+        self._data += _operand(v) * _scalars(scalar)
+        return self
+
+    def translate(self, movement, scale = 1.0):
+        ''' Moves every row by movement*scale, in place.'''
+        return self.add_scaled(movement, scale)
+
+    def dot(self, v):
+        ''' Returns an array with the dot product of every row and v.'''
+        if isinstance(v, VectorArray):
+            return numpy.einsum('ij,ij->i', self._data, v._data)
+        return numpy.dot(self._data, _operand(v))
+
+    def cross(self, v):
+        ''' Returns the cross products (row x v) as a new VectorArray.'''
+        return VectorArray._wrap(numpy.cross(self._data, _operand(v)))
+
+    def norm(self):
+        ''' Returns an array with the norm of every row.'''
+        return numpy.sqrt(numpy.einsum('ij,ij->i', self._data, self._data))
+
+    def normalize(self):
+        ''' Returns the normalized rows as a new VectorArray. Rows that are
+            the zero vector are left as zero.'''
+        n = self.norm()
+        n[n == 0.0] = 1.0
+        return VectorArray._wrap(self._data / n[:, numpy.newaxis])
+
+    def projected(self, *base):
+        ''' Returns the projection of every row on the vector space
+        defined by the supplied vectors. Assumes orthogonal and linearly
+        independant base vectors.'''
+        proj = numpy.zeros_like(self._data)
+        for v in base:
+            b = _operand(v)
+            if b.ndim == 1:
+                proj += numpy.outer(numpy.dot(self._data, b) / numpy.dot(b, b), b)
+            else:
+                s = numpy.einsum('ij,ij->i', self._data, b) / \
+                    numpy.einsum('ij,ij->i', b, b)
+                proj += b * s[:, numpy.newaxis]
+        return VectorArray._wrap(proj)
+
+    def support(self, direction):
+        ''' Returns a Vec3 copy of the row that is furthest in the given
+            direction (the first one if several are equally far).'''
+        return self.get(int(numpy.dot(self._data, _operand(direction)).argmax()))
+
+    def __str__(self):
+        return self._data.tolist().__str__()
+
+def _operand(v):
+    ''' Returns v as something that broadcasts against (N, 3) rows.'''
+    if isinstance(v, VectorArray):
+        return v._data
+    if isinstance(v, Vector):
+        return numpy.array(v.value, dtype = numpy.float64)
+    return numpy.asarray(v, dtype = numpy.float64)
+
+def _scalars(scalar):
+    ''' Returns scalar as something that broadcasts against (N, 3) rows.'''
+    if isinstance(scalar, numbers.Number):
+        return scalar
+    return numpy.asarray(scalar, dtype = numpy.float64).reshape(-1, 1)